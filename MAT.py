@@ -5,25 +5,251 @@ The user can set it to show randomized calculations with the settings chosen.
 Information about how its settings work can be found under help_message().
 
 The program is kept in a single file to keep it as an easy drag-and-drop.
+Run it without arguments for the GUI, or with --cli for a terminal drill.
+Importing it doesn't start anything, so the functions can be reused.
 """
 
 
-from pathlib import Path
-import tkinter as tk
-from tkinter import ttk
-from tkinter.messagebox import showerror, showinfo
-from random import randint
+import getpass
+import hashlib
+import importlib
+import importlib.util
+import os
+import queue
+import stat
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from random import Random
+from collections import deque
+from functools import lru_cache, wraps
+from itertools import chain, islice, product, repeat
+from math import ceil, log, sqrt
+import time
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first use. The real module
+    then replaces the stand-in in this module's globals.
+    """
+    def __init__(self, global_name, module_name):
+        self.__global_name = global_name
+        self.__module_name = module_name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__module_name)
+        globals()[self.__global_name] = module
+        return getattr(module, attr)
+
+
+# Heavy imports are deferred so that importing this file and starting the
+# terminal mode stay fast. tkinter is only loaded by the GUI.
+# NumPy is optional, batch generation falls back to the random module.
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
+np = LazyModule('np', 'numpy')
+tk = LazyModule('tk', 'tkinter')
+ttk = LazyModule('ttk', 'tkinter.ttk')
+tkfont = LazyModule('tkfont', 'tkinter.font')
+tempfile = LazyModule('tempfile', 'tempfile')  # Only needed for saving.
 
 
 # Parameters for the program. Can be changed.
 MAX_NUMBERS = 5
-OPERATORS = ['+', '-', '·']  # List of possible operator marks.
+OPERATORS = ['+', '-', '·', '÷']  # List of possible operator marks.
 RANGE_LIMIT = 1000  # Range of numbers in either direction of 0.
 MAX_TIME_LIMIT = 900
-CFG_FILE = str(Path(__file__).parent.absolute()) + '/MAT.cfg'
+# Files are kept next to this file. (os.path, pathlib is slow to import.)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CFG_FILE = APP_DIR + '/MAT.cfg'
+# Settings in CFG_FILE written before profiles existed belong to this profile.
+# It is also the starting point for new profiles.
+LEGACY_PROFILE = 'default'
+LOG_FILE = APP_DIR + '/MAT.log'  # Attempts.
 # Tk event key symbols: http://www.tcl.tk/man/tcl8.4/TkCmd/keysyms.htm
 SUBMIT_KEY = '<Return>'  # Key for submitting the player's answer.
 CLEAR_KEY = '<Next>'  # Key for quickly clearing the field.
+# Problems are generated ahead of time in batches of PREFETCH_SIZE. A new
+# batch is made when fewer than PREFETCH_LOW problems are left.
+PREFETCH_SIZE = 512
+PREFETCH_LOW = 64
+# Adaptive mode. Every fact (pair of numbers) has a mastery score 0 - 1 that
+# moves ADAPTIVE_RATE of the way towards the result of each answer. Facts
+# are drawn in proportion to 1 - mastery + ADAPTIVE_FLOOR, so mastered facts
+# still come up now and then. Only a few problems are prefetched so new
+# answers affect the next draws.
+ADAPTIVE_RATE = 0.3
+ADAPTIVE_FLOOR = 0.05
+ADAPTIVE_PREFETCH = 2
+
+# Problem constraints, all off (0) by default. max_result is the largest
+# allowed result, 0 for no limit. Constraints apply to every intermediate
+# result, worked left to right.
+CONSTRAINTS = ('nonnegative', 'max_result', 'no_carry', 'distinct')
+# Long constrained chains are drawn in blocks of this many problems. Their
+# step table (result of every intermediate result and operand) is kept if it
+# has at most CONSTRAINT_TABLE_LIMIT entries, otherwise steps are recomputed.
+CONSTRAINT_BLOCK = 1024
+CONSTRAINT_TABLE_LIMIT = 2 ** 24
+
+# Mixed mode picks every operator of a problem from MIXED_OPERATORS, with
+# the usual precedence (· before + and -). Division is left out because it
+# wouldn't come out even. Evaluators are compiled once per operator layout
+# ("shape") and at most MIXED_CACHE_SIZE of them are kept.
+MIXED_OPERATORS = ('+', '-', '·')
+MIXED_CACHE_SIZE = 256
+
+# No-repeat mode. Shown problems are kept in a bitset if the problem space
+# has at most NO_REPEAT_BITSET_LIMIT problems, otherwise in a Bloom filter
+# of NO_REPEAT_BLOOM_BITS bits with NO_REPEAT_HASHES hashes. After
+# NO_REPEAT_ATTEMPTS seen problems in a row the space is taken as used up
+# and a new round starts.
+NO_REPEAT_BITSET_LIMIT = 2 ** 26
+NO_REPEAT_BLOOM_BITS = 2 ** 23
+NO_REPEAT_HASHES = 4
+NO_REPEAT_ATTEMPTS = 64
+
+# Difficulty bands. Every 2-number problem within RANGE_LIMIT has a
+# precomputed difficulty score, DIFFICULTY_NONE if there is no such problem
+# (uneven division). Band 1 has the scores below DIFFICULTY_THRESHOLDS[0],
+# band n those from DIFFICULTY_THRESHOLDS[n - 2] up to the next threshold.
+# The scores are computed once into DIFFICULTY_FILE and memory-mapped.
+DIFFICULTY_FILE = APP_DIR + '/MAT-difficulty.bin'
+DIFFICULTY_MAGIC = b'MATDIFF\0'
+DIFFICULTY_VERSION = 1
+# Magic, version, RANGE_LIMIT and the operators as LOG_OPERATOR_CODES.
+DIFFICULTY_HEADER = struct.Struct('<8sHH4s')
+DIFFICULTY_BANDS = 5
+DIFFICULTY_THRESHOLDS = (3, 5, 7, 10)
+DIFFICULTY_NONE = 255
+DIFFICULTY_BLOCK = 256  # Rows of the table computed at a time.
+# Ranges of up to this many numbers are scored directly, without the table.
+DIFFICULTY_DIRECT = 256
+
+# Relative accuracy of the response time percentiles.
+SKETCH_ACCURACY = 0.01
+# Countdown tick interval in milliseconds. Below 1000 the timer shows tenths.
+TIMER_RESOLUTION = 100
+
+# Benchmarks. Results go to BENCH_FILE as JSON, and comparing against a
+# baseline reports anything more than BENCH_TOLERANCE slower. Every result
+# is a cost, lower is better. Each timing is the best of BENCH_REPEAT runs.
+# The countdown benchmark makes every timer callback up to BENCH_TIMER_JITTER
+# seconds late, like a busy main loop. The GUI benchmark times
+# BENCH_GUI_TURNS answers.
+BENCH_FILE = APP_DIR + '/MAT-bench.json'
+BENCH_VERSION = 1
+BENCH_TOLERANCE = 0.2
+BENCH_REPEAT = 5
+BENCH_TIMER_JITTER = 0.005
+BENCH_GUI_TURNS = 2000
+
+# Opt-in hot-path timers, switched on with --instrument or by setting
+# INSTRUMENT_ENV to anything but 0. Only then are the INSTRUMENTED functions
+# ('Class.method') wrapped, so they cost nothing otherwise.
+INSTRUMENT_ENV = 'MAT_INSTRUMENT'
+INSTRUMENTED = (
+    'ArithmeticProgram.answer_process',
+    'ArithmeticProgram.set_new_calculation',
+    'ArithmeticProgram.left_eq_config',
+    'ArithmeticProgram.countdown',
+    'ConfigStore.load',
+    'ConfigStore.save'
+)
+
+# Drill server. JSON lines over TCP, one session per connection. Sessions
+# with the same settings share a ProblemQueue, the SERVER_QUEUES latest ones
+# are kept. The load test client runs LOAD_SESSIONS sessions of LOAD_TURNS
+# answers by default, and opens at most LOAD_CONNECTS connections at once.
+# Generators and indexes are built off the event loop, one at a time.
+# Adaptive games have a generator of their own (tens of MB for the full
+# range), at most SERVER_ADAPTIVE_SESSIONS of them run at once.
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_BACKLOG = 1024
+SERVER_QUEUES = 64
+SERVER_ADAPTIVE_SESSIONS = 4
+LOAD_SESSIONS = 1000
+LOAD_TURNS = 100
+LOAD_CONNECTS = 256
+
+# Worksheet export. Problems are drawn in chunks of EXPORT_CHUNK, chunk i
+# from its own random stream spawned from the seed and i, so a worksheet
+# only depends on the seed, not on how many workers made it. At most
+# EXPORT_WINDOW chunks per worker are in flight. PDF pages have PDF_LINES
+# problems.
+EXPORT_CHUNK = 4096
+EXPORT_WINDOW = 2
+EXPORT_FORMATS = ('csv', 'txt', 'pdf')
+PDF_LINES = 45
+
+# Batch grading of answer sheets. Rows are read, answered and written
+# GRADE_CHUNK at a time, so memory doesn't depend on the file size. Every
+# row gets one of GRADE_VERDICTS: invalid is an answer that isn't an
+# integer, error a problem the trainer couldn't have asked.
+GRADE_CHUNK = 4096
+GRADE_FORMATS = ('csv', 'jsonl')
+GRADE_COLUMNS = ('operands', 'operator', 'answer')
+GRADE_VERDICTS = ('correct', 'wrong', 'skipped', 'invalid', 'error')
+# ASCII spellings of the operators accepted on answer sheets.
+GRADE_ALIASES = {'*': '·', '/': '÷'}
+
+# Background disk writer. Records are written in batches of up to
+# WRITER_BATCH_SIZE, at the latest WRITER_FLUSH_INTERVAL seconds after they
+# were submitted. Submitting blocks if WRITER_QUEUE_SIZE jobs are waiting.
+WRITER_QUEUE_SIZE = 10000
+WRITER_BATCH_SIZE = 256
+WRITER_FLUSH_INTERVAL = 1.0
+
+# Binary attempt log. Header: magic, format version, record size and the
+# amount of operand slots per record (MAX_NUMBERS when it was created).
+LOG_MAGIC = b'MATLOG\0\0'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<8sHHHH')
+# Operators are stored as one ASCII byte so editing OPERATORS doesn't break
+# old logs.
+LOG_OPERATOR_CODES = {'+': b'+', '-': b'-', '·': b'*', '÷': b'/'}
+# Mixed problems have this operator code, and their operators are kept in
+# the record's last LOG_OPERATOR_SLOTS bytes (zeros in older records).
+LOG_MIXED = b'm'
+LOG_OPERATOR_SLOTS = 5
+# Record flags.
+LOG_CORRECT = 1
+LOG_SKIPPED = 2
+LOG_OVERFLOW = 4  # Expected answer didn't fit into int64, stored as 0.
+
+# SQLite attempt history, used instead of the binary log when the log file
+# name ends in HISTORY_SUFFIX. Schema version is kept in user_version.
+# Analytics queries by default look HISTORY_DAYS back and only list facts
+# answered at least HISTORY_MIN_COUNT times.
+HISTORY_SUFFIX = '.db'
+HISTORY_VERSION = 1
+HISTORY_DAYS = 30
+HISTORY_MIN_COUNT = 3
+
+# Cohort aggregation over a directory of attempt logs and histories. What
+# was read from every file is kept in AGGREGATE_CACHE in that directory,
+# so the next run only reads what was added. Hardest facts need at least
+# AGGREGATE_MIN_ATTEMPTS attempts, AGGREGATE_HARDEST of them are listed.
+AGGREGATE_CACHE = '.MAT-aggregate.json'
+AGGREGATE_VERSION = 1
+AGGREGATE_MIN_ATTEMPTS = 3
+AGGREGATE_HARDEST = 5
+
+# Tcl procedure used by ArithmeticProgram.redraw(). Sets the equation's
+# text item, any number of variables and clears the answer entry with a
+# single interpreter call.
+REDRAW_PROC = """
+proc mat_redraw {entry canvas item text args} {
+    $canvas itemconfigure $item -text $text
+    foreach {name value} $args {
+        set ::$name $value
+    }
+    $entry delete 0 end
+}
+"""
 
 
 # Default entries for user input fields. If config file doesn't exist or is
@@ -33,24 +259,48 @@ defaults = {
     'range_lower': 0,
     'range_upper': 20,
     'operator': OPERATORS[0],
-    'time_limit': 120
+    'time_limit': 120,
+    'adaptive': 0,
+    'nonnegative': 0,
+    'max_result': 0,
+    'no_carry': 0,
+    'distinct': 0,
+    'mixed': 0,
+    'no_repeat': 0,
+    'difficulty': 0
 }
 
 
 class ArithmeticProgram:
-    def __init__(self):
+    def __init__(self, profile=None, config=None, log_path=LOG_FILE):
         """
         Creating all the UI elements, setting variables needed for later.
+        :param profile: settings profile, default_profile() if None.
+        :param config: ConfigStore for the settings, CONFIG if None.
+        :param log_path: attempt log file, None for no log.
         """
         self.__window = tk.Tk()
         self.__window.title("Mental Arithmetic Trainer")
 
         # Creating variables for later.
-        self.__settings = read_cfg().copy()  # Load saved settings.
-        self.__answers_correct = 0
-        self.__answers_all = 0
-        self.__stoptimer = False
+        self.__profile = profile or default_profile()
+        self.__config = config or CONFIG
+        # Load saved settings.
+        self.__settings = read_cfg(self.__profile, self.__config)
+        self.__game = None  # GameState of the current/last game.
+        # Adaptive mode's mastery scores, kept between games.
+        self.__adaptive_model = None
+        # All disk writes during the session go through the writer thread.
+        self.__writer = BackgroundWriter()
+        self.__log = None  # Also None if the log is broken.
+        if log_path is not None:
+            self.__log = open_session_log(log_path, self.__writer)
+        # Deadline based timer, ticks update the time left label.
+        self.__countdown = Countdown(self.__window.after,
+                                     self.__window.after_cancel,
+                                     self.countdown, self.stop_game)
         time_width = 1 + len(str(MAX_TIME_LIMIT))  # space for showing time
+        timer_width = time_width + (2 if TIMER_RESOLUTION < 1000 else 0)
         # Control variables for updating.
         self.__results_cur = tk.StringVar(value="")
         self.__results_prev = tk.StringVar(value="")
@@ -123,6 +373,78 @@ class ArithmeticProgram:
         self.__time_entry.grid(row=1, column=0)
         self.__time_wrapper.grid(row=0, column=3, sticky=tk.N)
 
+        # Settings profile dropdown (wrapper). Typing a new name creates a
+        # profile when the program is closed.
+        self.__profile_wrapper = tk.Frame(self.__tframe, padx=5)
+
+        self.__profile_label = tk.Label(self.__profile_wrapper,
+                                        text="Profile")
+        self.__profile_dropdown = ttk.Combobox(
+            self.__profile_wrapper, width=10,
+            values=self.__config.profile_names() or [self.__profile])
+        self.__profile_dropdown.insert(0, self.__profile)  # Default
+        self.__profile_dropdown.bind("<<ComboboxSelected>>",
+                                     lambda event: self.load_profile())
+
+        # Grid profile wrapper and contents
+        self.__profile_label.grid(row=0, column=0)
+        self.__profile_dropdown.grid(row=1, column=0)
+        self.__profile_wrapper.grid(row=0, column=4, sticky=tk.N)
+
+        # Options on their own row below the other settings.
+        self.__options_wrapper = tk.Frame(self.__tframe, padx=5, pady=5)
+
+        self.__adaptive = tk.IntVar(value=self.__settings['adaptive'])
+        self.__adaptive_check = tk.Checkbutton(
+            self.__options_wrapper, text="Adaptive (2 numbers)",
+            variable=self.__adaptive)
+
+        # Constraints for the generated problems.
+        self.__nonnegative = tk.IntVar(value=self.__settings['nonnegative'])
+        self.__nonnegative_check = tk.Checkbutton(
+            self.__options_wrapper, text="Result ≥ 0",
+            variable=self.__nonnegative)
+        self.__no_carry = tk.IntVar(value=self.__settings['no_carry'])
+        self.__no_carry_check = tk.Checkbutton(
+            self.__options_wrapper, text="No carry", variable=self.__no_carry)
+        self.__distinct = tk.IntVar(value=self.__settings['distinct'])
+        self.__distinct_check = tk.Checkbutton(
+            self.__options_wrapper, text="Distinct", variable=self.__distinct)
+        self.__max_result_label = tk.Label(self.__options_wrapper,
+                                           text="Max result")
+        self.__max_result_entry = tk.Entry(self.__options_wrapper, width=8,
+                                           justify=tk.CENTER)
+        self.__max_result_entry.insert(0, self.__settings['max_result'])
+        self.__mixed = tk.IntVar(value=self.__settings['mixed'])
+        self.__mixed_check = tk.Checkbutton(
+            self.__options_wrapper, text="Mixed operators",
+            variable=self.__mixed)
+        self.__no_repeat = tk.IntVar(value=self.__settings['no_repeat'])
+        self.__no_repeat_check = tk.Checkbutton(
+            self.__options_wrapper, text="No repeats",
+            variable=self.__no_repeat)
+
+        self.__difficulty_label = tk.Label(self.__options_wrapper,
+                                           text="Difficulty")
+        self.__difficulty = tk.Spinbox(self.__options_wrapper, from_=0,
+                                       to=DIFFICULTY_BANDS, width=2)
+        self.__difficulty.delete(0, tk.END)
+        self.__difficulty.insert(0, self.__settings['difficulty'])
+
+        # Grid options wrapper and contents
+        self.__adaptive_check.grid(row=0, column=0)
+        self.__nonnegative_check.grid(row=0, column=1)
+        self.__no_carry_check.grid(row=0, column=2)
+        self.__distinct_check.grid(row=0, column=3)
+        self.__max_result_label.grid(row=0, column=4)
+        self.__max_result_entry.grid(row=0, column=5)
+        self.__mixed_check.grid(row=0, column=6)
+        self.__no_repeat_check.grid(row=0, column=7)
+        self.__difficulty_label.grid(row=0, column=8)
+        self.__difficulty.grid(row=0, column=9)
+        self.__options_wrapper.grid(row=1, column=0, columnspan=5,
+                                    sticky=tk.W)
+
         self.__tframe.grid(row=0, column=0, sticky=tk.EW)
 
         # Middle frame for buttons and timer
@@ -139,7 +461,7 @@ class ArithmeticProgram:
                                        command=self.quit)
         self.__timer_label = tk.Label(self.__mframe, text="Time left:")
         # Timer updates as IntVar timer is updated.
-        self.__timer = tk.Label(self.__mframe, height=3, width=time_width,
+        self.__timer = tk.Label(self.__mframe, height=3, width=timer_width,
                                 textvariable=self.__time_left)
 
         # Grid buttons and their frame.
@@ -156,8 +478,8 @@ class ArithmeticProgram:
                                        pady=5)
         # Placeholder label so height isn't lost when hiding other elements.
         self.__pholder = tk.Label(self.__eqframe, text="")
-        # Left side of the equation.
-        self.__eqleft = tk.Frame(self.__eqframe, height=3)
+        # Left side of the equation, one text item on a canvas.
+        self.__eqleft = tk.Canvas(self.__eqframe, highlightthickness=0)
         # Right side, user answer.
         self.__uanswer = tk.Entry(self.__eqframe, width=10)
         # Pressing SUBMIT_KEY initiates answer checking when entry is focused.
@@ -202,11 +524,23 @@ class ArithmeticProgram:
             self.__range_label,
             self.__op_label,
             self.__time_label,
+            self.__profile_label,
             self.__numbercount,
             self.__range_lower,
             self.__range_upper,
             self.__op_dropdown,
             self.__time_entry,
+            self.__profile_dropdown,
+            self.__adaptive_check,
+            self.__nonnegative_check,
+            self.__no_carry_check,
+            self.__distinct_check,
+            self.__max_result_label,
+            self.__max_result_entry,
+            self.__mixed_check,
+            self.__no_repeat_check,
+            self.__difficulty_label,
+            self.__difficulty,
             self.__start_button,
             self.__help_button,
         ]
@@ -218,50 +552,32 @@ class ArithmeticProgram:
         for i in self.__running_active_widgets:
             i.configure(state=tk.DISABLED)
 
+        # Tcl side of redraw(), sets all the display variables in one call.
+        self.__window.tk.eval(REDRAW_PROC)
+
+        # The title bar's close button quits too, so pending writes are
+        # flushed before the writer thread goes away.
+        self.__window.protocol("WM_DELETE_WINDOW", self.quit)
+
     def create_left_eq(self):
         """
-        Creates all labels required to display the equation in its biggest 
-        form. Creates new variables for later use.
-        self.__operator: Simply loads the default operator. Needed later.
-        self.__numbers: Control variables for label values.
-        self.__eq_labels: All labels in a list. Necessary portions of it are
-                            unhidden when needed.
+        Creates the text item that shows the equation on self.__eqleft. The
+        whole left side is one string, so any amount of numbers fits
+        without more widgets.
+        self.__eq_font: font of the equation, for sizing the canvas.
+        self.__eq_text: id of the text item.
         ---This function is run inside init.
         """
-        # Control variable so operator label auto-updates.
-        self.__operator = tk.StringVar(value=self.__settings['operator'])
-
-        # Creating control variables for label numbers and adding to list.
-        # Assignment can be done with for loops, but I wanted to try this out.
-        self.__numbers = []
-        for i in range(MAX_NUMBERS):
-            num = tk.IntVar(value=0)
-            self.__numbers.append(num)
-
-        # Create list of number and operator labels. Assign label to
-        # corresponding number control variable.
-        self.__eq_labels = []
-        # Getting the width needed so there is no weird resizing later.
-        for i in range(MAX_NUMBERS):
-            self.__eq_labels.append(tk.Label(self.__eqleft,
-                                             textvariable=self.__numbers[i]))
-            # Check if last number before adding operator label.
-            # Last label is '='
-            if i == MAX_NUMBERS - 1:
-                self.__eq_labels.append(tk.Label(self.__eqleft, text="="))
-
-            else:
-                self.__eq_labels.append(tk.Label(self.__eqleft,
-                                                 textvariable=self.__operator))
+        self.__eq_font = tkfont.nametofont('TkDefaultFont')
+        self.__eq_text = self.__eqleft.create_text(
+            0, 0, anchor=tk.E, font=self.__eq_font,
+            disabledfill=self.__pholder.cget('disabledforeground'))
+        self.__eqleft.configure(height=self.__eq_font.metrics('linespace'))
 
-        # Grid and hide the labels so they can later be drawn with just grid()
-        # and no settings. Add to active when running widgets list.
-        for i in range(len(self.__eq_labels)):
-            self.__running_active_widgets.append(self.__eq_labels[i])
-            self.__eq_labels[i].grid(row=0, column=i)
-            self.__eq_labels[i].grid_remove()
+        # Greyed out like the other widgets when the game isn't running.
+        self.__running_active_widgets.append(self.__eqleft)
 
-        # Enable the right labels at launch with default settings.
+        # Size it for the settings at launch.
         self.left_eq_config()
 
     def start_game(self):
@@ -278,7 +594,7 @@ class ArithmeticProgram:
             # Starting timer.
             # If limit = 0 -> no timer.
             if self.__settings['time_limit'] != 0:
-                self.countdown(self.__settings['time_limit'])
+                self.__countdown.start(self.__settings['time_limit'])
 
             self.__uanswer.focus()  # Player doesn't have to focus manually.
             # Game has now started and will stop once stopping conditions have
@@ -299,7 +615,15 @@ class ArithmeticProgram:
             'range_lower': self.__range_lower.get(),
             'range_upper': self.__range_upper.get(),
             'operator': self.__op_dropdown.get(),
-            'time_limit': self.__time_entry.get()
+            'time_limit': self.__time_entry.get(),
+            'adaptive': self.__adaptive.get(),
+            'nonnegative': self.__nonnegative.get(),
+            'max_result': self.__max_result_entry.get(),
+            'no_carry': self.__no_carry.get(),
+            'distinct': self.__distinct.get(),
+            'mixed': self.__mixed.get(),
+            'no_repeat': self.__no_repeat.get(),
+            'difficulty': self.__difficulty.get()
         }
 
         # Validating settings and getting a list of error messages.
@@ -320,6 +644,39 @@ class ArithmeticProgram:
         else:
             return False
 
+    def load_profile(self):
+        """
+        Loads the selected profile's saved settings into the input fields.
+        """
+        self.__profile = self.__profile_dropdown.get()
+        self.show_settings(read_cfg(self.__profile, self.__config))
+
+    def show_settings(self, settings):
+        """
+        Replaces the contents of the settings input fields.
+        :param settings: settings dict.
+        """
+        fields = {
+            'numbercount': self.__numbercount,
+            'range_lower': self.__range_lower,
+            'range_upper': self.__range_upper,
+            'operator': self.__op_dropdown,
+            'time_limit': self.__time_entry,
+            'max_result': self.__max_result_entry,
+            'difficulty': self.__difficulty
+        }
+
+        for setting, field in fields.items():
+            field.delete(0, tk.END)
+            field.insert(0, settings[setting])
+
+        self.__adaptive.set(settings['adaptive'])
+        self.__nonnegative.set(settings['nonnegative'])
+        self.__no_carry.set(settings['no_carry'])
+        self.__distinct.set(settings['distinct'])
+        self.__mixed.set(settings['mixed'])
+        self.__no_repeat.set(settings['no_repeat'])
+
     def start_game_setup(self):
         """
         Setting up all the variables/ui elements and equation for a new game.
@@ -334,12 +691,20 @@ class ArithmeticProgram:
         for i in self.__running_active_widgets:
             i.configure(state=tk.NORMAL)
 
-        # Set up last variables for game.
-        # List of numbers in use. Used by answer process.
-        first_used_number_index = MAX_NUMBERS - self.__settings['numbercount']
-        self.__numbers_in_use = self.__numbers[first_used_number_index:]
+        # Adaptive mode continues from the last game's mastery scores if the
+        # range, operator and constraints are the same.
+        generator = None
+        if self.__settings['adaptive']:
+            key = ('range_lower', 'range_upper', 'operator') + CONSTRAINTS
+            model = self.__adaptive_model
+            if model is None or any(model.settings[i] != self.__settings[i]
+                                    for i in key):
+                self.__adaptive_model = AdaptiveGenerator(self.__settings)
+            generator = self.__adaptive_model
 
-        self.__stoptimer = False  # Reset from previous use.
+        # New game state with fresh counters, built from validated settings.
+        self.__game = GameState(self.__settings, log=self.__log,
+                                generator=generator)
 
         # Transfer results to previous and clear current result if last game
         # had any results.
@@ -347,117 +712,93 @@ class ArithmeticProgram:
             self.__results_prev.set(self.__results_cur.get())
             self.__results_cur.set("")
 
-        self.set_new_calculation()
+        self.redraw()
 
     def left_eq_config(self):
         """
-        Sets up the left side of the equation. Needed parts of self.__eq_labels
-        are added to GUI.
+        Sizes the equation canvas for the longest problem of the settings,
+        so it doesn't resize during the game. Only run at start, turns just
+        change the text.
         """
         numcount = self.__settings['numbercount']  # Amount of numbers used.
-        number_label_width = len(str(self.__settings['range_upper'])) + 1
-        # Set new operator.
-        self.__operator.set(self.__settings['operator'])
+        number_width = max(len(str(self.__settings['range_upper'])),
+                           len(str(self.__settings['range_lower'])))
+        # Numbers, ' + ' between them and ' ='.
+        characters = numcount * number_width + (numcount - 1) * 3 + 2
+        width = characters * self.__eq_font.measure('0')
+        height = self.__eq_font.metrics('linespace')
 
-        # Clean up all labels from previous game.
-        for i in self.__eq_labels:
-            i.grid_remove()
+        self.__eqleft.configure(width=width)
+        self.__eqleft.coords(self.__eq_text, width, height // 2)
+        self.__eqleft.itemconfigure(self.__eq_text, text=format_problem(
+            [0] * numcount, self.__settings['operator']) + " =")
 
-        first_used_label_index = len(self.__eq_labels) - numcount * 2
-        # Apply width to labels in use.
-        for i in range(first_used_label_index, MAX_NUMBERS*2 - 1, 2):
-            self.__eq_labels[i].configure(width=number_label_width)
-        # Grid the labels that are in use.
-        for i in range(first_used_label_index, MAX_NUMBERS*2):
-            self.__eq_labels[i].grid()
-
-    def countdown(self, count):
+    def countdown(self, remaining):
         """
-        Countdown timer. Only run if time limit > 0.
-        :param count: time until shutdown
+        Timer tick, shows the time left. Run by self.__countdown, which also
+        stops the game once the time has run out.
+        :param remaining: seconds left, float.
         """
-        # Stop timer if stop button has been pressed.
-        if self.__stoptimer:
-            return
-
-        elif count > 0:
-            self.__time_left.set(count-1)
-            self.__window.after(1000, self.countdown, count - 1)
-
-        # Stop game if time has run out.
-        else:
-            self.stop_game()
-            return
+        self.__time_left.set(format_time(remaining))
 
     def answer_process(self, uanswer):
         """
         Processes answer and advances turn accordingly.
         :param uanswer: user answer
         """
-        # Get all the numbers from Vars and correct answer.
-        numbers = []
-        for i in self.__numbers_in_use:
-            numbers.append(i.get())
-
-        answer = get_answer(numbers, self.__settings['operator'])
-
-        # Process user answer.
+        # Process user answer. Empty answer counts as wrong (skip).
         try:
-            if int(uanswer) == answer:
-                self.advance_turn(True)
-
-            else:  # Skip if wrong answer.
-                self.advance_turn(False)
-
-        except ValueError:
-            if uanswer == "":  # Empty used for skipping.
-                self.advance_turn(False)
+            correct = self.__game.check(uanswer)
 
-            else:  # Wipe input and give a chance.
-                clear_field(self.__uanswer)
-                showerror("Bad input", "Input can only be an integer or empty")
+        except ValueError:  # Wipe input and give a chance.
+            clear_field(self.__uanswer)
+            showerror("Bad input", "Input can only be an integer or empty")
             return
 
-    def advance_turn(self, correct):
+        self.advance_turn(correct, uanswer)
+
+    def advance_turn(self, correct, uanswer=""):
         """
         Does all the things needed to advance into showing the next equation.
         :param correct: boolean; answer is correct/not.
+        :param uanswer: user answer, for the attempt log.
         """
-        self.__answers_all += 1
-
-        if correct:
-            self.__answers_correct += 1
-
-        # Update the current results label.
-        self.__results_cur.set("%s / %s" %
-                               (self.__answers_correct, self.__answers_all))
-
-        self.set_new_calculation()  # New numbers and entry.
+        self.__game.record(correct, uanswer)
+        self.set_new_calculation()  # New numbers, entry and results.
 
     def set_new_calculation(self):
         """
         When initiating game or a new turn, creates a new calculation to show.
         """
-        # Set low and high bounds for number generator.
-        low = self.__settings['range_lower']
-        high = self.__settings['range_upper']
+        self.__game.next_problem()
+        self.redraw()
 
-        # Get a random number and update it into the IntVar/label.
-        for i in self.__numbers_in_use:
-            random_number = randint(low, high)
-            i.set(random_number)
+        # Top up the buffer once Tk is idle, not while a key is handled.
+        if self.__game.problems.low:
+            self.__window.after_idle(self.__game.problems.refill)
 
-        clear_field(self.__uanswer)  # Cleanup input.
+    def redraw(self):
+        """
+        Writes the game state into the equation text and the results
+        variable and clears the input. Nothing is read back from Tk, and
+        everything is sent to Tcl as one command. Changing the text of a
+        canvas item needs no geometry manager pass.
+        """
+        text = format_problem(self.__game.operands, self.__game.operator) + \
+            " ="
+        self.__window.tk.call('mat_redraw', self.__uanswer, self.__eqleft,
+                              self.__eq_text, text, str(self.__results_cur),
+                              self.__game.summary)
 
     def stop_game(self):
         """
         Run when the stop button is pressed. Stop timer and disables/enables
         buttons for not in game state.
         """
-        self.__stoptimer = True  # Stops timer on next countdown.
-        self.__time_left.set(0)
+        self.__countdown.cancel()  # Stops timer immediately.
+        self.__time_left.set(format_time(0))
         self.__tframe.focus()  # Take away forcus from entry. No more inputs.
-        # This is needed even though set_new_calculation() already has it:
+        # This is needed even though redraw() already has it:
         # That f() can't run on a disabled entry, so it doesn't work at start.
         clear_field(self.__uanswer)
         # Disable/enable/grey out needed elements for stopped game.
@@ -467,31 +808,52 @@ class ArithmeticProgram:
         for i in self.__stopped_active_widgets:
             i.configure(state=tk.NORMAL)
 
-        # Game stopped.
-
-        # Flush answer counts.
-        self.__answers_correct = 0
-        self.__answers_all = 0
+        # Game stopped. Counts are flushed when the next game is created.
 
     def start(self):
         self.__window.mainloop()
 
+    def update(self):
+        """
+        Runs pending redraws and idle callbacks without the main loop.
+        Used by the benchmarks.
+        """
+        self.__window.update_idletasks()
+
     def quit(self):
         """
         Attempt to save settings and quit.
         """
         self.push_settings(display_errors=False)
-        write_cfg(self.__settings)
+        # Typed profile names count too, empty falls back to the current one.
+        profile = self.__profile_dropdown.get().strip() or self.__profile
+        self.__writer.call(write_cfg, self.__settings, profile, self.__config)
+        self.close()
+
+    def close(self):
+        """
+        Closes the window without saving the settings.
+        """
+        self.__countdown.cancel()
+        self.__writer.close()  # Waits for the final flush.
+
+        if self.__log is not None:
+            self.__log.close()
+
         self.__window.destroy()
 
 
 def settings_errors(s):
     """
     Validates and processes settings, creates error messeages.
-    :param s: dict of settings.
+    :param s: dict of settings. Missing settings (e.g. from an older
+              version) are taken from defaults.
     :return: error messages, processed settings.
     """
     error_messages = []
+    for i in defaults:
+        s.setdefault(i, defaults[i])
+
     # Check for integer-only input. This has to be checked first before
     # messages for other errors can be sent. Check will return immediately.
     for i in s:
@@ -531,17 +893,143 @@ def settings_errors(s):
         error_messages.append("Time limit: must be between 0 and %s." %
                               MAX_TIME_LIMIT)
 
+    # Adaptive mode tracks pairs of numbers.
+    if s['adaptive'] not in (0, 1):
+        error_messages.append("Adaptive: must be 0 (off) or 1 (on).")
+
+    elif s['adaptive'] and s['numbercount'] != 2:
+        error_messages.append("Adaptive: only available with 2 numbers.")
+
+    # Mixed mode ignores the operator setting.
+    if s['mixed'] not in (0, 1):
+        error_messages.append("Mixed operators: must be 0 (off) or 1 (on).")
+
+    elif s['mixed'] and s['adaptive']:
+        error_messages.append("Mixed operators: not available in adaptive "
+                              "mode.")
+
+    elif s['mixed'] and s['numbercount'] - 1 > LOG_OPERATOR_SLOTS:
+        error_messages.append("Mixed operators: at most %s numbers."
+                              % (LOG_OPERATOR_SLOTS + 1))
+
+    # Adaptive mode repeats weak facts on purpose.
+    if s['no_repeat'] not in (0, 1):
+        error_messages.append("No repeats: must be 0 (off) or 1 (on).")
+
+    elif s['no_repeat'] and s['adaptive']:
+        error_messages.append("No repeats: not available in adaptive mode.")
+
+    # Difficulty is indexed for pairs of numbers.
+    if not 0 <= s['difficulty'] <= DIFFICULTY_BANDS:
+        error_messages.append("Difficulty: must be between 0 (any) and %s."
+                              % DIFFICULTY_BANDS)
+
+    elif s['difficulty'] and (s['numbercount'] != 2 or s['adaptive'] or
+                              s['mixed'] or
+                              any(s[i] for i in CONSTRAINTS)):
+        error_messages.append("Difficulty: only for 2 numbers, without "
+                              "adaptive mode, mixed operators or "
+                              "constraints.")
+
+    elif s['difficulty'] and not HAVE_NUMPY:
+        error_messages.append("Difficulty: NumPy must be installed to use "
+                              "it.")
+
+    error_messages.extend(constraint_errors(s, not error_messages))
+
+    # Division chains are built from the range's divisors.
+    if not error_messages and s['operator'] == '÷' and not s['mixed'] and \
+            division_index(s['range_lower'], s['range_upper'],
+                           s['numbercount']).count == 0:
+        error_messages.append("Operator: no division problems fit in this "
+                              "range with this many numbers.")
+
+    if not error_messages and s['difficulty'] and \
+            len(difficulty_band(s['range_lower'], s['range_upper'],
+                                s['operator'], s['difficulty'])) == 0:
+        error_messages.append("Difficulty: no problems of this difficulty "
+                              "in this range.")
+
     return error_messages, s
 
 
+def constraint_errors(s, check_space=True):
+    """
+    Validates the constraint settings. Part of settings_errors().
+    :param s: dict of settings, already converted to integers.
+    :param check_space: also check that some problems meet the constraints.
+                        Needs the other settings to be valid.
+    :return: error messages.
+    """
+    error_messages = []
+
+    for i in ('nonnegative', 'no_carry', 'distinct'):
+        if s[i] not in (0, 1):
+            error_messages.append("Constraints: options must be 0 (off) or 1 "
+                                  "(on).")
+            return error_messages
+
+    if not 0 <= s['max_result'] <= RANGE_LIMIT ** 2:
+        error_messages.append("Result limit: must be between 0 (no limit) "
+                              "and %s." % RANGE_LIMIT ** 2)
+
+    if not any(s[i] for i in CONSTRAINTS):
+        return error_messages
+
+    if s['mixed']:
+        error_messages.append("Constraints: not available with mixed "
+                              "operators.")
+        return error_messages
+
+    if s['operator'] == '÷':
+        error_messages.append("Constraints: not available for ÷, division "
+                              "problems always come out even.")
+        return error_messages
+
+    if not HAVE_NUMPY:
+        error_messages.append("Constraints: NumPy must be installed to use "
+                              "them.")
+        return error_messages
+
+    if s['no_carry'] and (s['operator'] not in ('+', '-') or
+                          s['range_lower'] < 0):
+        error_messages.append("No carry: only for + and - with numbers of 0 "
+                              "or more.")
+
+    if s['distinct'] and \
+            s['range_upper'] - s['range_lower'] + 1 < s['numbercount']:
+        error_messages.append("Distinct: the range doesn't have enough "
+                              "different numbers.")
+
+    # Intermediate results of multiplication chains are only kept in a
+    # table if they have a limit.
+    if s['operator'] == '·' and s['numbercount'] > 2 and \
+            (s['nonnegative'] or s['max_result']) and \
+            not 0 < s['max_result'] <= MAX_NUMBERS * RANGE_LIMIT:
+        error_messages.append("Result limit: needed for · with more than 2 "
+                              "numbers and result constraints, at most %s."
+                              % (MAX_NUMBERS * RANGE_LIMIT))
+
+    if check_space and not error_messages and \
+            constraint_space(s).count == 0:
+        error_messages.append("Constraints: no problems match these "
+                              "settings.")
+
+    return error_messages
+
+
 def get_answer(numbers, op):
     """
     Based on chosen operator, do operation to find out correct answer.
     :param numbers: list of numbers
-    :param op: operator
+    :param op: operator, or a tuple of operators for a mixed problem.
     :return: correct answer
     """
 
+    # Mixed operators, in order of precedence.
+    if isinstance(op, tuple):
+        return compile_expression(op)(*numbers)
+
     # Addition.
     if op == "+":
         answer = sum(numbers)
@@ -563,114 +1051,4648 @@ def get_answer(numbers, op):
         answer = base
         return answer
 
+    # Division. Problems are generated so that it always goes evenly.
+    elif op == "÷":
+        base = numbers[0]
+        for i in numbers[1:]:
+            base //= i
+        answer = base
+        return answer
+
     else:
         showerror("No", "This really shouldn't happen. Bug report time.")
         return 0
 
 
-def clear_field(field):
+def get_answers(operands, op):
     """
-    Clears answer input field when keyboard button is pressed.
-    :param field: the text field object
+    Batch version of get_answer(). Evaluates a whole operand matrix in one
+    vectorized pass. Falls back to exact Python integers if the results
+    could overflow int64.
+    :param operands: 2-D operand matrix, one problem per row.
+    :param op: operator
+    :return: answer column (int64 array, or object array of Python ints).
     """
-    field.delete(0, tk.END)
+    if op not in ("+", "-", "·", "÷"):
+        raise ValueError("Unsupported operator: %r" % op)
 
+    # Without NumPy this is just the single problem version in a loop.
+    if not HAVE_NUMPY:
+        return [get_answer(list(row), op) for row in operands]
 
-def help_message():
+    operands = np.asarray(operands)
+    if operands.ndim != 2:
+        raise ValueError("Operands must be a 2-D matrix.")
+
+    if operands.size == 0:
+        return np.zeros(len(operands), dtype=np.int64)
+
+    # Worst case magnitude of any result, calculated with Python ints.
+    # Object arrays (numbers beyond int64) always take the exact path.
+    if operands.dtype != object:
+        peak = max(abs(int(operands.max())), abs(int(operands.min())))
+        if op == "·":
+            bound = peak ** operands.shape[1]
+        elif op == "÷":  # Division never grows the numbers.
+            bound = peak
+        else:
+            bound = peak * operands.shape[1]
+
+        if bound <= np.iinfo(np.int64).max:
+            operands = operands.astype(np.int64, copy=False)
+        else:
+            operands = operands.astype(object)
+
+    # Object arrays evaluate with exact Python integer arithmetic.
+    if op == "+":
+        return operands.sum(axis=1)
+
+    elif op == "-":
+        return operands[:, 0] - operands[:, 1:].sum(axis=1)
+
+    elif op == "÷":
+        if np.any(operands[:, 1:] == 0):
+            raise ZeroDivisionError("Division by zero in operands.")
+
+        answers = operands[:, 0].copy()
+        for column in operands[:, 1:].T:
+            answers //= column
+        return answers
+
+    else:
+        return operands.prod(axis=1)
+
+
+@lru_cache(maxsize=MIXED_CACHE_SIZE)
+def compile_expression(operators):
     """
-    Help message.
+    Compiles an evaluator for one operator layout, e.g. ('+', '·') gives
+    lambda n0, n1, n2: n0 + n1 * n2. Python's own precedence is the usual
+    one, and the same function works on ints and NumPy columns.
+    :param operators: tuple of operators between the numbers.
+    :return: function taking the numbers as arguments.
+    :raises ValueError: if an operator can't be mixed.
     """
-    showinfo(
-        "Help",
-        "This program is for training mental arithmetic.\n\n"
-        "The numbers setting lets you change how many numbers there will be in"
-        " the calculation. (2 - %s)\n\n"
-        "The range setting lets you choose the range in which the "
-        "numbers are randomly chosen from. (%s - %s)\n\n"
-        "The operator setting will let you choose the calculation method.\n\n"
-        "Time limit: you can set a timer. If it is set to 0, timer will be"
-        " disabled. (0 - %s)\n\n"
-        "When the game is started, simply write the correct answer and "
-        "press the ENTER button to submit it and move on to the next one."
-        " The game will run until you press start or until timer runs out."
-        " Pressing ENTER when the answer box is empty will skip.\n\n"
-        "Your current and previous scores will be shown in the bottom."
-        % (MAX_NUMBERS, -RANGE_LIMIT, RANGE_LIMIT, MAX_TIME_LIMIT)
-    )
+    names = ['n%d' % i for i in range(len(operators) + 1)]
+    source = names[0]
+    for op, name in zip(operators, names[1:]):
+        if op not in MIXED_OPERATORS:
+            raise ValueError("Unsupported operator: %r" % op)
 
+        source += " %s %s" % ('*' if op == '·' else op, name)
 
-def write_cfg(settings):
+    # Only built from the names and operators above.
+    return eval("lambda %s: %s" % (", ".join(names), source))
+
+
+def get_mixed_answers(operands, shapes, layouts):
     """
-    Create new config file from provided settings.
-    :param settings: program settings dict
+    Evaluates a batch of mixed problems, one compiled evaluator call per
+    operator layout instead of one per problem.
+    :param operands: 2-D operand matrix, one problem per row.
+    :param shapes: layout index of every row.
+    :param layouts: list of operator tuples the indexes refer to.
+    :return: answer column, int64 array.
+    """
+    answers = np.zeros(len(operands), dtype=np.int64)
+    for shape in np.unique(shapes).tolist():
+        rows = shapes == shape
+        answers[rows] = compile_expression(layouts[shape])(*operands[rows].T)
+    return answers
+
+
+def smallest_prime_factors(limit):
+    """
+    Sieve of smallest prime factors.
+    :param limit: largest number.
+    :return: list, item n is the smallest prime factor of n (0 for 0 and 1).
+    """
+    spf = [0] * (limit + 1)
+    for i in range(2, limit + 1):
+        if spf[i] == 0:  # i is prime.
+            for j in range(i, limit + 1, i):
+                if spf[j] == 0:
+                    spf[j] = i
+    return spf
+
+
+def divisors(number, spf):
     """
-    newfile = open(CFG_FILE, 'w')
-    lines = []
+    :param number: positive integer.
+    :param spf: smallest_prime_factors() covering number.
+    :return: sorted positive divisors of number.
+    """
+    result = [1]
+    while number > 1:
+        prime = spf[number]
+        power = 0
+        while number % prime == 0:
+            number //= prime
+            power += 1
 
-    for i in settings:
-        line_words = [i, str(settings[i])]
-        line = ";".join(line_words)
-        lines.append(line)
+        result = [d * prime ** k for d in result for k in range(power + 1)]
 
-    filetext = "\n".join(lines)
-    newfile.write(filetext)
-    newfile.close()
+    return sorted(result)
 
 
-def read_cfg():
+@lru_cache(maxsize=8)
+def division_index(low, high, numcount):
     """
-    Reads the settings from file into program. Reset config file if any error
-    occurs during reading & processing.
-    :return: settings
+    Division chains for a range, built once per range and number count.
+    :return: DivisionIndex
+    """
+    return DivisionIndex(low, high, numcount)
+
+
+class DivisionIndex:
+    """
+    Index of all exact division chains a ÷ b ÷ ... with every number in the
+    range. Divisors come from a smallest prime factor sieve. For every
+    dividend and amount of divisors left, the ways to finish the chain are
+    counted, so chains are drawn uniformly and every draw divides evenly by
+    construction. Dividends are never 0 (0 ÷ anything is too easy).
+    """
+    def __init__(self, low, high, numcount):
+        self.__numcount = numcount
+        limit = max(-low, high)
+        spf = smallest_prime_factors(limit)
+
+        # Divisors are indexed by the absolute value of the dividend, the
+        # sign of the result doesn't affect what divides it next.
+        # options[v]: numbers in the range that divide v (with signs).
+        options = [[]]
+        for value in range(1, limit + 1):
+            options.append([sign * d for d in divisors(value, spf)
+                            for sign in (1, -1) if low <= sign * d <= high])
+
+        # ways[m][v]: ways to divide v by m more numbers.
+        ways = [[1] * (limit + 1)]
+        for m in range(1, numcount):
+            ways.append([0] + [sum(ways[m - 1][value // abs(d)]
+                                   for d in options[value])
+                               for value in range(1, limit + 1)])
+
+        # choices[m][v]: divisors and their cumulative weights when m
+        # divisors are left including this one.
+        self.__choices = [None]
+        for m in range(1, numcount):
+            self.__choices.append([self.__cumulate(
+                options[value], [ways[m - 1][value // abs(d)]
+                                 for d in options[value]])
+                for value in range(limit + 1)])
+
+        dividends = [v for v in range(low, high + 1) if v != 0]
+        self.__first = self.__cumulate(
+            dividends, [ways[numcount - 1][abs(v)] for v in dividends])
+        self.count = self.__first[1][-1] if dividends else 0
+
+    @staticmethod
+    def __cumulate(items, weights):
+        cumulative = []
+        total = 0
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        return items, cumulative
+
+    @staticmethod
+    def __pick(choice, uniform):
+        items, cumulative = choice
+        return items[min(bisect_right(cumulative, uniform * cumulative[-1]),
+                         len(items) - 1)]
+
+    def pairs(self):
+        """
+        :return: every valid (dividend, divisor) pair, only for 2 numbers.
+        """
+        for dividend in self.__first[0]:
+            for divisor in self.__choices[1][abs(dividend)][0]:
+                yield dividend, divisor
+
+    def draw(self, uniforms):
+        """
+        :param uniforms: rows of numbercount random floats 0 - 1.
+        :return: list of operand lists, one per row.
+        """
+        problems = []
+        for row in uniforms:
+            number = self.__pick(self.__first, row[0])
+            operands = [number]
+            for i in range(1, self.__numcount):
+                divisor = self.__pick(
+                    self.__choices[self.__numcount - i][abs(number)], row[i])
+                operands.append(divisor)
+                number //= divisor
+            problems.append(operands)
+
+        return problems
+
+
+def digit_count(x):
+    """
+    :param x: NumPy integer array, 0 or more.
+    :return: decimal digits of every number (1 for 0).
+    """
+    count = np.ones(x.shape, dtype=np.int64)
+    power = 10
+    while power <= RANGE_LIMIT ** 2:
+        count += x >= power
+        power *= 10
+    return count
+
+
+def carry_count(x, y, sign=1):
     """
+    Carries of x + y (sign 1) or borrows of x - y (sign -1), written out
+    digit by digit. NumPy arrays, x >= y >= 0 for borrows.
+    """
+    count = np.zeros(np.broadcast(x, y).shape, dtype=np.int64)
+    carry = 0
+    while np.any(x) or np.any(y):
+        step = x % 10 + sign * (y % 10 + carry)
+        carry = (step >= 10) if sign == 1 else (step < 0)
+        count += carry
+        x, y = x // 10, y // 10
+    return count
+
+
+def nonzero_digits(x):
+    """
+    :param x: NumPy integer array, 0 or more.
+    :return: digits other than 0 in every number.
+    """
+    count = np.zeros(x.shape, dtype=np.int64)
+    while np.any(x):
+        count += x % 10 != 0
+        x = x // 10
+    return count
+
+
+def difficulty_scores(a, b, op):
+    """
+    Difficulty model of a op b, roughly the steps of working it out in
+    your head:
+    + and -: digits of the bigger number, 2 per carry or borrow, 1 more
+             for negative numbers or results. Adding 0 is 0.
+    ·: nonzero digits multiplied, plus the result's digits. Times 0, 1 or
+       -1 is 0.
+    ÷: as the multiplication it undoes, DIFFICULTY_NONE if it's uneven.
+    :param a: NumPy column of first numbers.
+    :param b: NumPy row of second numbers, broadcast against a.
+    :param op: operator.
+    :return: uint8 scores.
+    """
+    a, b = np.broadcast_arrays(a, b)
+    if op == '÷':
+        divisible = (a != 0) & (b != 0)
+        divisible[divisible] = a[divisible] % b[divisible] == 0
+        quotient = np.where(divisible, a // np.where(b == 0, 1, b), 0)
+        score = difficulty_scores(quotient, b, '·')
+        return np.where(divisible, score, DIFFICULTY_NONE).astype(np.uint8)
+
+    if op == '·':
+        small = (np.abs(a) <= 1) | (np.abs(b) <= 1)
+        score = nonzero_digits(np.abs(a)) * nonzero_digits(np.abs(b)) + \
+            digit_count(np.abs(a * b)) + (a * b < 0)
+        return np.where(small, 0, np.minimum(score, DIFFICULTY_NONE - 1))\
+            .astype(np.uint8)
+
+    negative = (a < 0) | (b < 0)
+    if op == '-':  # a - b is a + (-b).
+        negative |= a < b
+        b = -b
+
+    high = np.maximum(np.abs(a), np.abs(b))
+    low = np.minimum(np.abs(a), np.abs(b))
+    same_sign = (a >= 0) == (b >= 0)
+    steps = np.where(same_sign, carry_count(high, low),
+                     carry_count(high, low, -1))
+    score = digit_count(high) + 2 * steps + negative
+    return np.where((a == 0) | (b == 0), 0, score).astype(np.uint8)
+
+
+def difficulty_header():
+    return DIFFICULTY_HEADER.pack(
+        DIFFICULTY_MAGIC, DIFFICULTY_VERSION, RANGE_LIMIT,
+        b"".join(LOG_OPERATOR_CODES[i] for i in OPERATORS))
+
+
+def build_difficulty_table():
+    """
+    :return: uint8 array of scores, [operator, first + RANGE_LIMIT,
+             second + RANGE_LIMIT], computed in blocks of rows.
+    """
+    values = np.arange(-RANGE_LIMIT, RANGE_LIMIT + 1, dtype=np.int64)
+    table = np.empty((len(OPERATORS), len(values), len(values)),
+                     dtype=np.uint8)
+    for index, op in enumerate(OPERATORS):
+        for start in range(0, len(values), DIFFICULTY_BLOCK):
+            rows = values[start:start + DIFFICULTY_BLOCK, None]
+            table[index, start:start + len(rows)] = \
+                difficulty_scores(rows, values[None, :], op)
+    return table
+
+
+@lru_cache(maxsize=1)
+def difficulty_table(path=DIFFICULTY_FILE):
+    """
+    Loads the difficulty scores on first use. The file is memory-mapped,
+    and (re)built if it's missing or was made for other parameters.
+    :param path: table file.
+    :return: read-only uint8 array, as in build_difficulty_table().
+    """
+    header = difficulty_header()
+    width = 2 * RANGE_LIMIT + 1
+    shape = (len(OPERATORS), width, width)
     try:
-        confile = open(CFG_FILE, 'r')
-        lines = confile.readlines()
-        confile.close()
-        temp_settings = {}
+        with open(path, 'rb') as infile:
+            valid = infile.read(len(header)) == header and \
+                os.fstat(infile.fileno()).st_size == len(header) + \
+                width * width * len(OPERATORS)
+    except OSError:
+        valid = False
 
-        for i in lines:
-            line = i.rstrip()
-            words = line.split(';')
-            setting = words[0]
-            value = words[1]
+    if not valid:
+        table = build_difficulty_table()
+        directory = os.path.dirname(os.path.abspath(path))
+        temp_path = None
+        try:
+            handle, temp_path = tempfile.mkstemp(prefix='.MAT.',
+                                                 suffix='.tmp', dir=directory)
+            with os.fdopen(handle, 'wb') as outfile:
+                outfile.write(header)
+                outfile.write(table.tobytes())
+            os.chmod(temp_path, 0o644)  # mkstemp makes it private.
+            os.replace(temp_path, path)
+        except OSError:  # E.g. read-only directory, keep it in memory.
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+            table.flags.writeable = False
+            return table
 
-            if setting != 'operator':
-                temp_settings[setting] = int(value)
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=len(header),
+                     shape=shape)
 
-            else:
-                temp_settings[setting] = value
 
-        for i in defaults:
-            if i not in temp_settings:  # All settings must be present.
-                raise ValueError
+@lru_cache(maxsize=8)
+def difficulty_band(low, high, op, band):
+    """
+    Problems of one difficulty band in a range, found once per range.
+    Small ranges are scored on the spot, bigger ones read the table, which
+    takes seconds to build the first time.
+    :return: positions a * width + b of the problems in the range's square
+             of numbers, relative to low. NumPy array.
+    """
+    if high - low < DIFFICULTY_DIRECT:
+        values = np.arange(low, high + 1, dtype=np.int64)
+        scores = difficulty_scores(values[:, None], values[None, :], op)
+    else:
+        start = low + RANGE_LIMIT
+        stop = high + RANGE_LIMIT + 1
+        scores = difficulty_table()[OPERATORS.index(op), start:stop,
+                                    start:stop]
+    bands = np.searchsorted(np.array(DIFFICULTY_THRESHOLDS), scores,
+                            side='right') + 1
+    return np.flatnonzero((bands == band) & (scores != DIFFICULTY_NONE))
 
-        return temp_settings
 
-    except IndexError:
-        write_cfg(defaults)
-        showerror("File error", "The configuration file is faulty.\n"
-                                "Creating a new default file.")
-        return defaults
+class ProblemGenerator:
+    """
+    GUI-free problem source. Uses the same settings dict and sampling rules
+    as ArithmeticProgram, but draws problems in bulk so worksheet and drill
+    backends can use it without Tk.
+    """
+    def __init__(self, settings, seed=None, vectorized=HAVE_NUMPY):
+        """
+        :param settings: settings dict, validated with settings_errors().
+                         Missing keys are taken from defaults.
+        :param seed: optional seed for reproducible problem sets.
+        :param vectorized: use NumPy. Without it batches are lists, which
+                           is enough for one player and skips the import.
+        """
+        temp_settings = defaults.copy()
+        temp_settings.update(settings)
+        errors, temp_settings = settings_errors(temp_settings)
 
-    except ValueError:
-        showerror("File error", "The configuration file is faulty.\n"
-                                "Creating a new default file.")
-        write_cfg(defaults)
-        return defaults
+        if errors:
+            raise ValueError("\n".join(errors))
 
-    except OSError:  # Create new cfg if no file.
-        showerror("File error", "The configuration file was not found or could"
-                                " not be accessed. A new one will be created. "
-                                "\nIf this is the first time you're launching"
-                                "the program, this is supposed to happen.")
-        write_cfg(defaults)
-        return defaults
+        self.__settings = temp_settings
+        self.__space = None
+        self.__division = None
+        self.__band = None
+        if temp_settings['difficulty']:
+            # Problems of the band, drawn with NumPy.
+            self.__band = difficulty_band(temp_settings['range_lower'],
+                                          temp_settings['range_upper'],
+                                          temp_settings['operator'],
+                                          temp_settings['difficulty'])
+            vectorized = True
+
+        elif temp_settings['operator'] == '÷':
+            self.__division = division_index(temp_settings['range_lower'],
+                                             temp_settings['range_upper'],
+                                             temp_settings['numbercount'])
+
+        elif any(temp_settings[i] for i in CONSTRAINTS):
+            # Constrained problems are always drawn with NumPy.
+            self.__space = constraint_space(temp_settings)
+            vectorized = True
+
+        self.__vectorized = vectorized and HAVE_NUMPY
+        if self.__vectorized:
+            self.__rng = np.random.default_rng(seed)
+        else:
+            self.__rng = Random(seed)
+
+    @property
+    def settings(self):
+        return self.__settings.copy()
+
+    def generate(self, count):
+        """
+        Draws a batch of problems.
+        :param count: amount of problems to draw.
+        :return: operands (count x numbercount), answers (count). NumPy
+                 arrays if vectorized, otherwise lists.
+        """
+        low = self.__settings['range_lower']
+        high = self.__settings['range_upper']
+        numcount = self.__settings['numbercount']
+        op = self.__settings['operator']
+
+        if self.__band is not None:
+            picks = self.__band[self.__rng.integers(len(self.__band),
+                                                    size=count)]
+            width = high - low + 1
+            operands = np.stack([low + picks // width, low + picks % width],
+                                axis=1)
+            return operands, get_answers(operands, op)
+
+        if self.__division is not None:
+            if self.__vectorized:
+                uniforms = self.__rng.random((count, numcount)).tolist()
+                operands = np.array(self.__division.draw(uniforms),
+                                    dtype=np.int64).reshape(count, numcount)
+                return operands, get_answers(operands, op)
+
+            uniforms = [[self.__rng.random() for _ in range(numcount)]
+                        for _ in range(count)]
+            operands = self.__division.draw(uniforms)
+            return operands, [get_answer(row, op) for row in operands]
+
+        # Slow path, one randint() per number like the GUI used to do.
+        if not self.__vectorized:
+            operands = [[self.__rng.randint(low, high)
+                         for _ in range(numcount)] for _ in range(count)]
+            return operands, [get_answer(row, op) for row in operands]
+
+        if self.__space is not None:
+            operands = self.__space.draw(self.__rng, count)
+
+        else:
+            # Bounds are inclusive like randint().
+            operands = self.__rng.integers(low, high + 1,
+                                           size=(count, numcount),
+                                           dtype=np.int64)
+
+        return operands, get_answers(operands, op)
+
+    def feedback(self, operands, correct, latency):
+        """
+        Result of one answered problem. Uniform sampling doesn't use it.
+        """
+        pass
+
+
+class MixedGenerator:
+    """
+    Draws problems with a random operator in every slot, e.g. 12 + 7 · 3 - 5.
+    Numbers are uniform like in ProblemGenerator.
+    """
+    def __init__(self, settings, seed=None, vectorized=HAVE_NUMPY):
+        """
+        :param settings: settings dict, validated with settings_errors().
+        :param seed: optional seed.
+        :param vectorized: use NumPy, otherwise batches are lists.
+        """
+        temp_settings = defaults.copy()
+        temp_settings.update(settings)
+        errors, temp_settings = settings_errors(temp_settings)
+
+        if errors:
+            raise ValueError("\n".join(errors))
+
+        self.__settings = temp_settings
+        slots = temp_settings['numbercount'] - 1
+        # All operator layouts, a layout's index is its operators' indexes
+        # in MIXED_OPERATORS as a base len(MIXED_OPERATORS) number.
+        self.__layouts = list(product(MIXED_OPERATORS, repeat=slots))
+        self.__vectorized = vectorized and HAVE_NUMPY
+        if self.__vectorized:
+            self.__rng = np.random.default_rng(seed)
+            self.__place = len(MIXED_OPERATORS) ** np.arange(slots)[::-1]
+        else:
+            self.__rng = Random(seed)
+
+    @property
+    def settings(self):
+        return self.__settings.copy()
+
+    def generate(self, count):
+        """
+        Draws a batch of problems.
+        :param count: amount of problems to draw.
+        :return: operands (count x numbercount), answers (count), and the
+                 operator tuple of every problem (list). Operands and
+                 answers are NumPy arrays if vectorized, otherwise lists.
+        """
+        low = self.__settings['range_lower']
+        high = self.__settings['range_upper']
+        numcount = self.__settings['numbercount']
+
+        if not self.__vectorized:
+            operands = [[self.__rng.randint(low, high)
+                         for _ in range(numcount)] for _ in range(count)]
+            operators = [self.__rng.choice(self.__layouts)
+                         for _ in range(count)]
+            return operands, [compile_expression(ops)(*row) for row, ops in
+                              zip(operands, operators)], operators
+
+        operands = self.__rng.integers(low, high + 1, size=(count, numcount),
+                                       dtype=np.int64)
+        # RANGE_LIMIT ** MAX_NUMBERS times MAX_NUMBERS still fits int64.
+        shapes = self.__rng.integers(
+            len(MIXED_OPERATORS), size=(count, numcount - 1)) @ self.__place
+        operators = [self.__layouts[i] for i in shapes.tolist()]
+        return operands, get_mixed_answers(operands, shapes, self.__layouts), \
+            operators
+
+    def feedback(self, operands, correct, latency):
+        """
+        Result of one answered problem. Not used.
+        """
+        pass
+
+
+def step_results(acc, numbers, op, s):
+    """
+    One step of a chain for NumPy arrays of left and right sides, which are
+    broadcast against each other.
+    :param acc: result so far (left side).
+    :param numbers: next operands (right side).
+    :param op: operator
+    :param s: settings dict with the constraints.
+    :return: results, mask of the steps that meet the constraints.
+    """
+    if op == "+":
+        results = acc + numbers
+    elif op == "-":
+        results = acc - numbers
+    else:
+        results = acc * numbers
+
+    valid = np.ones(results.shape, dtype=bool)
+
+    if s['nonnegative']:
+        valid &= results >= 0
+
+    if s['max_result']:
+        valid &= results <= s['max_result']
+
+    # No carry (+) or borrow (-) in any column. Numbers are 0 or more.
+    if s['no_carry']:
+        left = acc + np.zeros_like(numbers)
+        right = numbers + np.zeros_like(acc)
+        while np.any(left | right):
+            if op == "+":
+                valid &= left % 10 + right % 10 < 10
+            else:
+                valid &= left % 10 >= right % 10
+            left = left // 10
+            right = right // 10
+
+    return results, valid
+
+
+@lru_cache(maxsize=8)
+def cached_constraint_space(key):
+    return ConstraintSpace(**dict(key))
+
+
+def constraint_space(s):
+    """
+    Index of the problems meeting the constraints, built once per settings.
+    :param s: validated settings dict.
+    :return: ConstraintSpace
+    """
+    names = ('range_lower', 'range_upper', 'numbercount', 'operator') + \
+        CONSTRAINTS
+    return cached_constraint_space(tuple((i, s[i]) for i in names))
+
+
+class ConstraintSpace:
+    """
+    All problems that meet the constraints, indexed so they can be drawn
+    uniformly without retrying.
+    - 2 numbers: every valid pair is listed, a draw is one table lookup.
+    - Longer chains: for every possible intermediate result the amount of
+      valid ways to finish the chain is counted. Operands are drawn in
+      proportion to those counts, which is uniform over all valid chains
+      and never reaches a dead end. 'distinct' is applied on top of that
+      by leaving out used numbers (a repeat is allowed if nothing else
+      fits), so those chains are only close to uniform.
+    - Only distinct numbers: operands are drawn without replacement.
+    """
+    def __init__(self, range_lower, range_upper, numbercount, operator,
+                 nonnegative, max_result, no_carry, distinct):
+        self.__s = {
+            'nonnegative': nonnegative,
+            'max_result': max_result,
+            'no_carry': no_carry,
+            'distinct': distinct
+        }
+        self.__low = range_lower
+        self.__width = range_upper - range_lower + 1
+        self.__numcount = numbercount
+        self.__operator = operator
+        self.__values = np.arange(range_lower, range_upper + 1,
+                                  dtype=np.int64)
+
+        # How problems are drawn: 'pairs', 'chains' or 'distinct'.
+        if numbercount == 2:
+            self.__mode = 'pairs'
+            self.__build_pairs()
+
+        elif nonnegative or max_result or no_carry:
+            self.__mode = 'chains'
+            self.__build_chains()
+
+        else:
+            self.__mode = 'distinct'
+            # Number of ordered selections without repeats.
+            self.count = 1
+            for i in range(numbercount):
+                self.count *= self.__width - i
+
+    def __build_pairs(self):
+        results, valid = step_results(self.__values[:, None],
+                                      self.__values[None, :],
+                                      self.__operator, self.__s)
+        if self.__s['distinct']:
+            valid &= self.__values[:, None] != self.__values[None, :]
+
+        # Flat indices a * width + b of the valid pairs.
+        self.__pairs = np.flatnonzero(valid)
+        self.count = len(self.__pairs)
+
+    @property
+    def pair_mask(self):
+        """
+        :return: flat boolean mask over all pairs (a * width + b), only for
+                 2 numbers.
+        """
+        mask = np.zeros(self.__width ** 2, dtype=bool)
+        mask[self.__pairs] = True
+        return mask
+
+    def __build_chains(self):
+        low = self.__low
+        high = low + self.__width - 1
+        n = self.__numcount
+        op = self.__operator
+
+        # Range of possible intermediate results.
+        if op == "+":
+            result_low, result_high = min(2 * low, n * low), n * high
+        elif op == "-":
+            result_low = min(low - high, low - (n - 1) * high)
+            result_high = max(high - low, high - (n - 1) * low)
+        else:
+            result_low, result_high = -self.__s['max_result'], \
+                self.__s['max_result']
+
+        if self.__s['nonnegative'] or self.__s['no_carry']:
+            result_low = max(result_low, 0)
+        if self.__s['max_result']:
+            result_high = min(result_high, self.__s['max_result'])
+
+        # Table covers the first operand and every allowed result.
+        self.__domain_low = min(low, result_low)
+        self.__domain = np.arange(self.__domain_low,
+                                  max(high, result_high) + 1, dtype=np.int64)
+
+        # Step table: index of the result in the domain, -1 if not valid.
+        self.__table = None
+        if len(self.__domain) * self.__width <= CONSTRAINT_TABLE_LIMIT:
+            # int16 is enough for any domain within RANGE_LIMIT 1000.
+            dtype = np.int16 if len(self.__domain) < 2 ** 15 else np.int32
+            table = np.empty((len(self.__domain), self.__width), dtype=dtype)
+            for start in range(0, len(self.__domain), 256):
+                rows = slice(start, start + 256)
+                results, valid = self.__step(self.__domain[rows, None])
+                table[rows] = np.where(valid, results - self.__domain_low, -1)
+            self.__table = table
+
+        # ways[m][i]: valid ways to add m more operands to result
+        # domain[i].
+        ways = [np.ones(len(self.__domain))]
+        for _ in range(n - 1):
+            step = np.zeros(len(self.__domain))
+            for start in range(0, len(self.__domain), 256):
+                rows = slice(start, start + 256)
+                step[rows] = self.__row_weights(self.__domain[rows, None],
+                                                ways[-1]).sum(axis=1)
+            ways.append(step)
+
+        self.__ways = ways
+        # First operand weights are the ways to finish from it.
+        first = ways[n - 1][self.__values - self.__domain_low]
+        self.__first = np.cumsum(first)
+        self.count = self.__first[-1]
+
+    def __step(self, acc):
+        # Results of acc (column) with every operand, and which are valid.
+        results, valid = step_results(acc, self.__values[None, :],
+                                      self.__operator, self.__s)
+        index = results - self.__domain_low
+        valid &= (index >= 0) & (index < len(self.__domain))
+        return results, valid
+
+    def __row_weights(self, acc, ways):
+        # Weight of every next operand for each acc (column): the ways to
+        # finish the chain from the result it gives.
+        if self.__table is not None:
+            index = self.__table[acc[:, 0] - self.__domain_low]
+            return np.where(index >= 0, ways[index], 0.0)
+
+        results, valid = self.__step(acc)
+        index = np.where(valid, results - self.__domain_low, 0)
+        return np.where(valid, ways[index], 0.0)
+
+    def draw(self, rng, count):
+        """
+        :param rng: NumPy Generator.
+        :param count: amount of problems.
+        :return: operand matrix (count x numbercount).
+        """
+        n = self.__numcount
+
+        if self.__mode == 'pairs':
+            index = self.__pairs[rng.integers(0, self.count, size=count)]
+            return np.stack(divmod(index, self.__width), axis=1) + \
+                self.__low
+
+        if self.__mode == 'distinct':
+            return self.__draw_distinct(rng, count)
+
+        operands = np.empty((count, n), dtype=np.int64)
+        first = np.searchsorted(self.__first,
+                                rng.random(count) * self.count, side='right')
+        operands[:, 0] = self.__values[np.minimum(first, self.__width - 1)]
+
+        # Next operands are drawn for a block of problems at a time, with
+        # one row of weights per problem.
+        for start in range(0, count, CONSTRAINT_BLOCK):
+            block = operands[start:start + CONSTRAINT_BLOCK]
+            acc = block[:, 0]
+            for i in range(1, n):
+                weights = self.__row_weights(acc[:, None],
+                                             self.__ways[n - 1 - i])
+                if self.__s['distinct']:
+                    kept = weights.copy()
+                    np.put_along_axis(kept, block[:, :i] - self.__low, 0.0,
+                                      axis=1)
+                    # Only used numbers fit, allow a repeat.
+                    left = kept.sum(axis=1) > 0
+                    weights = np.where(left[:, None], kept, weights)
+
+                cumulative = np.cumsum(weights, axis=1)
+                value = rng.random(len(block)) * cumulative[:, -1]
+                position = (cumulative <= value[:, None]).sum(axis=1)
+                block[:, i] = np.minimum(position, self.__width - 1) + \
+                    self.__low
+                acc = step_results(acc, block[:, i], self.__operator,
+                                   self.__s)[0]
+
+        return operands
+
+    def __draw_distinct(self, rng, count):
+        # Each column is drawn from the numbers left, then shifted past the
+        # earlier picks in ascending order.
+        picks = np.empty((count, self.__numcount), dtype=np.int64)
+        for i in range(self.__numcount):
+            column = rng.integers(0, self.__width - i, size=count)
+            for earlier in np.sort(picks[:, :i], axis=1).T:
+                column += column >= earlier
+            picks[:, i] = column
+
+        return picks + self.__low
+
+
+class FenwickTree:
+    """
+    Binary indexed tree of non-negative weights. Changing a weight, prefix
+    sums and drawing an index in proportion to its weight are O(log n).
+    """
+    def __init__(self, weights):
+        """
+        Builds the tree in O(n).
+        :param weights: initial weights, sequence or NumPy array.
+        """
+        size = len(weights)
+        self.__size = size
+
+        if HAVE_NUMPY:
+            # tree[i] is the sum of weights (i - lowbit(i), i].
+            prefix = np.zeros(size + 1)
+            np.cumsum(weights, out=prefix[1:])
+            index = np.arange(1, size + 1)
+            tree = np.zeros(size + 1)
+            tree[1:] = prefix[index] - prefix[index - (index & -index)]
+            # array indexes faster than NumPy one element at a time.
+            self.__tree = array('d', tree.tobytes())
+
+        else:
+            self.__tree = array('d', [0.0]) + array('d', weights)
+            for i in range(1, size + 1):
+                parent = i + (i & -i)
+                if parent <= size:
+                    self.__tree[parent] += self.__tree[i]
+
+        # Highest power of two <= size, first step of the descent in find().
+        self.__top = 1 << (size.bit_length() - 1) if size else 0
+
+    def __len__(self):
+        return self.__size
+
+    def add(self, index, delta):
+        """
+        :param index: 0-based index.
+        :param delta: change of its weight.
+        """
+        tree = self.__tree
+        i = index + 1
+        while i <= self.__size:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """
+        :return: sum of weights [0, index).
+        """
+        tree = self.__tree
+        total = 0.0
+        i = index
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    @property
+    def total(self):
+        return self.prefix(self.__size)
+
+    def find(self, value):
+        """
+        :param value: 0 <= value < total.
+        :return: smallest index whose prefix sum including itself is
+                 greater than value.
+        """
+        tree = self.__tree
+        position = 0
+        step = self.__top
+        while step:
+            nxt = position + step
+            if nxt <= self.__size and tree[nxt] <= value:
+                position = nxt
+                value -= tree[nxt]
+            step >>= 1
+
+        # Rounding can run past the end, clamp to the last index.
+        return min(position, self.__size - 1)
+
+    def sample(self, rng):
+        """
+        :param rng: random.Random instance.
+        :return: index drawn in proportion to the weights.
+        """
+        return self.find(rng.random() * self.total)
+
+
+class AdaptiveGenerator:
+    """
+    Draws two-number problems in proportion to how weak the player is on
+    each fact. The mastery of every pair in the range is kept in a flat
+    array, the weights in a FenwickTree, so updates and draws stay O(log n)
+    even for the full RANGE_LIMIT range (about 4 million facts).
+    """
+    def __init__(self, settings, seed=None):
+        """
+        :param settings: settings dict, validated with settings_errors().
+        :param seed: optional seed.
+        """
+        temp_settings = defaults.copy()
+        temp_settings.update(settings)
+        errors, temp_settings = settings_errors(temp_settings)
+
+        if errors:
+            raise ValueError("\n".join(errors))
+
+        self.__settings = temp_settings
+        self.__low = temp_settings['range_lower']
+        self.__width = temp_settings['range_upper'] - self.__low + 1
+        self.__operator = temp_settings['operator']
+        self.__rng = Random(seed)
+        size = self.__width ** 2
+
+        # Nothing is mastered at the start, all facts are equally likely.
+        # Facts that don't meet the constraints get no weight at all.
+        self.__mastery = array('f', bytes(4 * size))
+        if any(temp_settings[i] for i in CONSTRAINTS):
+            weights = constraint_space(temp_settings).pair_mask * \
+                (1 + ADAPTIVE_FLOOR)
+        elif self.__operator == '÷':  # Only pairs that divide evenly.
+            weights = [0.0] * size
+            for pair in division_index(self.__low, self.__low +
+                                       self.__width - 1, 2).pairs():
+                weights[self.__index(pair)] = 1 + ADAPTIVE_FLOOR
+        elif HAVE_NUMPY:
+            weights = np.full(size, 1 + ADAPTIVE_FLOOR)
+        else:
+            weights = [1 + ADAPTIVE_FLOOR] * size
+        self.__weights = FenwickTree(weights)
+        # Typical time for a correct answer, answers this fast count fully.
+        self.__reference_time = None
+
+    @property
+    def settings(self):
+        return self.__settings.copy()
+
+    def mastery(self, operands):
+        """
+        :param operands: pair of numbers.
+        :return: mastery score 0 - 1 of the fact.
+        """
+        return self.__mastery[self.__index(operands)]
+
+    def generate(self, count):
+        """
+        Draws a batch of problems.
+        :param count: amount of problems to draw.
+        :return: operands (count x 2), answers (count), as lists.
+        """
+        operands = []
+        for _ in range(count):
+            index = self.__weights.sample(self.__rng)
+            a, b = divmod(index, self.__width)
+            operands.append([a + self.__low, b + self.__low])
+
+        return operands, [get_answer(row, self.__operator)
+                          for row in operands]
+
+    def feedback(self, operands, correct, latency):
+        """
+        Updates the mastery of a fact from an answer.
+        :param operands: pair of numbers.
+        :param correct: boolean; answer is correct/not.
+        :param latency: response time in seconds.
+        """
+        score = 0.0
+        if correct:
+            if self.__reference_time is None:
+                self.__reference_time = latency
+            # Slow but correct answers count partly.
+            score = min(1.0, self.__reference_time / max(latency, 1e-3))
+            self.__reference_time += 0.1 * (latency - self.__reference_time)
+
+        index = self.__index(operands)
+        old = self.__mastery[index]
+        self.__mastery[index] = old + ADAPTIVE_RATE * (score - old)
+        # Weight is 1 - mastery + floor, so it changes by -(mastery change).
+        self.__weights.add(index, old - self.__mastery[index])
+
+    def __index(self, operands):
+        a, b = operands
+        return (a - self.__low) * self.__width + (b - self.__low)
+
+
+def make_generator(settings, seed=None, vectorized=HAVE_NUMPY):
+    """
+    Picks the problem generator for the settings.
+    :param settings: validated settings dict.
+    :param seed: optional seed.
+    :param vectorized: passed on to ProblemGenerator.
+    :return: ProblemGenerator, AdaptiveGenerator or MixedGenerator.
+    """
+    if settings.get('adaptive'):
+        return AdaptiveGenerator(settings, seed)
+
+    if settings.get('mixed'):
+        return MixedGenerator(settings, seed, vectorized)
+
+    return ProblemGenerator(settings, seed, vectorized)
+
+
+class ProblemQueue:
+    """
+    Lookahead buffer of ready problems with their answers. Refilled in bulk
+    from a ProblemGenerator so a turn is only a pop.
+    """
+    def __init__(self, generator, size=PREFETCH_SIZE, low=PREFETCH_LOW):
+        """
+        :param generator: ProblemGenerator to draw batches from.
+        :param size: amount of problems generated per refill.
+        :param low: refill threshold.
+        """
+        self.__generator = generator
+        self.__size = size
+        self.__low = low
+        self.__buffer = deque()
+        self.refill()
+
+    def __len__(self):
+        return len(self.__buffer)
+
+    @property
+    def generator(self):
+        return self.__generator
+
+    @property
+    def low(self):
+        """
+        :return: True if the buffer has run low and should be refilled.
+        """
+        return len(self.__buffer) < self.__low
+
+    def refill(self):
+        """
+        Adds one batch of problems if the buffer has run low.
+        """
+        if self.low:
+            self.__fill()
+
+    def __fill(self):
+        batch = self.__generator.generate(self.__size)
+        operands, answers = batch[:2]
+        # Only mixed problems have their own operators.
+        operators = batch[2] if len(batch) > 2 else repeat(None)
+        # Plain Python ints are faster to compare and display one by one.
+        if not isinstance(answers, list):
+            operands = operands.tolist()
+            answers = answers.tolist()
+
+        self.__buffer.extend(zip(map(tuple, operands), answers, operators))
+
+    def pop(self):
+        """
+        :return: next problem as (operands, answer, operators). operators
+                 is None unless the problem has its own.
+        """
+        if not self.__buffer:  # Only if refills couldn't keep up.
+            self.__fill()
+
+        return self.__buffer.popleft()
+
+
+class SeenProblems:
+    """
+    Set of the problems shown in a session, in bounded memory with O(1)
+    lookups. Every problem has an index in the space of all operand (and
+    mixed operator) combinations. Small spaces are tracked exactly with one
+    bit per problem, big ones with a Bloom filter, which can take a new
+    problem for a seen one now and then but never the other way round.
+    """
+    def __init__(self, settings):
+        """
+        :param settings: validated settings dict.
+        """
+        self.__low = settings['range_lower']
+        self.__width = settings['range_upper'] - self.__low + 1
+        numcount = settings['numbercount']
+        self.__size = self.__width ** numcount
+        if settings['mixed']:
+            self.__size *= len(MIXED_OPERATORS) ** (numcount - 1)
+
+        self.__exact = self.__size <= NO_REPEAT_BITSET_LIMIT
+        bits = self.__size if self.__exact else NO_REPEAT_BLOOM_BITS
+        self.__bits = bytearray((bits + 7) // 8)
+        self.__count = 0
+
+    @property
+    def exact(self):
+        """
+        :return: True if tracked with a bitset, False for a Bloom filter.
+        """
+        return self.__exact
+
+    def __len__(self):
+        return self.__count
+
+    def clear(self):
+        self.__bits = bytearray(len(self.__bits))
+        self.__count = 0
+
+    def add(self, operands, op):
+        """
+        Marks a problem as seen.
+        :param operands: numbers of the problem.
+        :param op: operator, or a tuple of operators for a mixed problem.
+        :return: True if the problem wasn't seen before.
+        """
+        index = 0
+        for number in operands:
+            index = index * self.__width + number - self.__low
+        if isinstance(op, tuple):
+            for operator in op:
+                index = index * len(MIXED_OPERATORS) + \
+                    MIXED_OPERATORS.index(operator)
+
+        if self.__exact:
+            positions = (index,)
+        else:
+            positions = self.__hashes(index)
+
+        new = False
+        for position in positions:
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.__bits[byte] & bit:
+                self.__bits[byte] |= bit
+                new = True
+
+        if new:
+            self.__count += 1
+            # Every problem has been shown, start over.
+            if self.__count >= self.__size:
+                self.clear()
+        return new
+
+    @staticmethod
+    def __hashes(index):
+        """
+        :return: Bloom filter bit positions of a problem index, from two
+                 halves of a 64-bit mix (double hashing).
+        """
+        mask = (1 << 64) - 1
+        value = (index * 0x9E3779B97F4A7C15) & mask
+        value ^= value >> 31
+        value = (value * 0xBF58476D1CE4E5B9) & mask
+        value ^= value >> 29
+        first, step = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(first + i * step) % NO_REPEAT_BLOOM_BITS
+                for i in range(NO_REPEAT_HASHES)]
+
+
+class GameState:
+    """
+    Authoritative state of one game (current problem, answer and counters)
+    kept in plain Python. The GUI only writes it out to Tk for display.
+    """
+    def __init__(self, settings, clock=time.perf_counter, log=None,
+                 generator=None, problems=None):
+        """
+        :param settings: validated settings dict.
+        :param clock: time source for response times, in seconds.
+        :param log: optional SessionLog that gets every attempt.
+        :param generator: problem source, a new ProblemGenerator by default.
+        :param problems: optional ProblemQueue shared with other games of
+                         the same settings, instead of a queue of its own.
+                         Answers go to its generator's feedback.
+        """
+        if problems is not None:
+            generator = problems.generator
+        elif generator is None:
+            generator = make_generator(settings)
+
+        self.__generator = generator
+        if problems is not None:
+            self.__problems = problems
+        elif settings['adaptive']:  # Draws depend on the latest answers.
+            self.__problems = ProblemQueue(generator, ADAPTIVE_PREFETCH, 1)
+        else:
+            self.__problems = ProblemQueue(generator)
+        self.__operator = settings['operator']
+        self.__problem_operator = self.__operator
+        self.__seen = SeenProblems(settings) if settings['no_repeat'] \
+            else None
+        self.__clock = clock
+        self.__log = log
+        # Id of this game in the log. Logs are shared between games, e.g.
+        # by the server's connections, so every game keeps its own.
+        self.__session = None
+        if log is not None:
+            self.__session = log.start_session(settings)
+        self.__operands = ()
+        self.__answer = None
+        self.__shown_at = None  # When the current problem was displayed.
+        self.__answers_correct = 0
+        self.__answers_all = 0
+        self.__latency = LatencyStats()
+        self.next_problem()
+
+    @property
+    def problems(self):
+        return self.__problems
+
+    @property
+    def operands(self):
+        return self.__operands
+
+    @property
+    def answer(self):
+        return self.__answer
+
+    @property
+    def operator(self):
+        """
+        :return: operator of the current problem, a tuple with one operator
+                 per slot for mixed problems.
+        """
+        return self.__problem_operator
+
+    @property
+    def answers_correct(self):
+        return self.__answers_correct
+
+    @property
+    def answers_all(self):
+        return self.__answers_all
+
+    @property
+    def latency(self):
+        return self.__latency
+
+    @property
+    def score(self):
+        """
+        :return: score text, empty until the first answer.
+        """
+        if not self.__answers_all:
+            return ""
+
+        return "%s / %s" % (self.__answers_correct, self.__answers_all)
+
+    @property
+    def summary(self):
+        """
+        :return: score and response time statistics for the results panel.
+        """
+        if not self.__answers_all:
+            return ""
+
+        return self.score + "\n" + self.__latency.summary()
+
+    def next_problem(self):
+        """
+        Moves to the next problem. In no-repeat mode seen problems are
+        skipped, until so many come in a row that the space is taken to be
+        used up, and a new round starts.
+        """
+        for _ in range(NO_REPEAT_ATTEMPTS):
+            operands, answer, operators = self.__problems.pop()
+            operators = operators or self.__operator
+            if self.__seen is None or self.__seen.add(operands, operators):
+                break
+        else:
+            self.__seen.clear()
+            self.__seen.add(operands, operators)
+
+        self.__operands, self.__answer = operands, answer
+        self.__problem_operator = operators
+        self.__shown_at = self.__clock()
+
+    def check(self, uanswer):
+        """
+        Checks the user answer against the current problem.
+        :param uanswer: user answer string. Empty is a skip.
+        :return: True if correct.
+        :raises ValueError: if the answer isn't an integer or empty.
+        """
+        if uanswer == "":
+            return False
+
+        return int(uanswer) == self.__answer
+
+    def record(self, correct, uanswer=""):
+        """
+        Updates the counters and response time stats with one answer.
+        :param correct: boolean; answer is correct/not.
+        :param uanswer: user answer string, only used for the log.
+        """
+        latency = self.__clock() - self.__shown_at
+        self.__latency.add(latency)
+        self.__generator.feedback(self.__operands, correct, latency)
+        self.__answers_all += 1
+
+        if correct:
+            self.__answers_correct += 1
+
+        if self.__log is not None:
+            self.__log.append(self.__operands, self.__problem_operator,
+                              self.__answer, uanswer, correct, latency,
+                              session=self.__session)
+
+    def submit(self, uanswer):
+        """
+        Full turn for headless use: check, record and move to next problem.
+        :param uanswer: user answer string.
+        :return: True if correct.
+        :raises ValueError: if the answer isn't an integer or empty.
+        """
+        correct = self.check(uanswer)
+        self.record(correct, uanswer)
+        self.next_problem()
+        return correct
+
+
+class Countdown:
+    """
+    Countdown timer with a fixed deadline on the monotonic clock. Every tick
+    recalculates the time left from the clock, so late callbacks don't add
+    up, and the next tick is aimed at the next resolution step.
+    """
+    def __init__(self, after, after_cancel, on_tick, on_expire,
+                 resolution=TIMER_RESOLUTION, clock=time.monotonic):
+        """
+        :param after: scheduler, after(ms, func) -> handle. Tk's after().
+        :param after_cancel: cancels a handle from after().
+        :param on_tick: called with the seconds left on every tick.
+        :param on_expire: called once when the time has run out.
+        :param resolution: tick interval in milliseconds.
+        :param clock: time source in seconds.
+        """
+        self.__after = after
+        self.__after_cancel = after_cancel
+        self.__on_tick = on_tick
+        self.__on_expire = on_expire
+        self.__resolution = resolution / 1000
+        self.__clock = clock
+        self.__deadline = None
+        self.__handle = None
+
+    @property
+    def running(self):
+        return self.__deadline is not None
+
+    @property
+    def remaining(self):
+        """
+        :return: seconds left, 0 if not running.
+        """
+        if self.__deadline is None:
+            return 0
+
+        return max(0.0, self.__deadline - self.__clock())
+
+    def start(self, seconds):
+        """
+        Starts (or restarts) the countdown.
+        :param seconds: time limit.
+        """
+        self.cancel()
+        self.__deadline = self.__clock() + seconds
+        self.__tick()
+
+    def cancel(self):
+        """
+        Stops the countdown right away, the pending tick is dropped.
+        """
+        if self.__handle is not None:
+            self.__after_cancel(self.__handle)
+
+        self.__handle = None
+        self.__deadline = None
+
+    def __tick(self):
+        self.__handle = None
+        remaining = self.__deadline - self.__clock()
+
+        if remaining <= 0:
+            self.__deadline = None
+            self.__on_tick(0.0)
+            self.__on_expire()
+            return
+
+        self.__on_tick(remaining)
+
+        # Wake up at the next resolution step, never after the deadline.
+        # Rounding can leave a sliver of a step, that one is skipped.
+        delay = remaining % self.__resolution
+        if delay < 0.001:
+            delay = min(delay + self.__resolution, remaining)
+        self.__handle = self.__after(max(1, ceil(delay * 1000)), self.__tick)
+
+
+class QuantileSketch:
+    """
+    Streaming percentile sketch with logarithmic buckets (like DDSketch).
+    Any percentile is within SKETCH_ACCURACY of the true value. Memory only
+    depends on the spread of the values, and sketches merge by adding up
+    bucket counts.
+    """
+    MIN_VALUE = 1e-6  # Smaller values (and 0) go to the lowest bucket.
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.__gamma = (1 + accuracy) / (1 - accuracy)
+        self.__log_gamma = log(self.__gamma)
+        self.__buckets = {}
+        self.__count = 0
+
+    @property
+    def count(self):
+        return self.__count
+
+    def add(self, value, count=1):
+        """
+        :param value: non-negative value.
+        :param count: weight of the value.
+        """
+        key = ceil(log(max(value, self.MIN_VALUE)) / self.__log_gamma)
+        self.__buckets[key] = self.__buckets.get(key, 0) + count
+        self.__count += count
+
+    def merge(self, other):
+        """
+        Adds another sketch with the same accuracy into this one. Bucket
+        keys depend on gamma, so other sketches' keys don't line up.
+        :raises ValueError: if the sketches have different accuracy.
+        """
+        if other.__gamma != self.__gamma:
+            raise ValueError("Sketches of different accuracy can't be "
+                             "merged.")
+
+        for key, count in other.__buckets.items():
+            self.__buckets[key] = self.__buckets.get(key, 0) + count
+
+        self.__count += other.__count
+
+    def quantile(self, q):
+        """
+        :param q: quantile, 0 - 1.
+        :return: estimated value, 0.0 if the sketch is empty.
+        """
+        if not self.__count:
+            return 0.0
+
+        rank = round(q * (self.__count - 1))
+        seen = 0
+        for key in sorted(self.__buckets):
+            seen += self.__buckets[key]
+            if seen > rank:
+                break
+
+        # Middle of the bucket (gamma^(key-1), gamma^key] in relative terms.
+        return 2 * self.__gamma ** key / (self.__gamma + 1)
+
+    def to_dict(self):
+        return {'gamma': self.__gamma, 'buckets': dict(self.__buckets)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.__gamma = data['gamma']
+        sketch.__log_gamma = log(sketch.__gamma)
+        for key, count in data['buckets'].items():
+            sketch.__buckets[int(key)] = count
+            sketch.__count += count
+
+        return sketch
+
+
+class LatencyStats:
+    """
+    Online response time statistics. Running mean and variance (Welford),
+    percentiles from a QuantileSketch and answers per minute. Every update
+    is O(1) no matter how long the session is.
+    """
+    def __init__(self):
+        self.__count = 0
+        self.__mean = 0.0
+        self.__m2 = 0.0  # Sum of squared differences from the mean.
+        self.__total = 0.0
+        self.__sketch = QuantileSketch()
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def mean(self):
+        return self.__mean
+
+    @property
+    def variance(self):
+        if self.__count < 2:
+            return 0.0
+
+        return self.__m2 / (self.__count - 1)
+
+    @property
+    def stdev(self):
+        return sqrt(self.variance)
+
+    @property
+    def per_minute(self):
+        """
+        :return: answers per minute of answering time.
+        """
+        if not self.__total:
+            return 0.0
+
+        return 60 * self.__count / self.__total
+
+    @property
+    def sketch(self):
+        return self.__sketch
+
+    def add(self, seconds):
+        """
+        :param seconds: time from showing a problem to the answer.
+        """
+        self.__count += 1
+        delta = seconds - self.__mean
+        self.__mean += delta / self.__count
+        self.__m2 += delta * (seconds - self.__mean)
+        self.__total += seconds
+        self.__sketch.add(seconds)
+
+    def merge(self, other):
+        """
+        Combines the stats of another session into this one.
+        """
+        if not other.__count:
+            return
+
+        count = self.__count + other.__count
+        delta = other.__mean - self.__mean
+        self.__m2 += other.__m2 + delta ** 2 * self.__count * other.__count \
+            / count
+        self.__mean += delta * other.__count / count
+        self.__count = count
+        self.__total += other.__total
+        self.__sketch.merge(other.__sketch)
+
+    def percentile(self, p):
+        """
+        :param p: percentile, 0 - 100.
+        :return: response time in seconds.
+        """
+        return self.__sketch.quantile(p / 100)
+
+    def to_dict(self):
+        return {'count': self.__count, 'mean': self.__mean, 'm2': self.__m2,
+                'total': self.__total, 'sketch': self.__sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.__count = data['count']
+        stats.__mean = data['mean']
+        stats.__m2 = data['m2']
+        stats.__total = data['total']
+        stats.__sketch = QuantileSketch.from_dict(data['sketch'])
+        return stats
+
+    def summary(self):
+        """
+        :return: short text summary for the results panel.
+        """
+        return "avg %.2f s, %.1f /min\np50 %.2f  p90 %.2f  p99 %.2f s" % (
+            self.__mean, self.per_minute, self.percentile(50),
+            self.percentile(90), self.percentile(99))
+
+
+def format_time(seconds):
+    """
+    Formats time left for the timer label. Rounds up so that 0 is only shown
+    when the time has really run out.
+    :param seconds: time left.
+    :return: string
+    """
+    if TIMER_RESOLUTION >= 1000:
+        return str(ceil(seconds))
+
+    return "%.1f" % (ceil(seconds * 10) / 10)
+
+
+class SessionLog:
+    """
+    Append-only binary log of attempts. Fixed-width little-endian records
+    after a versioned header, read back with read_session_log().
+    """
+    def __init__(self, path=LOG_FILE, slots=MAX_NUMBERS, writer=None):
+        """
+        Opens the log for appending, creating it if needed.
+        :param path: log file path.
+        :param slots: operand slots per record for a new file.
+        :param writer: optional BackgroundWriter, appends are then written
+                       by its thread instead of the caller.
+        :raises ValueError: if the file isn't a compatible log.
+        :raises OSError: if the file can't be opened.
+        """
+        self.__file = open(path, 'ab+')
+        self.__file.seek(0)
+        header = self.__file.read(LOG_HEADER.size)
+
+        if header:
+            try:
+                slots = parse_log_header(header)
+            except ValueError:
+                self.__file.close()
+                raise
+
+        else:
+            record = log_record_struct(slots)
+            self.__file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION,
+                                              record.size, slots, 0))
+
+        self.__file.flush()
+        self.__slots = slots
+        self.__record = log_record_struct(slots)
+        self.__writer = writer
+
+    def append(self, operands, op, answer, uanswer, correct, latency,
+               timestamp=None, session=None):
+        """
+        Writes one attempt.
+        :param operands: numbers of the problem.
+        :param op: operator, or a tuple of operators for a mixed problem.
+        :param answer: correct answer.
+        :param uanswer: user answer string, empty if skipped.
+        :param correct: boolean; answer is correct/not.
+        :param latency: response time in seconds.
+        :param timestamp: unix time of the answer, defaults to now.
+        :param session: id from start_session() of the attempt's game.
+        """
+        record = self.pack(operands, op, answer, uanswer, correct, latency,
+                           timestamp, session)
+
+        if self.__writer is not None:
+            self.__writer.submit(self, record)
+        else:
+            self.write_batch([record])
+
+    def start_session(self, settings):
+        """
+        Called by GameState for every new game. The binary log doesn't
+        group attempts by game.
+        :return: None, the session of every attempt.
+        """
+        return None
+
+    def write_batch(self, records):
+        """
+        Writes packed records to the file. Used by BackgroundWriter.
+        :param records: list of record bytes.
+        """
+        self.__file.write(b"".join(records))
+        self.__file.flush()
+
+    def pack(self, operands, op, answer, uanswer, correct, latency,
+             timestamp=None, session=None):
+        """
+        :return: one attempt as record bytes. Arguments as in append(),
+                 session isn't stored.
+        """
+        flags = LOG_CORRECT if correct else 0
+
+        try:
+            user = int(uanswer)
+        except ValueError:
+            user = 0
+            flags |= LOG_SKIPPED
+
+        if not -2 ** 63 <= answer < 2 ** 63:
+            answer = 0
+            flags |= LOG_OVERFLOW
+
+        if not -2 ** 63 <= user < 2 ** 63:
+            user = 0
+
+        if isinstance(op, tuple):
+            code = LOG_MIXED
+            operators = b"".join(LOG_OPERATOR_CODES[i] for i in op)
+        else:
+            code = LOG_OPERATOR_CODES[op]
+            operators = b""
+
+        numbers = list(operands) + [0] * (self.__slots - len(operands))
+        return self.__record.pack(
+            time.time() if timestamp is None else timestamp, latency,
+            answer, user, *numbers, len(operands), code, flags, operators)
+
+    def close(self):
+        self.__file.close()
+
+
+class HistoryStore:
+    """
+    Attempt history in SQLite, a drop-in for SessionLog with sessions
+    (games) and attempts. WAL mode, and appends are written in batches, one
+    transaction each. Covering indexes keep the HISTORY_QUERIES fast on
+    tens of millions of attempts.
+    """
+    def __init__(self, path, slots=MAX_NUMBERS, writer=None):
+        """
+        Opens the history, creating it if needed.
+        :param path: database file path.
+        :param slots: operand columns for a new database.
+        :param writer: optional BackgroundWriter, appends are then written
+                       by its thread instead of the caller.
+        :raises ValueError: if the file isn't a compatible history.
+        :raises OSError: if the file can't be opened.
+        """
+        import sqlite3
+
+        # Only one thread (the writer's, if any) uses the connection at a
+        # time, close() runs after the writer has stopped.
+        try:
+            self.__db = sqlite3.connect(path, check_same_thread=False)
+        except sqlite3.Error as error:
+            raise OSError("History could not be opened: %s" % error)
+
+        try:
+            version = self.__db.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                self.__create(slots)
+            elif version != HISTORY_VERSION:
+                raise ValueError("Unsupported history version %s." % version)
+
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as error:
+            self.__db.close()
+            raise ValueError("Not an attempt history: %s" % error)
+        except BaseException:
+            self.__db.close()
+            raise
+
+        self.__slots = history_slots(self.__db)
+        self.__insert = "INSERT INTO attempts VALUES (%s)" % ", ".join(
+            "?" * (8 + self.__slots))
+        self.__writer = writer
+        self.__rng = Random()
+
+    def start_session(self, settings):
+        """
+        Starts a new session. Attempts appended with its id belong to it.
+        :param settings: settings dict of the game.
+        :return: session id.
+        """
+        import json
+
+        # Random ids, so programs sharing a file never pick the same one.
+        session = self.__rng.getrandbits(63)
+        row = (session, time.time(), json.dumps(settings))
+
+        if self.__writer is not None:
+            self.__writer.call(self.__insert_session, row)
+        else:
+            self.__insert_session(row)
+        return session
+
+    def append(self, operands, op, answer, uanswer, correct, latency,
+               timestamp=None, session=None):
+        """
+        Writes one attempt. Arguments as in SessionLog.append().
+        """
+        row = self.pack(operands, op, answer, uanswer, correct, latency,
+                        timestamp, session)
+
+        if self.__writer is not None:
+            self.__writer.submit(self, row)
+        else:
+            self.write_batch([row])
+
+    def pack(self, operands, op, answer, uanswer, correct, latency,
+             timestamp=None, session=None):
+        """
+        :return: one attempt as a row of the attempts table. Numbers that
+                 don't fit into SQLite's int64 are stored as NULL.
+        """
+        try:
+            user = int(uanswer)
+        except ValueError:
+            user = None  # Skipped.
+
+        numbers = [int(i) for i in operands]
+        numbers += [None] * (self.__slots - len(numbers))
+        return (session,
+                time.time() if timestamp is None else timestamp, latency,
+                "".join(op) if isinstance(op, tuple) else op,
+                len(operands), *numbers,
+                answer if -2 ** 63 <= answer < 2 ** 63 else None,
+                user if user is None or -2 ** 63 <= user < 2 ** 63 else None,
+                1 if correct else 0)
+
+    def write_batch(self, rows):
+        """
+        Inserts rows in one transaction. Used by BackgroundWriter.
+        :param rows: list of rows from pack().
+        """
+        with self.__db:
+            self.__db.executemany(self.__insert, rows)
+
+    def close(self):
+        self.__db.close()
+
+    def __insert_session(self, row):
+        with self.__db:
+            self.__db.execute("INSERT INTO sessions VALUES (?, ?, ?)", row)
+
+    def __create(self, slots):
+        numbers = ["n%d" % i for i in range(slots)]
+        with self.__db:
+            self.__db.execute(
+                "CREATE TABLE sessions (id INTEGER PRIMARY KEY, "
+                "started REAL, settings TEXT)")
+            # operator is the operator, or all of a mixed problem's ones.
+            # user_answer is NULL when skipped.
+            self.__db.execute(
+                "CREATE TABLE attempts (session INTEGER, timestamp REAL, "
+                "latency REAL, operator TEXT, numbercount INTEGER, %s, "
+                "answer INTEGER, user_answer INTEGER, correct INTEGER)"
+                % ", ".join(i + " INTEGER" for i in numbers))
+            # Facts in index order, with everything the fact queries read.
+            self.__db.execute(
+                "CREATE INDEX attempts_fact ON attempts (operator, "
+                "numbercount, %s, timestamp, latency, correct)"
+                % ", ".join(numbers))
+            # Trends and per-operator totals over a time span.
+            self.__db.execute(
+                "CREATE INDEX attempts_time ON attempts (timestamp, "
+                "operator, latency, correct)")
+            self.__db.execute("PRAGMA user_version = %d" % HISTORY_VERSION)
+
+
+def history_slots(db):
+    """
+    :param db: sqlite3 connection to a history.
+    :return: amount of operand columns.
+    """
+    columns = [row[1] for row in db.execute("PRAGMA table_info(attempts)")]
+    return sum(1 for i in columns if i[0] == 'n' and i[1:].isdigit())
+
+
+def slowest_facts_query(slots):
+    """
+    :param slots: operand columns of the history.
+    :return: SQL for the facts with the slowest average response time.
+             Parameters: operator, low, high, since, min_count, limit.
+    """
+    numbers = ["n%d" % i for i in range(slots)]
+    # Unused operand columns are NULL and don't limit the range.
+    in_range = " AND ".join("coalesce(%s, :low) BETWEEN :low AND :high" % i
+                            for i in numbers)
+    return (
+        "SELECT numbercount, %s, count(*) AS attempts, "
+        "avg(latency) AS latency, avg(correct) AS accuracy "
+        "FROM attempts WHERE operator = :operator AND timestamp >= :since "
+        "AND %s GROUP BY numbercount, %s HAVING count(*) >= :min_count "
+        "ORDER BY latency DESC LIMIT :limit"
+        % (", ".join(numbers), in_range, ", ".join(numbers)))
+
+
+# Prebuilt analytics queries. Every one takes the since parameter, a unix
+# time. Functions get the operand column count.
+HISTORY_QUERIES = {
+    'slowest': slowest_facts_query,
+    'accuracy': lambda slots: (
+        "SELECT date(timestamp, 'unixepoch', 'localtime') AS day, "
+        "count(*) AS attempts, avg(correct) AS accuracy, "
+        "avg(latency) AS latency FROM attempts WHERE timestamp >= :since "
+        "GROUP BY day ORDER BY day"),
+    'throughput': lambda slots: (
+        "SELECT operator, count(*) AS attempts, "
+        "60 * count(*) / sum(latency) AS per_minute, "
+        "avg(correct) AS accuracy FROM attempts WHERE timestamp >= :since "
+        "GROUP BY operator ORDER BY attempts DESC")
+}
+
+
+def query_history(path, name, **params):
+    """
+    Runs one of the HISTORY_QUERIES on a history, read-only.
+    :param path: database file path.
+    :param name: query name.
+    :param params: query parameters. since defaults to HISTORY_DAYS ago,
+                   min_count to HISTORY_MIN_COUNT and limit to 20.
+    :return: column names, list of rows.
+    :raises sqlite3.Error: if the file can't be read as a history.
+    """
+    import sqlite3
+
+    params.setdefault('since', time.time() - HISTORY_DAYS * 86400)
+    params.setdefault('min_count', HISTORY_MIN_COUNT)
+    params.setdefault('limit', 20)
+
+    uri = "file:%s?mode=ro" % os.path.abspath(path).replace('?', '%3f')
+    db = sqlite3.connect(uri, uri=True)
+    try:
+        cursor = db.execute(HISTORY_QUERIES[name](history_slots(db)), params)
+        return [i[0] for i in cursor.description], cursor.fetchall()
+    finally:
+        db.close()
+
+
+class BackgroundWriter:
+    """
+    Dedicated thread for disk I/O so the Tk main loop never waits on a
+    write. Records are queued in a bounded queue and written in batches,
+    other I/O jobs run in submission order.
+    """
+    # Job kinds in the queue.
+    __RECORD = 0
+    __CALL = 1
+    __FLUSH = 2
+    __CLOSE = 3
+
+    def __init__(self, max_queue=WRITER_QUEUE_SIZE,
+                 batch_size=WRITER_BATCH_SIZE,
+                 flush_interval=WRITER_FLUSH_INTERVAL):
+        """
+        :param max_queue: jobs waiting before submit() blocks.
+        :param batch_size: records pending before they are written.
+        :param flush_interval: max seconds a record waits to be written.
+        """
+        self.__queue = queue.Queue(max_queue)
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__errors = []
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="MAT writer", daemon=True)
+        self.__thread.start()
+
+    @property
+    def errors(self):
+        """
+        :return: exceptions raised by write jobs so far.
+        """
+        return list(self.__errors)
+
+    def submit(self, target, record):
+        """
+        Queues a record for target.write_batch(records).
+        :param target: object with a write_batch() method, e.g. SessionLog.
+        :param record: record to write.
+        """
+        self.__put(self.__RECORD, target, record)
+
+    def call(self, func, *args):
+        """
+        Queues any I/O job, e.g. write_cfg(). Pending records are written
+        before it runs.
+        """
+        self.__put(self.__CALL, func, args)
+
+    def flush(self):
+        """
+        Blocks until everything submitted so far has been written.
+        """
+        done = threading.Event()
+        self.__put(self.__FLUSH, done.set, ())
+        done.wait()
+
+    def close(self):
+        """
+        Writes everything still queued and stops the thread.
+        """
+        if self.__closed:
+            return
+
+        self.__put(self.__CLOSE, None, None)
+        self.__closed = True
+        self.__thread.join()
+
+    def __put(self, kind, target, payload):
+        if self.__closed:
+            raise RuntimeError("Writer is closed.")
+
+        self.__queue.put((kind, target, payload))
+
+    def __run(self):
+        pending = {}  # target: records, in submission order.
+        pending_count = 0
+        deadline = None  # When the oldest pending record must be written.
+
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+
+            try:
+                kind, target, payload = self.__queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+
+            # Records are gathered until the batch is full or it's time.
+            if kind == self.__RECORD:
+                pending.setdefault(target, []).append(payload)
+                pending_count += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.__flush_interval
+
+                if pending_count < self.__batch_size and \
+                        time.monotonic() < deadline:
+                    continue
+
+            # Anything else first writes out the pending records.
+            for batch_target, records in pending.items():
+                self.__guard(batch_target.write_batch, (records,))
+
+            pending = {}
+            pending_count = 0
+            deadline = None
+
+            if kind == self.__CLOSE:
+                return
+
+            elif kind in (self.__CALL, self.__FLUSH):
+                self.__guard(target, payload)
+
+    def __guard(self, func, args):
+        # A failed write must not take the thread down with it.
+        try:
+            func(*args)
+        except Exception as error:
+            self.__errors.append(error)
+
+
+def log_record_struct(slots):
+    """
+    :param slots: operand slots per record.
+    :return: struct.Struct of one record. Padded to 8 bytes so the NumPy
+             view of the records stays aligned. The padding holds the
+             operators of mixed problems.
+    """
+    return struct.Struct('<ddqq%dqBcB%ds' % (slots, LOG_OPERATOR_SLOTS))
+
+
+def log_dtype(slots):
+    """
+    :param slots: operand slots per record.
+    :return: NumPy structured dtype matching log_record_struct().
+    """
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('latency', '<f8'),
+        ('answer', '<i8'),
+        ('user_answer', '<i8'),
+        ('operands', '<i8', (slots,)),
+        ('numbercount', 'u1'),
+        ('operator', 'S1'),
+        ('flags', 'u1'),
+        ('operators', 'S%d' % LOG_OPERATOR_SLOTS)
+    ])
+
+
+def parse_log_header(header):
+    """
+    Validates a log header.
+    :param header: header bytes.
+    :return: operand slots per record.
+    :raises ValueError: if the header isn't a compatible log header.
+    """
+    if len(header) < LOG_HEADER.size:
+        raise ValueError("Log header is truncated.")
+
+    magic, version, size, slots, _ = LOG_HEADER.unpack(
+        header[:LOG_HEADER.size])
+
+    if magic != LOG_MAGIC:
+        raise ValueError("Not an attempt log.")
+
+    if version != LOG_VERSION:
+        raise ValueError("Unsupported log version %s." % version)
+
+    if size != log_record_struct(slots).size:
+        raise ValueError("Log record size doesn't match its header.")
+
+    return slots
+
+
+def read_session_log(path=LOG_FILE):
+    """
+    Memory-maps a log without parsing it. Records are a zero-copy NumPy
+    structured array, fields as in log_dtype().
+    :param path: log file path.
+    :return: read-only record array.
+    :raises ValueError: if the file isn't a compatible log.
+    """
+    if not HAVE_NUMPY:
+        raise RuntimeError("Reading the attempt log needs NumPy.")
+
+    with open(path, 'rb') as logfile:
+        slots = parse_log_header(logfile.read(LOG_HEADER.size))
+
+    dtype = log_dtype(slots)
+    # A crash can leave half a record at the end, it is left out.
+    count = (os.path.getsize(path) - LOG_HEADER.size) // dtype.itemsize
+
+    if count == 0:  # mmap can't map an empty range.
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode='r', offset=LOG_HEADER.size,
+                     shape=(count,))
+
+
+def iter_session_log(path, offset=0):
+    """
+    Streams a log's records without NumPy.
+    :param path: log file path.
+    :param offset: file offset to start from, 0 for the first record.
+    :return: generator of (record tuple as in log_record_struct(), offset
+             after it).
+    :raises ValueError: if the file isn't a compatible log.
+    """
+    with open(path, 'rb') as logfile:
+        slots = parse_log_header(logfile.read(LOG_HEADER.size))
+        record = log_record_struct(slots)
+        offset = max(offset, LOG_HEADER.size)
+        logfile.seek(offset)
+
+        while True:
+            data = logfile.read(record.size * 4096)
+            # A crash can leave half a record at the end, it is left out.
+            usable = len(data) - len(data) % record.size
+            for values in record.iter_unpack(data[:usable]):
+                offset += record.size
+                yield values, offset
+
+            if len(data) < record.size * 4096:
+                return
+
+
+def open_session_log(path=LOG_FILE, writer=None):
+    """
+    Opens the attempt log for the GUI. Problems are shown but don't stop
+    the program, it just runs without logging.
+    :param path: log file, a HistoryStore if it ends in HISTORY_SUFFIX.
+    :param writer: optional BackgroundWriter for the appends.
+    :return: SessionLog, HistoryStore or None.
+    """
+    try:
+        if path.endswith(HISTORY_SUFFIX):
+            return HistoryStore(path, writer=writer)
+
+        return SessionLog(path, writer=writer)
+
+    except (OSError, ValueError) as error:
+        showerror("File error", "The attempt log could not be opened, "
+                                "attempts will not be saved.\n\n%s" % error)
+        return None
+
+
+def clear_field(field):
+    """
+    Clears answer input field when keyboard button is pressed.
+    :param field: the text field object
+    """
+    field.delete(0, tk.END)
+
+
+def showerror(title, message):
+    """
+    Error dialog when the GUI is running, stderr otherwise.
+    """
+    if isinstance(tk, LazyModule):  # tkinter not loaded, no GUI.
+        print("%s: %s" % (title, message), file=sys.stderr)
+        return
+
+    from tkinter.messagebox import showerror as dialog
+    dialog(title, message)
+
+
+def showinfo(title, message):
+    """
+    Info dialog when the GUI is running, stdout otherwise.
+    """
+    if isinstance(tk, LazyModule):
+        print("%s\n\n%s" % (title, message))
+        return
+
+    from tkinter.messagebox import showinfo as dialog
+    dialog(title, message)
+
+
+def help_message():
+    """
+    Help message.
+    """
+    showinfo(
+        "Help",
+        "This program is for training mental arithmetic.\n\n"
+        "The numbers setting lets you change how many numbers there will be in"
+        " the calculation. (2 - %s)\n\n"
+        "The range setting lets you choose the range in which the "
+        "numbers are randomly chosen from. (%s - %s)\n\n"
+        "The operator setting will let you choose the calculation method."
+        " Division problems always come out even.\n\n"
+        "Time limit: you can set a timer. If it is set to 0, timer will be"
+        " disabled. (0 - %s)\n\n"
+        "Adaptive: shows the problems you answer wrong or slowly more often."
+        " Only for 2 numbers.\n\n"
+        "Constraints: keep every step's result 0 or more, avoid carrying and"
+        " borrowing, use different numbers, or limit the result (0 means no"
+        " limit). Problems are worked from left to right.\n\n"
+        "Mixed operators: every problem gets its own +, - and · operators."
+        " · is calculated before + and -.\n\n"
+        "No repeats: a problem isn't shown again until (nearly) all of them"
+        " have been shown.\n\n"
+        "Difficulty: only shows problems of one difficulty, from 1 (easiest)"
+        " to %s, judged by the digits, carrying and the size of the result."
+        " 0 shows any. Only for 2 numbers.\n\n"
+        "When the game is started, simply write the correct answer and "
+        "press the ENTER button to submit it and move on to the next one."
+        " The game will run until you press start or until timer runs out."
+        " Pressing ENTER when the answer box is empty will skip.\n\n"
+        "Your current and previous scores will be shown in the bottom."
+        % (MAX_NUMBERS, -RANGE_LIMIT, RANGE_LIMIT, MAX_TIME_LIMIT,
+           DIFFICULTY_BANDS)
+    )
+
+
+class ConfigStore:
+    """
+    Settings file with named profiles. Lines are 'setting;value' like
+    before, each profile starts with a '[name]' line. Lines before the first
+    profile line belong to LEGACY_PROFILE, so old files keep working. A
+    faulty line only makes its own profile faulty, the other profiles load.
+    Saves are written to a temporary file and renamed over the old one, so
+    a crash can't leave a half-written file.
+    """
+    def __init__(self, path=CFG_FILE):
+        """
+        :param path: config file path.
+        """
+        self.__path = path
+        # Parsed file and its stat, reused until the file changes on disk.
+        self.__cache = None  # (mtime_ns, size, digest, profiles, faulty)
+
+    @property
+    def path(self):
+        return self.__path
+
+    def profile_names(self):
+        """
+        :return: saved profile names, [] if the file is missing or faulty.
+        """
+        try:
+            return list(self.__profiles()[0])
+        except (OSError, ValueError):
+            return []
+
+    def load(self, profile):
+        """
+        Loads a profile. Profiles that haven't been saved yet start from
+        LEGACY_PROFILE and then from defaults.
+        :param profile: profile name.
+        :return: settings dict (a copy).
+        :raises OSError: if the file can't be read.
+        :raises ValueError: if the file or the profile is faulty.
+        """
+        profiles, faulty = self.__profiles()
+
+        for name in (profile, LEGACY_PROFILE):
+            if name in faulty:
+                raise ValueError("Profile %r is faulty." % name)
+
+            if name in profiles:
+                return profiles[name].copy()
+
+        return defaults.copy()
+
+    def save(self, profile, settings):
+        """
+        Saves one profile, the other profiles in the file are kept, faulty
+        values in them as defaults. Nothing is written if the file already
+        has exactly this content.
+        :param profile: profile name.
+        :param settings: settings dict.
+        :return: True if the file was written.
+        """
+        try:
+            profiles = self.__profiles()[0].copy()
+        except (OSError, ValueError):  # Replace a missing or broken file.
+            profiles = {}
+
+        profiles[profile] = settings.copy()
+        return self.__store(profiles)
+
+    def reset(self, profile):
+        """
+        Sets one profile to defaults. Used when it is faulty. The other
+        profiles are kept, only a file that can't be read at all is
+        replaced.
+        """
+        try:
+            profiles = self.__profiles()[0].copy()
+        except (OSError, ValueError):
+            profiles = {}
+
+        profiles[profile] = defaults.copy()
+        self.__cache = None  # Always written.
+        self.__store(profiles)
+
+    def __store(self, profiles):
+        # Writes the profiles unless the file already holds exactly them.
+        # Returns True if the file was written.
+        text = self.__format(profiles)
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        if self.__cache is not None and self.__cache[2] == digest:
+            return False
+
+        self.__write(text)
+        info = os.stat(self.__path)
+        self.__cache = (info.st_mtime_ns, info.st_size, digest, profiles,
+                        frozenset())
+        return True
+
+    def __profiles(self):
+        # The cache is valid as long as the file's mtime and size match.
+        info = os.stat(self.__path)
+        if self.__cache is not None and \
+                self.__cache[:2] == (info.st_mtime_ns, info.st_size):
+            return self.__cache[3:]
+
+        with open(self.__path, 'rb') as confile:
+            data = confile.read()
+
+        profiles, faulty = self.__parse(data.decode('utf-8'))
+        self.__cache = (info.st_mtime_ns, info.st_size,
+                        hashlib.sha256(data).hexdigest(), profiles, faulty)
+        return profiles, faulty
+
+    @staticmethod
+    def __parse(text):
+        # Returns {name: settings}, names of the faulty profiles. Faulty
+        # values are left out of their profile.
+        profiles = {}
+        faulty = set()
+        name = None
+
+        for i in text.splitlines():
+            line = i.strip()
+            if not line:
+                continue
+
+            if line.startswith('[') and line.endswith(']'):
+                name = line[1:-1]
+                profiles.setdefault(name, {})
+                continue
+
+            if name is None:
+                name = LEGACY_PROFILE
+                profiles.setdefault(name, {})
+
+            try:
+                setting, value = line.split(';', 1)
+                # Unknown settings are ignored, types follow the defaults.
+                if setting in defaults:
+                    profiles[name][setting] = \
+                        type(defaults[setting])(value)
+            except ValueError:
+                faulty.add(name)
+
+        # Settings missing from a profile (older versions) use defaults.
+        for name in profiles:
+            profiles[name] = dict(defaults, **profiles[name])
+
+        return profiles, frozenset(faulty)
+
+    @staticmethod
+    def __format(profiles):
+        lines = []
+
+        for name, settings in profiles.items():
+            lines.append("[%s]" % name)
+            for i in settings:
+                line_words = [i, str(settings[i])]
+                lines.append(";".join(line_words))
+
+        return "\n".join(lines) + "\n"
+
+    def __write(self, text):
+        directory = os.path.dirname(os.path.abspath(self.__path))
+        handle, temp_path = tempfile.mkstemp(prefix='.MAT.', suffix='.tmp',
+                                             dir=directory)
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as newfile:
+                newfile.write(text)
+                newfile.flush()
+                os.fsync(newfile.fileno())
+
+            # mkstemp makes the file private, keep the old file's mode.
+            try:
+                os.chmod(temp_path,
+                         stat.S_IMODE(os.stat(self.__path).st_mode))
+            except OSError:
+                pass
+
+            os.replace(temp_path, self.__path)
+
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+# Shared store for CFG_FILE.
+CONFIG = ConfigStore()
+
+
+def default_profile():
+    """
+    Profile used at launch: MAT_PROFILE from the environment, otherwise the
+    user's login name so users sharing a machine get their own settings.
+    :return: profile name.
+    """
+    profile = os.environ.get('MAT_PROFILE')
+    if profile:
+        return profile
+
+    try:
+        return getpass.getuser()
+    except Exception:  # No login name available.
+        return LEGACY_PROFILE
+
+
+def write_cfg(settings, profile=LEGACY_PROFILE, config=CONFIG):
+    """
+    Saves settings into a profile of the config file.
+    :param settings: program settings dict
+    :param profile: profile name.
+    :param config: ConfigStore to save into.
+    """
+    config.save(profile, settings)
+
+
+def read_cfg(profile=LEGACY_PROFILE, config=CONFIG):
+    """
+    Reads a profile's settings from file into program. Resets the profile
+    if any error occurs during reading & processing.
+    :param profile: profile name.
+    :param config: ConfigStore to read from.
+    :return: settings
+    """
+    try:
+        return config.load(profile)
+
+    except ValueError:
+        showerror("File error", "The settings in the configuration file are "
+                                "faulty.\nThey are reset to defaults.")
+        try:
+            config.reset(profile)
+        except OSError:  # E.g. read-only directory, run with defaults.
+            pass
+        return defaults.copy()
+
+    except OSError:  # Create new cfg if no file.
+        showerror("File error", "The configuration file was not found or could"
+                                " not be accessed. A new one will be created. "
+                                "\nIf this is the first time you're launching"
+                                "the program, this is supposed to happen.")
+        try:
+            config.reset(profile)
+        except OSError:  # E.g. read-only directory, run with defaults.
+            pass
+        return defaults.copy()
+
+
+class Instrumentation:
+    """
+    Timers around hot-path functions. Each function's call times go into
+    a LatencyStats, whose sketch is a log-bucket histogram. The functions
+    are replaced on their class by timed wrappers, so nothing is changed
+    until install() is called.
+    """
+    def __init__(self, targets=None):
+        """
+        :param targets: (class, attribute name) pairs of the functions to
+                        time, INSTRUMENTED if None.
+        """
+        if targets is None:
+            targets = [(globals()[owner], attribute) for owner, attribute in
+                       (i.split('.') for i in INSTRUMENTED)]
+
+        self.__targets = targets
+        self.__stats = {}
+        self.__originals = []  # (owner, attribute, original function)
+
+    @property
+    def stats(self):
+        """
+        :return: {name: LatencyStats of the call times}
+        """
+        return dict(self.__stats)
+
+    def install(self):
+        """
+        Wraps every target. Instances created before this are covered
+        too, except for methods they already keep a reference to.
+        """
+        for owner, attribute in self.__targets:
+            original = owner.__dict__[attribute]
+            name = "%s.%s" % (owner.__name__, attribute)
+            setattr(owner, attribute, self.__timed(original, name))
+            self.__originals.append((owner, attribute, original))
+
+    def uninstall(self):
+        """
+        Puts the original functions back. The stats are kept.
+        """
+        for owner, attribute, original in reversed(self.__originals):
+            setattr(owner, attribute, original)
+
+        self.__originals = []
+
+    def report(self):
+        """
+        :return: table of the call times, slowest total first. Functions
+                 that weren't called are left out.
+        """
+        lines = ["%-40s %8s %10s %9s %9s %9s %9s" % (
+            "function", "calls", "total ms", "mean us", "p50 us", "p90 us",
+            "p99 us")]
+        called = [i for i in self.__stats.items() if i[1].count]
+        for name, stats in sorted(called, key=lambda item: -item[1].mean *
+                                  item[1].count):
+            lines.append("%-40s %8d %10.2f %9.1f %9.1f %9.1f %9.1f" % (
+                name, stats.count, 1e3 * stats.mean * stats.count,
+                1e6 * stats.mean, 1e6 * stats.percentile(50),
+                1e6 * stats.percentile(90), 1e6 * stats.percentile(99)))
+        return "\n".join(lines)
+
+    def __timed(self, func, name):
+        stats = self.__stats.setdefault(name, LatencyStats())
+        clock = time.perf_counter
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add(clock() - start)
+
+        return timed
+
+
+def format_problem(operands, op):
+    """
+    :param op: operator, or a tuple of operators for a mixed problem.
+    :return: problem as text, e.g. '12 + 7'.
+    """
+    if isinstance(op, tuple):
+        text = str(operands[0])
+        for operator, number in zip(op, operands[1:]):
+            text += " %s %s" % (operator, number)
+        return text
+
+    return (" %s " % op).join(str(i) for i in operands)
+
+
+def run_cli(settings, log=None, read=input, write=print):
+    """
+    Terminal drill. Same game loop as ArithmeticProgram: GameState checks
+    and records the answers, empty answer skips. Runs until the time limit,
+    'q' or end of input.
+    :param settings: validated settings dict.
+    :param log: optional SessionLog.
+    :param read: input function, prompt -> line.
+    :param write: output function.
+    :return: the finished GameState.
+    """
+    # One player doesn't need NumPy batches, and skipping it keeps the
+    # startup fast.
+    game = GameState(settings, log=log,
+                     generator=make_generator(settings, vectorized=False))
+    deadline = None
+    if settings['time_limit'] != 0:
+        deadline = time.monotonic() + settings['time_limit']
+
+    write("Empty answer skips, q quits.")
+
+    while True:
+        prompt = format_problem(game.operands, game.operator) + " = "
+        if deadline is not None:
+            prompt = "[%s] %s" % (format_time(deadline - time.monotonic()),
+                                  prompt)
+
+        try:
+            uanswer = read(prompt).strip()
+        except EOFError:
+            break
+
+        if uanswer == 'q':
+            break
+
+        # Answers given after the time ran out don't count.
+        if deadline is not None and time.monotonic() >= deadline:
+            write("Time is up.")
+            break
+
+        try:
+            correct = game.check(uanswer)
+        except ValueError:
+            write("Input can only be an integer or empty")
+            continue
+
+        if not correct:
+            write("Wrong, the answer was %s." % game.answer)
+
+        game.record(correct, uanswer)
+        game.next_problem()
+
+    if game.answers_all:
+        write(game.summary)
+
+    return game
+
+
+class SimulatedClock:
+    """
+    Clock for simulations, moved forward by hand instead of waiting.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class PerfectBot:
+    """
+    Simulated player that always answers right after a fixed time.
+    """
+    def __init__(self, latency=1.0, seed=None):
+        self.__latency = latency
+
+    def answer(self, game):
+        """
+        :param game: GameState showing the problem.
+        :return: answer string, response time in seconds.
+        """
+        return str(game.answer), self.__latency
+
+
+class RandomBot:
+    """
+    Simulated player that types a random number near the answer, or skips.
+    """
+    def __init__(self, latency=1.0, seed=None):
+        self.__latency = latency
+        self.__rng = Random(seed)
+
+    def answer(self, game):
+        guess = self.__rng.randint(-2, 2)
+        if guess == 2:
+            return "", self.__latency
+        return str(game.answer + guess), self.__latency
+
+
+class HumanBot:
+    """
+    Simulated player with log-normal response times, the usual shape of
+    human ones. Longer problems take longer and are more often wrong.
+    """
+    def __init__(self, median=3.0, sigma=0.5, accuracy=0.9, seed=None):
+        """
+        :param median: median response time for 2 numbers in seconds.
+        :param sigma: spread of the log of the response times.
+        :param accuracy: chance of a right answer for 2 numbers.
+        """
+        self.__mu = log(median)
+        self.__sigma = sigma
+        self.__accuracy = accuracy
+        self.__rng = Random(seed)
+
+    def answer(self, game):
+        steps = len(game.operands) - 1
+        latency = steps * self.__rng.lognormvariate(self.__mu, self.__sigma)
+        if self.__rng.random() < self.__accuracy ** steps:
+            return str(game.answer), latency
+        return str(game.answer + 1), latency
+
+
+BOTS = {'perfect': PerfectBot, 'random': RandomBot, 'human': HumanBot}
+
+
+def simulate(settings, bot, turns, log=None, trace=False, seed=None):
+    """
+    Plays games headlessly with a bot, through the same GameState calls
+    as ArithmeticProgram: check and record (answer_process and
+    advance_turn), next_problem and the refill when the buffer is low
+    (set_new_calculation). Time is simulated from the bot's response
+    times, and a new game is started whenever the time limit runs out.
+    :param settings: validated settings dict.
+    :param bot: player with an answer(game) method, e.g. HumanBot().
+    :param turns: amount of answers to play.
+    :param log: optional SessionLog that gets every attempt.
+    :param trace: measure memory with tracemalloc: what the run keeps per
+                  turn and the peak. Slows the run down, so the speed is
+                  then not representative.
+    :param seed: optional seed for the problems.
+    :return: report dict.
+    """
+    import tracemalloc
+
+    clock = SimulatedClock()
+    generator = make_generator(settings, seed)
+    game = None
+    games = 0
+    correct_total = 0  # Of finished games, only the counts are kept.
+
+    if trace:
+        tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+
+    for _ in range(turns):
+        if game is None or settings['time_limit'] and \
+                clock.now >= settings['time_limit']:
+            if game is not None:
+                correct_total += game.answers_correct
+            clock.now = 0.0
+            game = GameState(settings, clock, log, generator)
+            games += 1
+
+        uanswer, latency = bot.answer(game)
+        clock.now += latency
+        correct = game.check(uanswer)
+        game.record(correct, uanswer)
+        game.next_problem()
+        if game.problems.low:
+            game.problems.refill()
+
+    elapsed = time.perf_counter() - start
+    report = {
+        'turns': turns,
+        'games': games,
+        'seconds': elapsed,
+        'turns_per_second': turns / elapsed if elapsed else 0.0,
+        'correct': correct_total + (game.answers_correct if game else 0)
+    }
+
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Still allocated at the end, what a long session would grow by.
+        report['retained_bytes_per_turn'] = (current - start_memory) / turns
+        report['peak_bytes'] = peak - start_memory
+
+    return report
+
+
+def run_simulation(settings, bot_name, turns, seed=None, write=print):
+    """
+    Runs simulate() twice, once for speed and once with allocation
+    tracing, and prints a report.
+    :param settings: validated settings dict.
+    :param bot_name: key of BOTS.
+    :param turns: amount of answers per run.
+    :param seed: optional seed for the bot and the problems, the same
+                 seed plays the same games.
+    :param write: output function.
+    :return: report dict.
+    """
+    report = simulate(settings, BOTS[bot_name](seed=seed), turns,
+                      seed=seed)
+    traced = simulate(settings, BOTS[bot_name](seed=seed), turns,
+                      trace=True, seed=seed)
+    report['retained_bytes_per_turn'] = traced['retained_bytes_per_turn']
+    report['peak_bytes'] = traced['peak_bytes']
+
+    write("%s bot, %s turns in %s games: %.0f turns/s, %.1f us/turn"
+          % (bot_name, turns, report['games'], report['turns_per_second'],
+             1e6 * report['seconds'] / turns))
+    write("correct %s, memory retained %+.1f bytes/turn, peak %.1f kB"
+          % (report['correct'], report['retained_bytes_per_turn'],
+             report['peak_bytes'] / 1024))
+    return report
+
+
+def time_per_call(func):
+    """
+    :param func: function without arguments.
+    :return: best time of one call in seconds, over BENCH_REPEAT runs long
+             enough for the clock (like timeit's autorange).
+    """
+    import timeit
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(BENCH_REPEAT, number)) / number
+
+
+def bench_generation():
+    """
+    Problem generation throughput per operator and amount of numbers, with
+    the same generator the game uses.
+    :return: {name: (microseconds per problem, "us")}
+    """
+    results = {}
+    for op in OPERATORS:
+        for numcount in range(2, MAX_NUMBERS + 1):
+            settings = dict(defaults, operator=op, numbercount=numcount)
+            if settings_errors(settings)[0]:  # E.g. no division chains.
+                continue
+
+            generator = make_generator(settings, seed=0)
+            seconds = time_per_call(lambda: generator.generate(PREFETCH_SIZE))
+            results["generate %s x%d" % (op, numcount)] = \
+                (1e6 * seconds / PREFETCH_SIZE, "us")
+
+    return results
+
+
+def bench_get_answer():
+    """
+    get_answer() with every number at the RANGE_LIMIT extremes, where the
+    products are largest.
+    :return: {name: (nanoseconds per call, "ns")}
+    """
+    results = {}
+    for op in OPERATORS:
+        for numcount in (2, MAX_NUMBERS):
+            for sign, name in ((1, "max"), (-1, "min")):
+                numbers = [sign * RANGE_LIMIT] * numcount
+                results["get_answer %s x%d %s" % (op, numcount, name)] = \
+                    (1e9 * time_per_call(lambda: get_answer(numbers, op)),
+                     "ns")
+
+    return results
+
+
+def bench_config():
+    """
+    Config saves (atomic replace with fsync) and loads, from a fresh
+    ConfigStore and from the parsed cache, in a temporary directory.
+    :return: {name: (milliseconds per call, "ms")}
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = directory + '/MAT.cfg'
+        store = ConfigStore(path)
+        settings = [defaults.copy(), dict(defaults, time_limit=60)]
+        turn = [0]
+
+        def save():  # Alternates so that every save is written.
+            turn[0] ^= 1
+            store.save(LEGACY_PROFILE, settings[turn[0]])
+
+        save()
+        return {
+            "config save": (1e3 * time_per_call(save), "ms"),
+            "config load": (1e3 * time_per_call(
+                lambda: ConfigStore(path).load(LEGACY_PROFILE)), "ms"),
+            "config load cached": (1e3 * time_per_call(
+                lambda: store.load(LEGACY_PROFILE)), "ms")
+        }
+
+
+def bench_countdown(seed=0):
+    """
+    Runs a Countdown over a full MAX_TIME_LIMIT session on a simulated
+    clock. Every timer callback comes up to BENCH_TIMER_JITTER seconds late.
+    :return: {"countdown drift": (ms from the deadline to the end, "ms")}
+    """
+    import heapq
+
+    clock = SimulatedClock()
+    rng = Random(seed)
+    pending = []  # (due time, handle, callback)
+    cancelled = set()
+    handles = iter(range(sys.maxsize))
+    expired = []
+
+    def after(ms, func):
+        handle = next(handles)
+        due = clock.now + ms / 1000 + rng.uniform(0, BENCH_TIMER_JITTER)
+        heapq.heappush(pending, (due, handle, func))
+        return handle
+
+    countdown = Countdown(after, cancelled.add, lambda remaining: None,
+                          lambda: expired.append(clock.now), clock=clock)
+    countdown.start(MAX_TIME_LIMIT)
+
+    while pending and not expired:
+        clock.now, handle, func = heapq.heappop(pending)
+        if handle not in cancelled:
+            func()
+
+    return {"countdown drift": (1e3 * (expired[0] - MAX_TIME_LIMIT), "ms")}
+
+
+def virtual_display():
+    """
+    Starts Xvfb on a free display if there is no display yet.
+    :return: Xvfb process to terminate afterwards, None if a display was
+             already there.
+    :raises RuntimeError: if there is no display and no Xvfb.
+    """
+    import shutil
+    import subprocess
+
+    if os.environ.get('DISPLAY'):
+        return None
+
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        raise RuntimeError("no display and Xvfb is not installed")
+
+    number = 99
+    while os.path.exists('/tmp/.X%d-lock' % number):
+        number += 1
+
+    process = subprocess.Popen([xvfb, ':%d' % number, '-nolisten', 'tcp'],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 5
+    while not os.path.exists('/tmp/.X11-unix/X%d' % number):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("Xvfb didn't start")
+        time.sleep(0.05)
+
+    os.environ['DISPLAY'] = ':%d' % number
+    return process
+
+
+def bench_gui():
+    """
+    Keystroke to redraw latency: answer_process() until Tk has redrawn,
+    BENCH_GUI_TURNS times with the default settings, and redraw() alone.
+    Runs under Xvfb if there is no display. Settings and the attempt log
+    are kept in a temporary directory.
+    :return: {name: (microseconds, "us")}
+    :raises RuntimeError: if there is no display to run on.
+    """
+    if importlib.util.find_spec('tkinter') is None:
+        raise RuntimeError("tkinter is not installed")
+
+    display = virtual_display()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config = ConfigStore(directory + '/MAT.cfg')
+            config.reset(LEGACY_PROFILE)
+            ui = ArithmeticProgram(LEGACY_PROFILE, config,
+                                   directory + '/MAT.log')
+            stats = LatencyStats()
+            redraws = LatencyStats()
+            try:
+                ui.start_game()
+                ui.update()
+                for _ in range(BENCH_GUI_TURNS):
+                    start = time.perf_counter()
+                    ui.answer_process("0")
+                    ui.update()
+                    stats.add(time.perf_counter() - start)
+
+                # Just showing a problem, without the game logic.
+                for _ in range(BENCH_GUI_TURNS):
+                    start = time.perf_counter()
+                    ui.redraw()
+                    ui.update()
+                    redraws.add(time.perf_counter() - start)
+            finally:
+                ui.close()
+
+    finally:
+        if display is not None:
+            display.terminate()
+            display.wait()
+            del os.environ['DISPLAY']
+
+    return {"gui turn mean": (1e6 * stats.mean, "us"),
+            "gui turn p50": (1e6 * stats.percentile(50), "us"),
+            "gui turn p99": (1e6 * stats.percentile(99), "us"),
+            "gui redraw mean": (1e6 * redraws.mean, "us"),
+            "gui redraw p99": (1e6 * redraws.percentile(99), "us")}
+
+
+def bench_instrumentation():
+    """
+    Cost of an Instrumentation timer around a call, on top of the call.
+    :return: {"instrumented call overhead": (nanoseconds, "ns")}
+    """
+    class Target:
+        def call(self):
+            pass
+
+    target = Target()
+    plain = time_per_call(target.call)
+    instrumentation = Instrumentation([(Target, 'call')])
+    instrumentation.install()
+    timed = time_per_call(target.call)
+    instrumentation.uninstall()
+
+    return {"instrumented call overhead": (1e9 * (timed - plain), "ns")}
+
+
+BENCHMARKS = [bench_generation, bench_get_answer, bench_config,
+              bench_countdown, bench_instrumentation, bench_gui]
+
+
+def run_benchmarks(write=print):
+    """
+    Runs every benchmark in BENCHMARKS. One that can't run here (e.g. no
+    display for the GUI) is skipped with the reason.
+    :param write: output function for progress.
+    :return: results dict, as saved to the results file.
+    """
+    report = {
+        'version': BENCH_VERSION,
+        'time': time.time(),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'numpy': HAVE_NUMPY,
+        'results': {},
+        'skipped': {}
+    }
+
+    for bench in BENCHMARKS:
+        name = bench.__name__[len('bench_'):]
+        try:
+            results = bench()
+        except RuntimeError as error:
+            report['skipped'][name] = str(error)
+            write("%-28s skipped: %s" % (name, error))
+            continue
+
+        for key, (value, unit) in results.items():
+            report['results'][key] = {'value': value, 'unit': unit}
+            write("%-28s %12.3f %s" % (key, value, unit))
+
+    return report
+
+
+def compare_benchmarks(report, baseline, tolerance=BENCH_TOLERANCE,
+                       write=print):
+    """
+    Compares results against a baseline run.
+    :param report: results from run_benchmarks().
+    :param baseline: earlier results.
+    :param tolerance: allowed slowdown, 0.2 is 20 %.
+    :return: names of the benchmarks that got slower than allowed.
+    """
+    if baseline.get('version') != BENCH_VERSION:
+        raise ValueError("Baseline has another results format.")
+
+    regressions = []
+    for key, result in report['results'].items():
+        old = baseline['results'].get(key)
+        if old is None:  # New benchmark, or the baseline had no display.
+            write("%-28s %12s -> %12.3f %s  not in the baseline"
+                  % (key, "", result['value'], result['unit']))
+            continue
+
+        if old['value'] > 0:
+            change = result['value'] / old['value'] - 1
+        else:
+            change = 0.0 if result['value'] <= old['value'] else float('inf')
+
+        slower = change > tolerance
+        if slower:
+            regressions.append(key)
+
+        write("%-28s %12.3f -> %12.3f %s %+7.1f %%%s"
+              % (key, old['value'], result['value'], result['unit'],
+                 100 * change, "  SLOWER" if slower else ""))
+
+    return regressions
+
+
+def benchmark_main(args):
+    """
+    Runs the benchmarks, saves the results and compares them against a
+    baseline if one was given.
+    :param args: parse_args() namespace.
+    :return: exit status, 1 if something got slower than allowed.
+    """
+    import json
+
+    baseline = None
+    if args.baseline is not None:
+        try:
+            with open(args.baseline, encoding='utf-8') as infile:
+                baseline = json.load(infile)
+        except (OSError, ValueError) as error:
+            print("Baseline could not be read: %s" % error, file=sys.stderr)
+            return 2
+
+    report = run_benchmarks()
+
+    with open(args.bench_output, 'w', encoding='utf-8') as outfile:
+        json.dump(report, outfile, indent=1, sort_keys=True)
+
+    if baseline is None:
+        return 0
+
+    print()
+    try:
+        regressions = compare_benchmarks(report, baseline, args.tolerance)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    if regressions:
+        print("\n%s benchmark(s) got slower than %d %%."
+              % (len(regressions), 100 * args.tolerance))
+        return 1
+
+    return 0
+
+
+def raise_file_limit(count):
+    """
+    Raises the open file limit towards count, as far as the hard limit
+    allows. Every session is a socket.
+    :param count: files needed.
+    """
+    try:
+        import resource
+    except ImportError:  # Not on Windows.
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < count:
+        if hard != resource.RLIM_INFINITY:
+            count = min(count, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (count, hard))
+
+
+def problem_message(game):
+    """
+    :param game: GameState.
+    :return: the current problem as a message dict.
+    """
+    op = game.operator
+    return {'problem': format_problem(game.operands, op),
+            'operands': list(game.operands),
+            'operator': list(op) if isinstance(op, tuple) else op}
+
+
+class DrillServer:
+    """
+    Serves drills to many users at once on asyncio. Every connection is a
+    session with its own settings (validated with settings_errors()),
+    GameState and deadline timer. Messages are JSON objects, one per line:
+
+    {"cmd": "start", "settings": {...}}  new game, settings default to
+                                         defaults.
+    {"cmd": "answer", "answer": "19"}    empty answer skips.
+    {"cmd": "stop"}                      ends the game.
+    {"cmd": "quit"}                      closes the connection.
+
+    Replies carry the next problem, the score or an "error" text. When the
+    time runs out the server sends {"event": "time_up", ...} by itself.
+    Settings are validated and generators built in a worker thread, so
+    slow ones (adaptive weights, difficulty table, constraint spaces) don't
+    stall the other sessions.
+    """
+    def __init__(self, log=None):
+        """
+        :param log: optional SessionLog that gets every attempt.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.__log = log
+        self.__queues = {}  # Settings key: ProblemQueue, oldest first.
+        self.__builder = ThreadPoolExecutor(1)
+        self.__adaptive = 0  # Adaptive games running.
+        self.__sessions = 0
+        self.__answers = 0
+
+    @property
+    def sessions(self):
+        """
+        :return: sessions served so far.
+        """
+        return self.__sessions
+
+    @property
+    def answers(self):
+        return self.__answers
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        """
+        :return: listening asyncio.Server.
+        """
+        import asyncio
+
+        return await asyncio.start_server(self.handle, host, port,
+                                          backlog=SERVER_BACKLOG)
+
+    def close(self):
+        """
+        Stops the worker thread.
+        """
+        self.__builder.shutdown()
+
+    async def build(self, func, *args):
+        """
+        :return: func(*args), run in the worker thread.
+        """
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__builder, func, *args)
+
+    async def problems(self, settings):
+        """
+        :param settings: validated settings dict.
+        :return: ProblemQueue shared by the sessions with these settings,
+                 None in adaptive mode, which follows one user's answers.
+        """
+        if settings['adaptive']:
+            return None
+
+        key = tuple(sorted((k, v) for k, v in settings.items()
+                           if k != 'time_limit'))
+        problems = self.__queues.pop(key, None)
+        if problems is None:
+            problems = await self.build(
+                lambda: ProblemQueue(make_generator(settings)))
+            # Another session may have built one meanwhile.
+            problems = self.__queues.pop(key, problems)
+            if len(self.__queues) >= SERVER_QUEUES:
+                del self.__queues[next(iter(self.__queues))]
+
+        self.__queues[key] = problems  # Now the latest.
+        return problems
+
+    async def handle(self, reader, writer):
+        """
+        Runs one session until the client quits or disconnects.
+        """
+        import asyncio
+        import json
+
+        loop = asyncio.get_running_loop()
+        self.__sessions += 1
+        game = None
+        countdown = None
+        adaptive = False  # This session holds an adaptive game slot.
+
+        def send(message):
+            writer.write(json.dumps(message).encode('utf-8') + b"\n")
+
+        def results(event):
+            return {'event': event, 'score': game.score,
+                    'summary': game.summary}
+
+        def expire():
+            send(results('time_up'))
+
+        try:
+            async for line in reader:
+                try:
+                    message = json.loads(line)
+                    command = message['cmd']
+                except (ValueError, TypeError, KeyError):
+                    send({'error': "Messages are JSON objects with a cmd."})
+                    continue
+
+                if command == 'start':
+                    settings = dict(defaults)
+                    given = message.get('settings', {})
+                    if not isinstance(given, dict) or \
+                            any(not isinstance(i, (int, str))
+                                for i in given.values()):
+                        send({'error': "Settings must be an object of "
+                                       "numbers and strings."})
+                        continue
+
+                    unknown = [i for i in given if i not in defaults]
+                    if unknown:
+                        send({'error': "Unknown settings: %s."
+                                       % ", ".join(map(str, unknown))})
+                        continue
+
+                    settings.update(given)
+                    errors, settings = await self.build(settings_errors,
+                                                        settings)
+                    if errors:
+                        send({'error': "\n\n".join(errors)})
+                        continue
+
+                    # A running adaptive game of this session is replaced.
+                    if settings['adaptive'] and not adaptive and \
+                            self.__adaptive >= SERVER_ADAPTIVE_SESSIONS:
+                        send({'error': "Too many adaptive games, try again "
+                                       "later."})
+                        continue
+
+                    if countdown is not None:
+                        countdown.cancel()
+                    countdown = None
+                    game = None
+                    if adaptive:
+                        self.__adaptive -= 1
+                        adaptive = False
+
+                    generator = None
+                    if settings['adaptive']:
+                        self.__adaptive += 1
+                        adaptive = True
+                        generator = await self.build(make_generator,
+                                                     settings)
+
+                    problems = await self.problems(settings)
+                    game = GameState(settings, loop.time, self.__log,
+                                     generator=generator, problems=problems)
+                    if settings['time_limit'] != 0:
+                        # One tick at the start and one at the deadline.
+                        countdown = Countdown(
+                            lambda ms, func: loop.call_later(ms / 1000,
+                                                             func),
+                            lambda handle: handle.cancel(),
+                            lambda remaining: None, expire,
+                            1000 * settings['time_limit'], loop.time)
+                        countdown.start(settings['time_limit'])
+
+                    send(problem_message(game))
+
+                elif command == 'answer':
+                    if game is None or countdown is not None and \
+                            not countdown.running:
+                        send({'error': "No game running."})
+                        continue
+
+                    uanswer = str(message.get('answer', "")).strip()
+                    try:
+                        correct = game.check(uanswer)
+                    except ValueError:
+                        send({'error': "Input can only be an integer or "
+                                       "empty"})
+                        continue
+
+                    answer = game.answer
+                    game.record(correct, uanswer)
+                    game.next_problem()
+                    self.__answers += 1
+
+                    reply = problem_message(game)
+                    reply.update(correct=correct, answer=answer,
+                                 score=game.score)
+                    if countdown is not None:
+                        reply['time_left'] = countdown.remaining
+                    send(reply)
+
+                    # Top up after replying, like the GUI's after_idle().
+                    if game.problems.low:
+                        loop.call_soon(game.problems.refill)
+
+                elif command == 'stop':
+                    if game is None:
+                        send({'error': "No game running."})
+                        continue
+
+                    if countdown is not None:
+                        countdown.cancel()
+                    send(results('stopped'))
+                    game = None
+                    if adaptive:
+                        self.__adaptive -= 1
+                        adaptive = False
+
+                elif command == 'quit':
+                    break
+
+                else:
+                    send({'error': "Unknown command %r." % command})
+
+                await writer.drain()
+
+        # The client went away or sent a line over the reader's limit,
+        # the session just ends.
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+
+        finally:
+            if countdown is not None:
+                countdown.cancel()
+            if adaptive:
+                self.__adaptive -= 1
+            writer.close()
+
+
+def serve_main(args):
+    """
+    Runs the drill server until interrupted.
+    :param args: parse_args() namespace.
+    :return: exit status.
+    """
+    import asyncio
+
+    writer = None
+    log = None
+    if not args.no_log:
+        writer = BackgroundWriter()
+        log = open_session_log(args.log, writer)
+
+    server = DrillServer(log)
+
+    async def serve():
+        listener = await server.start(args.host, args.port)
+        print("Serving drills on %s:%s" % (args.host, args.port))
+        async with listener:
+            await listener.serve_forever()
+
+    raise_file_limit(2 * LOAD_SESSIONS)
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n%s sessions, %s answers" % (server.sessions, server.answers))
+
+    finally:
+        server.close()
+        if writer is not None:
+            writer.close()
+        if log is not None:
+            log.close()
+
+    return 0
+
+
+async def load_session(host, port, settings, turns, stats, rng, connects):
+    """
+    One simulated user: starts a game and answers turns problems, right
+    most of the time. Times every answer's round trip into stats.
+    :param connects: asyncio.Semaphore limiting simultaneous connects, so
+                     the server's backlog isn't overrun.
+    :return: answers given, fewer if the time ran out.
+    """
+    import asyncio
+    import json
+
+    async with connects:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    async def receive():
+        return json.loads(await reader.readline())
+
+    writer.write(json.dumps({'cmd': 'start',
+                             'settings': settings}).encode() + b"\n")
+    problem = await receive()
+    if 'error' in problem:
+        raise ValueError(problem['error'])
+
+    answered = 0
+    for _ in range(turns):
+        op = problem['operator']
+        answer = get_answer(problem['operands'],
+                            tuple(op) if isinstance(op, list) else op)
+        if rng.random() < 0.1:
+            answer += 1
+
+        start = time.perf_counter()
+        writer.write(json.dumps({'cmd': 'answer',
+                                 'answer': str(answer)}).encode() + b"\n")
+        problem = await receive()
+        stats.add(time.perf_counter() - start)
+        if 'event' in problem or 'error' in problem:  # Time is up.
+            break
+        answered += 1
+
+    writer.write(b'{"cmd": "quit"}\n')
+    writer.close()
+    return answered
+
+
+def run_load_test(settings, host=SERVER_HOST, port=SERVER_PORT,
+                  sessions=LOAD_SESSIONS, turns=LOAD_TURNS, seed=None,
+                  write=print):
+    """
+    Load-generating client for DrillServer. Runs all sessions at once in
+    one event loop and reports throughput and round trip percentiles.
+    :param settings: settings dict sent by every session.
+    :param sessions: concurrent sessions.
+    :param turns: answers per session.
+    :param seed: optional seed for the wrong answers.
+    :param write: output function.
+    :return: report dict.
+    """
+    import asyncio
+
+    stats = LatencyStats()
+    rng = Random(seed)
+
+    async def load():
+        connects = asyncio.Semaphore(LOAD_CONNECTS)
+        return await asyncio.gather(*(
+            load_session(host, port, settings, turns, stats, rng, connects)
+            for _ in range(sessions)))
+
+    raise_file_limit(sessions + 64)
+    start = time.perf_counter()
+    answered = sum(asyncio.run(load()))
+    elapsed = time.perf_counter() - start
+
+    report = {'sessions': sessions, 'answers': answered, 'seconds': elapsed,
+              'answers_per_second': answered / elapsed,
+              'p50': stats.percentile(50), 'p99': stats.percentile(99),
+              'p999': stats.percentile(99.9)}
+    write("%s sessions, %s answers in %.2f s: %.0f answers/s"
+          % (sessions, answered, elapsed, report['answers_per_second']))
+    write("round trip p50 %.2f ms, p99 %.2f ms, p99.9 %.2f ms"
+          % (1e3 * report['p50'], 1e3 * report['p99'],
+             1e3 * report['p999']))
+    return report
+
+
+def chunk_seed(seed, index):
+    """
+    :param seed: worksheet seed, integer.
+    :param index: chunk number.
+    :return: seed of the chunk's own random stream, for make_generator().
+    """
+    if HAVE_NUMPY:
+        return np.random.SeedSequence(seed, spawn_key=(index,))
+
+    return "%d/%d" % (seed, index)  # Random() hashes strings with SHA-512.
+
+
+def export_chunk(settings, seed, index, size):
+    """
+    Draws and formats one chunk. Runs in the worker processes.
+    :param settings: validated settings dict.
+    :param seed: worksheet seed.
+    :param index: chunk number.
+    :param size: amount of problems.
+    :return: list of (problem text, answer).
+    """
+    batch = make_generator(settings, chunk_seed(seed, index)).generate(size)
+    operands, answers = batch[:2]
+    operators = batch[2] if len(batch) > 2 else repeat(settings['operator'])
+    if not isinstance(answers, list):
+        operands = operands.tolist()
+        answers = answers.tolist()
+
+    return [(format_problem(numbers, op), answer)
+            for numbers, answer, op in zip(operands, answers, operators)]
+
+
+def export_rows(settings, count, seed, workers=1):
+    """
+    Streams a worksheet in order. Memory only depends on the amount of
+    workers, not on count.
+    :param settings: validated settings dict.
+    :param count: amount of problems.
+    :param seed: worksheet seed, integer.
+    :param workers: processes drawing chunks, 1 draws in this process.
+                    Never more than there are chunks, a worksheet of one
+                    chunk is drawn without a process pool.
+    :return: generator of (problem text, answer).
+    """
+    sizes = [EXPORT_CHUNK] * (count // EXPORT_CHUNK)
+    if count % EXPORT_CHUNK:
+        sizes.append(count % EXPORT_CHUNK)
+
+    workers = min(workers, len(sizes))
+    if workers <= 1:
+        for index, size in enumerate(sizes):
+            yield from export_chunk(settings, seed, index, size)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        chunks = iter(enumerate(sizes))
+        for index, size in chunks:
+            pending.append(pool.submit(export_chunk, settings, seed, index,
+                                       size))
+            if len(pending) >= workers * EXPORT_WINDOW:
+                break
+
+        while pending:
+            rows = pending.popleft().result()
+            for index, size in chunks:  # Keep the window full.
+                pending.append(pool.submit(export_chunk, settings, seed,
+                                           index, size))
+                break
+
+            yield from rows
+
+
+def export_errors(settings):
+    """
+    :param settings: validated settings dict.
+    :return: error messages for settings a worksheet can't have.
+    """
+    error_messages = []
+    if settings['adaptive']:
+        error_messages.append("Export: adaptive mode needs answers, it "
+                              "can't be exported.")
+
+    if settings['no_repeat']:
+        error_messages.append("Export: no repeats is only for drills, "
+                              "worksheet chunks are drawn independently.")
+
+    return error_messages
+
+
+class PdfWriter:
+    """
+    Minimal streaming PDF writer: pages of text lines in Helvetica. Pages
+    are written as soon as they are full. Only the objects' file offsets
+    are kept, for the cross-reference table.
+    """
+    WIDTH = 595  # A4 in points.
+    HEIGHT = 842
+    MARGIN = 56
+    FONT_SIZE = 12
+
+    def __init__(self, path, title, lines=PDF_LINES):
+        """
+        :param path: output file.
+        :param title: heading of every page.
+        :param lines: text lines per page.
+        """
+        self.__file = open(path, 'wb')
+        self.__title = title
+        self.__lines_per_page = lines
+        self.__lines = []
+        self.__offsets = {}  # Object number: file offset.
+        self.__pages = []  # Page object numbers.
+        # 1 catalog, 2 page tree and 3 font, written at the end.
+        self.__next_object = 4
+        self.__file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add(self, line):
+        """
+        :param line: text line, Latin-1 characters only.
+        """
+        self.__lines.append(line)
+        if len(self.__lines) == self.__lines_per_page:
+            self.__write_page()
+
+    def close(self):
+        """
+        Writes the last page, the page tree and the cross-reference table.
+        """
+        if self.__lines or not self.__pages:
+            self.__write_page()
+
+        self.__object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join("%d 0 R" % i for i in self.__pages)
+        self.__object(2, ("<< /Type /Pages /Kids [%s] /Count %d >>"
+                          % (kids, len(self.__pages))).encode('ascii'))
+        self.__object(3, b"<< /Type /Font /Subtype /Type1 "
+                         b"/BaseFont /Helvetica "
+                         b"/Encoding /WinAnsiEncoding >>")
+
+        xref = self.__file.tell()
+        count = self.__next_object
+        entries = ["0000000000 65535 f \n"]
+        entries.extend("%010d 00000 n \n" % self.__offsets[i]
+                       for i in range(1, count))
+        self.__file.write(("xref\n0 %d\n%s" % (count, "".join(entries)))
+                          .encode('ascii'))
+        self.__file.write(("trailer\n<< /Size %d /Root 1 0 R >>\n"
+                           "startxref\n%d\n%%%%EOF\n" % (count, xref))
+                          .encode('ascii'))
+        self.__file.close()
+
+    def __write_page(self):
+        leading = self.FONT_SIZE * 1.25
+        text = ["BT /F1 %d Tf %d %d Td %.2f TL" % (
+            self.FONT_SIZE, self.MARGIN, self.HEIGHT - self.MARGIN, leading)]
+        for line in ["%s   (page %d)" % (self.__title, len(self.__pages) + 1),
+                     ""] + self.__lines:
+            escaped = line.replace('\\', '\\\\').replace(
+                '(', '\\(').replace(')', '\\)')
+            text.append("(%s) Tj T*" % escaped)
+        text.append("ET")
+        content = "\n".join(text).encode('cp1252')
+
+        stream = self.__new_object()
+        self.__object(stream, b"<< /Length %d >>\nstream\n%s\nendstream"
+                      % (len(content), content))
+        page = self.__new_object()
+        self.__object(page, (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            "/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (self.WIDTH, self.HEIGHT, stream)).encode('ascii'))
+        self.__pages.append(page)
+        self.__lines = []
+
+    def __new_object(self):
+        number = self.__next_object
+        self.__next_object += 1
+        return number
+
+    def __object(self, number, body):
+        self.__offsets[number] = self.__file.tell()
+        self.__file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+
+def key_path(path):
+    """
+    :return: answer key file next to a worksheet, e.g. sheet-key.txt.
+    """
+    base, extension = os.path.splitext(path)
+    return base + '-key' + extension
+
+
+def export_worksheet(settings, path, count, seed=None, workers=1, fmt=None):
+    """
+    Writes a worksheet and its answer key. CSV has both in one file
+    (number, problem, answer), text and PDF get a separate key file from
+    key_path().
+    :param settings: validated settings dict, see export_errors().
+    :param path: output file.
+    :param count: amount of problems.
+    :param seed: worksheet seed, a random one if None.
+    :param workers: processes drawing the problems.
+    :param fmt: one of EXPORT_FORMATS, from the file extension if None.
+    :return: the seed, to make the same worksheet again.
+    :raises ValueError: for an unknown format or a count below 1.
+    """
+    if count < 1:
+        raise ValueError("A worksheet needs at least 1 problem.")
+
+    if fmt is None:
+        fmt = os.path.splitext(path)[1][1:].lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format %r, use one of %s."
+                         % (fmt, ", ".join(EXPORT_FORMATS)))
+
+    if seed is None:
+        seed = Random().getrandbits(63)
+
+    rows = export_rows(settings, count, seed, workers)
+    title = "Worksheet %s" % seed
+
+    if fmt == 'csv':
+        import csv
+
+        with open(path, 'w', newline='', encoding='utf-8') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(['number', 'problem', 'answer'])
+            writer.writerows((number, problem, answer) for number,
+                             (problem, answer) in enumerate(rows, 1))
+
+    elif fmt == 'txt':
+        with open(path, 'w', encoding='utf-8') as sheet, \
+                open(key_path(path), 'w', encoding='utf-8') as key:
+            sheet.write(title + "\n\n")
+            key.write(title + ", answers\n\n")
+            for number, (problem, answer) in enumerate(rows, 1):
+                sheet.write("%d) %s = \n" % (number, problem))
+                key.write("%d) %s = %s\n" % (number, problem, answer))
+
+    else:
+        sheet = PdfWriter(path, title)
+        key = PdfWriter(key_path(path), title + ", answers")
+        try:
+            for number, (problem, answer) in enumerate(rows, 1):
+                sheet.add("%d)  %s =" % (number, problem))
+                key.add("%d)  %s = %s" % (number, problem, answer))
+        finally:
+            sheet.close()
+            key.close()
+
+    return seed
+
+
+def graded_path(path):
+    """
+    :return: verdict file next to a submission, e.g. sheet-graded.csv.
+    """
+    base, extension = os.path.splitext(path)
+    return base + '-graded' + extension
+
+
+def grade_format(path, fmt=None):
+    """
+    :param path: submission or verdict file.
+    :param fmt: one of GRADE_FORMATS, from the file extension if None.
+    :return: the format.
+    :raises ValueError: for an unknown format.
+    """
+    if fmt is None:
+        fmt = os.path.splitext(path)[1][1:].lower()
+    if fmt not in GRADE_FORMATS:
+        raise ValueError("Unknown grading format %r, use one of %s."
+                         % (fmt, ", ".join(GRADE_FORMATS)))
+    return fmt
+
+
+def read_submissions(infile, fmt):
+    """
+    Streams the rows of a submission. CSV needs a header with the
+    GRADE_COLUMNS, operands and mixed operators separated by spaces, e.g.
+    "3 4 5", "+ ·", "23". JSONL has an object per line, e.g.
+    {"operands": [3, 4, 5], "operator": ["+", "·"], "answer": 23}.
+    :param infile: open text file.
+    :param fmt: one of GRADE_FORMATS.
+    :return: generator of (operands, operator, answer) as in the file, or
+             a ValueError for a line that can't be read.
+    :raises ValueError: if the CSV header lacks a column.
+    """
+    if fmt == 'csv':
+        import csv
+
+        reader = csv.reader(infile)
+        header = [i.strip().lower() for i in next(reader, [])]
+        missing = [i for i in GRADE_COLUMNS if i not in header]
+        if missing:
+            raise ValueError("Submission lacks the columns: %s."
+                             % ", ".join(missing))
+
+        columns = [header.index(i) for i in GRADE_COLUMNS]
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < len(header):
+                yield ValueError("Expected %d columns, got %d."
+                                 % (len(header), len(row)))
+            else:
+                yield tuple(row[i] for i in columns)
+        return
+
+    import json
+
+    for line in infile:
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+            yield tuple(row.get(i) for i in GRADE_COLUMNS)
+        except (ValueError, AttributeError):
+            yield ValueError("Not a JSON object.")
+
+
+def parse_submission(operands, operator):
+    """
+    Validates a submitted problem against what the settings allow.
+    :param operands: numbers, a list or a string separated by spaces.
+    :param operator: operator, or several for a mixed problem, a list or a
+                     string separated by spaces. GRADE_ALIASES are the
+                     same as the operators.
+    :return: list of numbers and the operator, a tuple if mixed.
+    :raises ValueError: with the reason if it isn't a valid problem.
+    """
+    if isinstance(operands, str):
+        operands = operands.split()
+    if isinstance(operator, str):
+        operator = operator.split()
+    if not isinstance(operands, list) or not isinstance(operator, list):
+        raise ValueError("Operands and operator are missing.")
+
+    # JSON numbers like 2.5 or true aren't rounded to integers.
+    try:
+        numbers = [int(i) for i in operands if type(i) in (int, str)]
+    except ValueError:
+        numbers = []
+    if not numbers or len(numbers) != len(operands):
+        raise ValueError("Operands must be integers.")
+
+    if not 1 < len(numbers) <= MAX_NUMBERS:
+        raise ValueError("A problem has 2 - %d numbers." % MAX_NUMBERS)
+    if min(numbers) < -RANGE_LIMIT or max(numbers) > RANGE_LIMIT:
+        raise ValueError("Operands must be between %d and %d."
+                         % (-RANGE_LIMIT, RANGE_LIMIT))
+
+    operators = tuple(GRADE_ALIASES.get(i, i) if type(i) is str else None
+                      for i in operator)
+    if len(operators) == 1 and operators[0] in OPERATORS:
+        if operators[0] == '÷':
+            # Trainer problems always divide evenly, see DivisionIndex.
+            result = numbers[0]
+            for number in numbers[1:]:
+                if number == 0:
+                    raise ValueError("Division by zero.")
+                if result % number:
+                    raise ValueError("Division doesn't go evenly.")
+                result //= number
+        return numbers, operators[0]
+
+    if len(operators) != len(numbers) - 1 or \
+            not all(i in MIXED_OPERATORS for i in operators):
+        raise ValueError("Operator must be one of %s, or one of %s between "
+                         "every two numbers." % (" ".join(OPERATORS),
+                                                 " ".join(MIXED_OPERATORS)))
+    return numbers, operators
+
+
+def grade_chunk(rows):
+    """
+    Grades a chunk of submission rows. Problems with the same amount of
+    numbers and operator get their answers from get_answers() in one
+    vectorized call, mixed problems from get_mixed_answers().
+    :param rows: list of read_submissions() rows.
+    :return: list of (problem, answer, expected answer, verdict, message),
+             answer and expected answer None if there is none.
+    """
+    problems = [None] * len(rows)
+    expected = [None] * len(rows)
+    messages = [""] * len(rows)
+    groups = {}  # (amount of numbers, operator or None if mixed): rows.
+    for index, row in enumerate(rows):
+        if isinstance(row, ValueError):
+            messages[index] = str(row)
+            continue
+
+        try:
+            numbers, op = parse_submission(row[0], row[1])
+        except ValueError as error:
+            messages[index] = str(error)
+            continue
+
+        problems[index] = (numbers, op)
+        key = (len(numbers), None if isinstance(op, tuple) else op)
+        groups.setdefault(key, []).append(index)
+
+    for (numcount, op), indexes in groups.items():
+        operands = [problems[i][0] for i in indexes]
+        if op is not None:
+            answers = get_answers(operands, op)
+        elif HAVE_NUMPY:
+            layouts = {}
+            shapes = [layouts.setdefault(problems[i][1], len(layouts))
+                      for i in indexes]
+            answers = get_mixed_answers(np.array(operands, dtype=np.int64),
+                                        np.array(shapes), list(layouts))
+        else:
+            answers = [get_answer(problems[i][0], problems[i][1])
+                       for i in indexes]
+
+        if not isinstance(answers, list):
+            answers = answers.tolist()
+        for index, answer in zip(indexes, answers):
+            expected[index] = answer
+
+    results = []
+    for row, problem, answer, message in zip(rows, problems, expected,
+                                             messages):
+        if problem is None:
+            results.append(("", None, None, 'error', message))
+            continue
+
+        # Same rules as GameState.check(): empty is a skip, anything else
+        # has to be an integer.
+        uanswer = row[2]
+        if uanswer is None:
+            uanswer = ""
+        if isinstance(uanswer, bool):
+            uanswer = str(uanswer).lower()
+        uanswer = str(uanswer)
+
+        text = format_problem(*problem)
+        if uanswer == "":
+            results.append((text, None, answer, 'skipped', ""))
+            continue
+
+        try:
+            value = int(uanswer)
+        except ValueError:
+            results.append((text, None, answer, 'invalid',
+                            "Answer %r isn't an integer." % uanswer))
+            continue
+
+        results.append((text, value, answer,
+                        'correct' if value == answer else 'wrong', ""))
+
+    return results
+
+
+def grade_chunks(rows, workers=1):
+    """
+    Grades rows GRADE_CHUNK at a time, in order. Like export_rows(), at
+    most EXPORT_WINDOW chunks per worker are in flight.
+    :param rows: iterator of read_submissions() rows.
+    :param workers: processes grading chunks, 1 grades in this process.
+                    A sheet of one chunk is graded without a process pool.
+    :return: generator of grade_chunk() results.
+    """
+    chunks = iter(lambda: list(islice(rows, GRADE_CHUNK)), [])
+    # The pool is only started once a second chunk shows up.
+    first = next(chunks, None)
+    second = next(chunks, None) if workers > 1 else None
+    if second is None:
+        for chunk in chain([first] if first else [], chunks):
+            yield grade_chunk(chunk)
+        return
+
+    chunks = chain([first, second], chunks)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(grade_chunk, chunk))
+            if len(pending) >= workers * EXPORT_WINDOW:
+                break
+
+        while pending:
+            results = pending.popleft().result()
+            for chunk in chunks:  # Keep the window full.
+                pending.append(pool.submit(grade_chunk, chunk))
+                break
+
+            yield results
+
+
+def grade_submissions(path, output, fmt=None, output_fmt=None, workers=1):
+    """
+    Grades a submission file and writes a verdict for every row: row
+    number, problem, answer, expected answer, verdict and the reason for
+    invalid answers and errors. Memory only depends on GRADE_CHUNK and the
+    amount of workers, not on the file size.
+    :param path: submission, see read_submissions().
+    :param output: verdict file.
+    :param fmt: submission format, from the extension if None.
+    :param output_fmt: verdict format, from the extension if None.
+    :param workers: processes grading chunks.
+    :return: summary, amount of rows and of every verdict.
+    :raises ValueError: for an unknown format, a submission without the
+                        needed columns or output that is the submission.
+    """
+    fmt = grade_format(path, fmt)
+    output_fmt = grade_format(output, output_fmt)
+    # Opening the output would empty the sheet before it is read.
+    if os.path.exists(output) and os.path.samefile(path, output):
+        raise ValueError("The verdict file can't be the submission.")
+    summary = dict.fromkeys(('rows',) + GRADE_VERDICTS, 0)
+    names = ('row', 'problem', 'answer', 'expected', 'verdict', 'message')
+
+    with open(path, newline='', encoding='utf-8') as infile, \
+            open(output, 'w', newline='', encoding='utf-8') as outfile:
+        if output_fmt == 'csv':
+            import csv
+
+            writer = csv.writer(outfile)
+            writer.writerow(names)
+            write = writer.writerows
+        else:
+            import json
+
+            def write(lines):
+                outfile.writelines(
+                    json.dumps(dict(zip(names, line)), ensure_ascii=False)
+                    + "\n" for line in lines)
+
+        rows = read_submissions(infile, fmt)
+        for results in grade_chunks(rows, workers):
+            start = summary['rows'] + 1
+            write((number,) + result
+                  for number, result in enumerate(results, start))
+            summary['rows'] += len(results)
+            for result in results:
+                summary[result[3]] += 1
+
+    return summary
+
+
+def grade_main(args):
+    """
+    Grades the answer sheet in args.grade and prints the summary.
+    :param args: parse_args() namespace.
+    :return: exit status.
+    """
+    output = args.grade_output or graded_path(args.grade)
+    try:
+        summary = grade_submissions(args.grade, output,
+                                    workers=args.workers)
+    except (OSError, ValueError) as error:
+        print("Grading failed: %s" % error, file=sys.stderr)
+        return 1
+
+    answered = summary['rows'] - summary['error']
+    print("%d rows graded to %s: %s" % (summary['rows'], output, ", ".join(
+        "%d %s" % (summary[i], i) for i in GRADE_VERDICTS)))
+    if answered:
+        print("accuracy %.1f %%" % (100 * summary['correct'] / answered))
+    return 0
+
+
+def history_main(args, settings):
+    """
+    Prints one of the HISTORY_QUERIES for the history in args.log.
+    :param args: parse_args() namespace.
+    :param settings: validated settings, the operator and range are used.
+    :return: exit status.
+    """
+    import sqlite3
+
+    try:
+        columns, rows = query_history(
+            args.log, args.history_query, operator=settings['operator'],
+            low=settings['range_lower'], high=settings['range_upper'],
+            since=time.time() - args.days * 86400)
+    except sqlite3.Error as error:
+        print("History could not be read: %s" % error, file=sys.stderr)
+        return 1
+
+    print("  ".join("%12s" % i for i in columns))
+    for row in rows:
+        print("  ".join("%12.3f" % i if isinstance(i, float) else
+                        "%12s" % ("" if i is None else i) for i in row))
+    return 0
+
+
+class AttemptStats:
+    """
+    Mergeable summary of attempts: counts, response time stats and every
+    fact's attempts, mistakes and total time. Partial results of files,
+    users and the cohort are all AttemptStats merged together.
+    """
+    def __init__(self):
+        self.attempts = 0
+        self.correct = 0
+        self.latency = LatencyStats()
+        self.facts = {}  # Problem text: [attempts, mistakes, total time].
+
+    @property
+    def accuracy(self):
+        return self.correct / self.attempts if self.attempts else 0.0
+
+    def add(self, problem, correct, latency):
+        """
+        :param problem: problem text from format_problem().
+        :param correct: boolean; answer was correct/not.
+        :param latency: response time in seconds.
+        """
+        self.attempts += 1
+        self.latency.add(latency)
+        fact = self.facts.setdefault(problem, [0, 0, 0.0])
+        fact[0] += 1
+        fact[2] += latency
+        if correct:
+            self.correct += 1
+        else:
+            fact[1] += 1
+
+    def merge(self, other):
+        self.attempts += other.attempts
+        self.correct += other.correct
+        self.latency.merge(other.latency)
+        for problem, (attempts, mistakes, total) in other.facts.items():
+            fact = self.facts.setdefault(problem, [0, 0, 0.0])
+            fact[0] += attempts
+            fact[1] += mistakes
+            fact[2] += total
+
+    def hardest(self, count=AGGREGATE_HARDEST,
+                min_attempts=AGGREGATE_MIN_ATTEMPTS):
+        """
+        :return: [(problem, mistake rate, mean time)], most mistakes first,
+                 then slowest.
+        """
+        facts = [(problem, mistakes / attempts, total / attempts)
+                 for problem, (attempts, mistakes, total) in self.facts.items()
+                 if attempts >= min_attempts]
+        facts.sort(key=lambda fact: (-fact[1], -fact[2]))
+        return facts[:count]
+
+    def to_dict(self):
+        return {'attempts': self.attempts, 'correct': self.correct,
+                'latency': self.latency.to_dict(), 'facts': self.facts}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.attempts = data['attempts']
+        stats.correct = data['correct']
+        stats.latency = LatencyStats.from_dict(data['latency'])
+        stats.facts = data['facts']
+        return stats
+
+
+def aggregate_file(path, position, partial):
+    """
+    Adds a file's new attempts to its partial result. Runs in the worker
+    processes, so everything in and out is plain data.
+    :param path: attempt log or history.
+    :param position: where the last run stopped: file offset for a log,
+                     last row id for a history, 0 for the start.
+    :param partial: AttemptStats.to_dict() of the last run, None if new.
+    :return: new partial dict, new position.
+    :raises ValueError: if the file can't be read.
+    """
+    import sqlite3
+
+    stats = AttemptStats() if partial is None \
+        else AttemptStats.from_dict(partial)
+
+    if path.endswith(HISTORY_SUFFIX):
+        try:
+            db = sqlite3.connect("file:%s?mode=ro" % os.path.abspath(path)
+                                 .replace('?', '%3f'), uri=True)
+            try:
+                slots = history_slots(db)
+                rows = db.execute(
+                    "SELECT rowid, operator, numbercount, latency, correct, "
+                    "%s FROM attempts WHERE rowid > ? ORDER BY rowid"
+                    % ", ".join("n%d" % i for i in range(slots)), (position,))
+                for rowid, op, count, latency, correct, *numbers in rows:
+                    if len(op) > 1:  # All the operators of a mixed problem.
+                        op = tuple(op)
+                    stats.add(format_problem(numbers[:count], op), correct,
+                              latency)
+                    position = rowid
+            finally:
+                db.close()
+        except sqlite3.Error as error:
+            raise ValueError("Not an attempt history: %s" % error)
+
+        return stats.to_dict(), position
+
+    operators = {code: op for op, code in LOG_OPERATOR_CODES.items()}
+    for values, position in iter_session_log(path, position):
+        _, latency, _, _, *numbers = values
+        numbers, (count, code, flags, mixed) = numbers[:-4], numbers[-4:]
+        if code == LOG_MIXED:
+            op = tuple(operators[mixed[i:i + 1]] for i in range(count - 1))
+        else:
+            op = operators[code]
+        stats.add(format_problem(numbers[:count], op), flags & LOG_CORRECT,
+                  latency)
+
+    return stats.to_dict(), position
+
+
+def aggregate_directory(root, workers=1):
+    """
+    Rolls up every attempt log (a file starting with LOG_MAGIC) and
+    history (HISTORY_SUFFIX) under root, per user and for the whole
+    cohort. A user is the first directory under root, or the file name for
+    files right in root. Files unchanged since the last run aren't read
+    again, and logs and histories that only grew are read from where the
+    last run stopped. A history's -wal file counts as part of it.
+    :param root: directory to scan.
+    :param workers: processes reading files, 1 reads in this process.
+    :return: {user: AttemptStats}, cohort AttemptStats, {file: error}.
+    """
+    import json
+
+    cache_path = os.path.join(root, AGGREGATE_CACHE)
+    try:
+        with open(cache_path, encoding='utf-8') as infile:
+            cache = json.load(infile)
+        if cache.get('version') != AGGREGATE_VERSION:
+            cache = None
+    except (OSError, ValueError):
+        cache = None
+    files = {} if cache is None else cache['files']
+
+    found = {}  # File: mtime, size and [mtime, size] of the -wal or None.
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root)
+            wal = None
+            try:
+                if name.endswith(HISTORY_SUFFIX):
+                    # Attempts not checkpointed yet are only in the -wal.
+                    if os.path.exists(path + '-wal'):
+                        info = os.stat(path + '-wal')
+                        wal = [info.st_mtime_ns, info.st_size]
+                elif relative not in files:  # Known ones are logs.
+                    with open(path, 'rb') as infile:
+                        if infile.read(len(LOG_MAGIC)) != LOG_MAGIC:
+                            continue
+                info = os.stat(path)
+            except OSError:  # Gone meanwhile, or not readable.
+                continue
+            found[relative] = (info.st_mtime_ns, info.st_size, wal)
+
+    # New files start over, so do files that shrank (replaced).
+    jobs = {}
+    for name, (mtime, size, wal) in found.items():
+        entry = files.get(name)
+        if entry is not None and (entry['mtime'], entry['size'],
+                                  entry.get('wal')) == (mtime, size, wal):
+            continue
+        if entry is None or size < entry['size']:
+            entry = {'position': 0, 'partial': None}
+        jobs[name] = (os.path.join(root, name), entry['position'],
+                      entry['partial'])
+
+    results = {}
+    errors = {}
+    if workers <= 1 or len(jobs) <= 1:
+        for name, job in jobs.items():
+            try:
+                results[name] = aggregate_file(*job)
+            except (OSError, ValueError) as error:
+                errors[name] = str(error)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {name: pool.submit(aggregate_file, *job)
+                       for name, job in jobs.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except (OSError, ValueError) as error:
+                    errors[name] = str(error)
+
+    for name, (partial, position) in results.items():
+        mtime, size, wal = found[name]
+        files[name] = {'mtime': mtime, 'size': size, 'wal': wal,
+                       'position': position, 'partial': partial}
+
+    # Forget files that are gone or couldn't be read.
+    files = {name: entry for name, entry in files.items()
+             if name in found and name not in errors}
+
+    users = {}
+    cohort = AttemptStats()
+    for name, entry in files.items():
+        parts = name.split(os.sep)
+        user = parts[0] if len(parts) > 1 else os.path.splitext(name)[0]
+        stats = AttemptStats.from_dict(entry['partial'])
+        users.setdefault(user, AttemptStats()).merge(stats)
+        cohort.merge(stats)
+
+    try:
+        with open(cache_path + '.tmp', 'w', encoding='utf-8') as outfile:
+            json.dump({'version': AGGREGATE_VERSION, 'files': files},
+                      outfile)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError as error:  # Results are still fine, just not kept.
+        errors[AGGREGATE_CACHE] = str(error)
+
+    return users, cohort, errors
+
+
+def aggregate_main(args):
+    """
+    Prints per user and cohort statistics of a directory of histories.
+    :param args: parse_args() namespace.
+    :return: exit status.
+    """
+    users, cohort, errors = aggregate_directory(args.aggregate,
+                                                args.workers)
+
+    for name, error in sorted(errors.items()):
+        print("%s: %s" % (name, error), file=sys.stderr)
+
+    header = "%-20s %9s %9s %8s %8s %8s" % ("user", "attempts", "accuracy",
+                                            "p50 s", "p90 s", "p99 s")
+    print(header)
+    for name, stats in sorted(users.items()) + [("(cohort)", cohort)]:
+        print("%-20s %9d %8.1f%% %8.2f %8.2f %8.2f" % (
+            name, stats.attempts, 100 * stats.accuracy,
+            stats.latency.percentile(50), stats.latency.percentile(90),
+            stats.latency.percentile(99)))
+
+    print("\nHardest facts (mistakes, mean time):")
+    for problem, mistakes, latency in cohort.hardest():
+        print("  %-24s %5.1f%% %6.2f s" % (problem, 100 * mistakes, latency))
+
+    return 1 if errors else 0
+
+
+def parse_args(argv=None):
+    """
+    :param argv: command line arguments, sys.argv[1:] if None.
+    :return: argparse namespace.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mental Arithmetic Trainer")
+    parser.add_argument('--cli', action='store_true',
+                        help="terminal drill instead of the GUI")
+    parser.add_argument('--profile', help="settings profile to use")
+    parser.add_argument('--numbers', type=int, dest='numbercount',
+                        help="amount of numbers in a problem")
+    parser.add_argument('--range', type=int, nargs=2,
+                        metavar=('LOWER', 'UPPER'), help="range of numbers")
+    parser.add_argument('--operator', choices=OPERATORS)
+    parser.add_argument('--time', type=int, dest='time_limit',
+                        help="time limit in seconds, 0 for none")
+    parser.add_argument('--adaptive', action='store_const', const=1,
+                        help="draw weak facts more often (2 numbers only)")
+    parser.add_argument('--nonnegative', action='store_const', const=1,
+                        help="no negative results")
+    parser.add_argument('--max-result', type=int, dest='max_result',
+                        help="largest allowed result, 0 for no limit")
+    parser.add_argument('--no-carry', action='store_const', const=1,
+                        dest='no_carry', help="no carrying or borrowing")
+    parser.add_argument('--distinct', action='store_const', const=1,
+                        help="no repeated numbers in a problem")
+    parser.add_argument('--mixed', action='store_const', const=1,
+                        help="mixed +, - and · in every problem")
+    parser.add_argument('--no-repeat', action='store_const', const=1,
+                        dest='no_repeat',
+                        help="don't show a problem twice in a session")
+    parser.add_argument('--difficulty', type=int,
+                        help="difficulty 1 - %s, 0 for any (2 numbers only)"
+                             % DIFFICULTY_BANDS)
+    parser.add_argument('--no-log', action='store_true',
+                        help="don't save attempts to the attempt log")
+    parser.add_argument('--log', default=LOG_FILE, metavar='FILE',
+                        help="attempt log, an SQLite history if it ends in "
+                             "%s" % HISTORY_SUFFIX)
+    parser.add_argument('--history-query', choices=sorted(HISTORY_QUERIES),
+                        help="analyse the --log history, for the operator "
+                             "and range settings")
+    parser.add_argument('--days', type=float, default=HISTORY_DAYS,
+                        help="days of history to analyse")
+    parser.add_argument('--simulate', choices=sorted(BOTS), metavar='BOT',
+                        help="play headlessly with a bot (%s) and report "
+                             "the speed" % ", ".join(sorted(BOTS)))
+    parser.add_argument('--turns', type=int,
+                        help="turns to simulate (100000), or answers per "
+                             "load test session (%s)" % LOAD_TURNS)
+    parser.add_argument('--seed', type=int,
+                        help="seed for the simulation or worksheet")
+    parser.add_argument('--serve', action='store_true',
+                        help="serve drills to many users over TCP")
+    parser.add_argument('--host', default=SERVER_HOST,
+                        help="server address")
+    parser.add_argument('--port', type=int, default=SERVER_PORT,
+                        help="server port")
+    parser.add_argument('--load-test', action='store_true',
+                        help="load a running server with simulated users, "
+                             "using these settings")
+    parser.add_argument('--sessions', type=int, default=LOAD_SESSIONS,
+                        help="simultaneous load test sessions")
+    parser.add_argument('--aggregate', metavar='DIR',
+                        help="statistics of every user's attempt logs and "
+                             "histories under DIR")
+    parser.add_argument('--export', metavar='FILE',
+                        help="write a worksheet with these settings and "
+                             "its answer key (.csv, .txt or .pdf)")
+    parser.add_argument('--count', type=int, default=100,
+                        help="problems on the worksheet")
+    parser.add_argument('--format', choices=EXPORT_FORMATS,
+                        help="worksheet format, from the extension if not "
+                             "given")
+    parser.add_argument('--grade', metavar='FILE',
+                        help="grade an answer sheet (.csv or .jsonl) and "
+                             "write a verdict per row")
+    parser.add_argument('--grade-output', metavar='FILE',
+                        help="verdict file (.csv or .jsonl), FILE-graded "
+                             "next to the sheet if not given")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="processes for the export, aggregation and "
+                             "grading")
+    parser.add_argument('--instrument', action='store_true',
+                        help="time the hot paths and print the times on "
+                             "quit (also %s=1)" % INSTRUMENT_ENV)
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="profile the session with cProfile and save "
+                             "the stats to FILE")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="run the benchmarks and save the results")
+    parser.add_argument('--bench-output', default=BENCH_FILE,
+                        help="benchmark results file")
+    parser.add_argument('--baseline',
+                        help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=BENCH_TOLERANCE,
+                        help="allowed slowdown against the baseline, "
+                             "0.2 is 20 %%")
+    return parser.parse_args(argv)
+
+
+def cli_main(args):
+    """
+    Terminal mode and simulations. Profile settings can be overridden with
+    arguments.
+    :param args: parse_args() namespace.
+    :return: exit status.
+    """
+    settings = read_cfg(args.profile or default_profile())
+
+    for setting in ('numbercount', 'operator', 'time_limit', 'adaptive',
+                    'mixed', 'no_repeat', 'difficulty') + CONSTRAINTS:
+        if getattr(args, setting) is not None:
+            settings[setting] = getattr(args, setting)
+
+    if args.range is not None:
+        settings['range_lower'], settings['range_upper'] = args.range
+
+    errors, settings = settings_errors(settings)
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        return 2
+
+    # Simulated attempts are never logged.
+    if args.simulate:
+        run_simulation(settings, args.simulate, args.turns or 100000,
+                       args.seed)
+        return 0
+
+    if args.history_query is not None:
+        return history_main(args, settings)
+
+    if args.export is not None:
+        errors = export_errors(settings)
+        if errors:
+            print("\n".join(errors), file=sys.stderr)
+            return 2
+
+        try:
+            seed = export_worksheet(settings, args.export, args.count,
+                                    args.seed, args.workers, args.format)
+        except (OSError, ValueError) as error:
+            print("Export failed: %s" % error, file=sys.stderr)
+            return 1
+
+        print("%s problems written to %s, seed %s"
+              % (args.count, args.export, seed))
+        return 0
+
+    if args.load_test:
+        try:
+            run_load_test(settings, args.host, args.port, args.sessions,
+                          args.turns or LOAD_TURNS, args.seed)
+        except OSError as error:
+            print("Load test failed: %s" % error, file=sys.stderr)
+            return 1
+        return 0
+
+    writer = None
+    log = None
+    if not args.no_log:
+        writer = BackgroundWriter()
+        log = open_session_log(args.log, writer)
+
+    try:
+        run_cli(settings, log=log)
+    except KeyboardInterrupt:
+        print()
+
+    finally:
+        if writer is not None:
+            writer.close()
+        if log is not None:
+            log.close()
+
+    return 0
+
+
+def run(args):
+    """
+    Runs the mode chosen with the arguments.
+    :param args: parse_args() namespace.
+    :return: exit status.
+    """
+    if args.benchmark:
+        return benchmark_main(args)
+
+    if args.serve:
+        return serve_main(args)
+
+    if args.aggregate is not None:
+        return aggregate_main(args)
+
+    if args.grade is not None:
+        return grade_main(args)
+
+    if args.cli or args.simulate or args.load_test or \
+            args.export is not None or args.history_query is not None:
+        return cli_main(args)
+
+    ui = ArithmeticProgram(args.profile,
+                           log_path=None if args.no_log else args.log)
+    ui.start()  # Returns once the window is closed.
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    instrumentation = None
+    if args.instrument or os.environ.get(INSTRUMENT_ENV, '0') != '0':
+        instrumentation = Instrumentation()
+        instrumentation.install()
+
+    profiler = None
+    if args.cprofile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        return run(args)
 
+    finally:
+        if profiler is not None:
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+                'cumulative').print_stats(20)
 
-def main():
-    ui = ArithmeticProgram()
-    ui.start()
+        if instrumentation is not None:
+            instrumentation.uninstall()
+            print(instrumentation.report(), file=sys.stderr)
 
 
-main()
+if __name__ == '__main__':
+    sys.exit(main())
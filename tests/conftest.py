@@ -0,0 +1,19 @@
+import os
+import sys
+
+# MAT is a single module next to this directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import MAT
+
+
+@pytest.fixture
+def settings():
+    """
+    :return: validated default settings, a new dict for every test.
+    """
+    errors, settings = MAT.settings_errors(dict(MAT.defaults))
+    assert not errors
+    return settings
@@ -0,0 +1,86 @@
+from collections import Counter
+from random import Random
+
+import pytest
+
+import MAT
+
+
+WEIGHTS = [3.0, 0.0, 1.0, 5.0, 0.5, 0.0, 2.5]
+
+
+def test_prefix_sums_follow_updates():
+    tree = MAT.FenwickTree(WEIGHTS)
+    weights = list(WEIGHTS)
+
+    for index, delta in [(1, 2.0), (6, -1.5), (0, 0.25)]:
+        tree.add(index, delta)
+        weights[index] += delta
+
+    for i in range(len(weights) + 1):
+        assert tree.prefix(i) == pytest.approx(sum(weights[:i]))
+    assert tree.total == pytest.approx(sum(weights))
+
+
+def test_find_skips_empty_indexes():
+    tree = MAT.FenwickTree(WEIGHTS)
+    bounds = [sum(WEIGHTS[:i + 1]) for i in range(len(WEIGHTS))]
+
+    for value in [0, 2.99, 3.0, 3.99, 4.0, 8.99, 9.0, 9.49, 9.5, 11.99]:
+        expected = next(i for i, bound in enumerate(bounds) if bound > value)
+        assert tree.find(value) == expected
+        assert WEIGHTS[tree.find(value)] > 0
+
+
+def test_sampling_is_proportional_to_the_weights():
+    tree = MAT.FenwickTree(WEIGHTS)
+    rng = Random(11)
+    draws = 60000
+    counts = Counter(tree.sample(rng) for _ in range(draws))
+
+    assert counts[1] == counts[5] == 0
+    total = sum(WEIGHTS)
+    for index, weight in enumerate(WEIGHTS):
+        expected = draws * weight / total
+        # Well within 5 standard deviations of a binomial count.
+        assert abs(counts[index] - expected) <= \
+            5 * (expected * (1 - weight / total)) ** 0.5 + 1
+
+
+def test_feedback_moves_mastery_and_draw_odds(settings):
+    settings.update(adaptive=1, range_lower=0, range_upper=3)
+    generator = MAT.AdaptiveGenerator(settings, seed=1)
+    assert generator.mastery((2, 3)) == 0
+
+    # Known fact: answered fast and right, again and again.
+    for _ in range(20):
+        generator.feedback((2, 3), True, 1.0)
+    assert generator.mastery((2, 3)) > 0.99
+
+    operands, answers = generator.generate(16000)
+    counts = Counter(map(tuple, operands))
+    # Weight is 1 - mastery + floor, against 1 + floor for the others.
+    share = counts[(2, 3)] / counts[(1, 1)]
+    assert share < 3 * MAT.ADAPTIVE_FLOOR
+    assert answers[0] == sum(operands[0])
+
+
+def test_wrong_answers_bring_the_fact_back(settings):
+    settings.update(adaptive=1, range_lower=0, range_upper=3)
+    generator = MAT.AdaptiveGenerator(settings, seed=1)
+    for _ in range(20):
+        generator.feedback((2, 3), True, 1.0)
+    before = generator.mastery((2, 3))
+    generator.feedback((2, 3), False, 1.0)
+
+    assert generator.mastery((2, 3)) == pytest.approx(
+        (1 - MAT.ADAPTIVE_RATE) * before)
+
+
+def test_division_draws_only_even_pairs(settings):
+    settings.update(adaptive=1, operator='÷', range_lower=-6,
+                    range_upper=12)
+    operands, answers = MAT.AdaptiveGenerator(settings, 2).generate(2000)
+
+    for (a, b), answer in zip(operands, answers):
+        assert a != 0 and b != 0 and a % b == 0 and answer == a // b
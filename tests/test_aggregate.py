@@ -0,0 +1,59 @@
+import os
+
+import MAT
+
+
+def play(log, settings, turns):
+    game = MAT.GameState(settings, log=log)
+    for _ in range(turns):
+        game.submit(str(game.answer))
+
+
+def test_logs_are_found_by_their_header(tmp_path, settings):
+    user = tmp_path / "alice"
+    user.mkdir()
+    log = MAT.SessionLog(str(user / "attempts.bin"))
+    play(log, settings, 5)
+    log.close()
+    (user / "server.log").write_text("INFO started\n")
+
+    users, cohort, errors = MAT.aggregate_directory(str(tmp_path))
+
+    assert errors == {}
+    assert cohort.attempts == 5
+    assert list(users) == ["alice"]
+
+
+def test_history_attempts_in_the_wal_are_counted(tmp_path, settings):
+    path = str(tmp_path / "bob.db")
+    store = MAT.HistoryStore(path)
+    try:
+        play(store, settings, 3)
+        _, cohort, errors = MAT.aggregate_directory(str(tmp_path))
+        assert errors == {}
+        assert cohort.attempts == 3
+
+        # Still open, so the new rows are only in the -wal.
+        size = os.path.getsize(path)
+        play(store, settings, 4)
+        assert os.path.getsize(path) == size
+        _, cohort, errors = MAT.aggregate_directory(str(tmp_path))
+        assert errors == {}
+        assert cohort.attempts == 7
+    finally:
+        store.close()
+
+
+def test_incremental_run_equals_a_fresh_one(tmp_path, settings):
+    log = MAT.SessionLog(str(tmp_path / "carol.log"))
+    play(log, settings, 10)
+    MAT.aggregate_directory(str(tmp_path))
+    play(log, settings, 10)
+    log.close()
+
+    _, incremental, _ = MAT.aggregate_directory(str(tmp_path))
+    os.remove(str(tmp_path / MAT.AGGREGATE_CACHE))
+    _, fresh, _ = MAT.aggregate_directory(str(tmp_path))
+
+    assert incremental.attempts == fresh.attempts == 20
+    assert incremental.to_dict() == fresh.to_dict()
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import MAT
+
+
+@pytest.mark.parametrize('op', ['+', '-', '·'])
+def test_matches_get_answer(op):
+    rng = np.random.default_rng(3)
+    operands = rng.integers(-50, 51, size=(500, 4))
+    answers = MAT.get_answers(operands, op)
+
+    assert answers.dtype == np.int64
+    assert answers.tolist() == [MAT.get_answer(row, op)
+                                for row in operands.tolist()]
+
+
+def test_division_matches_get_answer():
+    operands = np.array([[84, 2, 7], [-90, 3, -5], [7, 7, 1]])
+    assert MAT.get_answers(operands, '÷').tolist() == [6, 6, 1]
+
+
+def test_overflow_falls_back_to_python_ints():
+    operands = np.array([[2 ** 40, 2 ** 40, 3]], dtype=np.int64)
+    answers = MAT.get_answers(operands, '·')
+
+    assert answers.dtype == object
+    assert answers[0] == 3 * 2 ** 80
+
+
+def test_empty_matrix():
+    assert len(MAT.get_answers(np.zeros((0, 2), dtype=np.int64), '+')) == 0
+
+
+def test_division_by_zero_raises():
+    with pytest.raises(ZeroDivisionError):
+        MAT.get_answers(np.array([[4, 0]]), '÷')
+
+
+def test_unknown_operator_raises():
+    with pytest.raises(ValueError):
+        MAT.get_answers(np.array([[1, 2]]), '^')
+
+
+def test_without_numpy(monkeypatch):
+    monkeypatch.setattr(MAT, 'HAVE_NUMPY', False)
+    assert MAT.get_answers([[5, 3], [2, 9]], '-') == [2, -7]
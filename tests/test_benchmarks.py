@@ -0,0 +1,68 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import MAT
+
+
+def report(**values):
+    return {'version': MAT.BENCH_VERSION,
+            'results': {key: {'value': value, 'unit': "us"}
+                        for key, value in values.items()}}
+
+
+def test_slowdowns_past_the_tolerance_are_regressions():
+    output = []
+    regressions = MAT.compare_benchmarks(
+        report(a=1.19, b=1.5, c=0.5, d=0.1, new=3.0),
+        report(a=1.0, b=1.0, c=1.0, d=0.0), 0.2, output.append)
+
+    assert regressions == ['b', 'd']
+    assert len(output) == 5
+    assert output[1].endswith("SLOWER")
+    assert output[4].endswith("not in the baseline")
+
+
+def test_other_results_format_is_refused():
+    baseline = report(a=1.0)
+    baseline['version'] = MAT.BENCH_VERSION + 1
+
+    with pytest.raises(ValueError):
+        MAT.compare_benchmarks(report(a=1.0), baseline, 0.2, print)
+
+
+def test_benchmarks_that_cannot_run_are_skipped(monkeypatch):
+    def bench_fast():
+        return {"fast": (2.0, "ms")}
+
+    def bench_gui():
+        raise RuntimeError("no display")
+
+    monkeypatch.setattr(MAT, 'BENCHMARKS', [bench_fast, bench_gui])
+    result = MAT.run_benchmarks(write=lambda text: None)
+
+    assert result['results'] == {"fast": {'value': 2.0, 'unit': "ms"}}
+    assert result['skipped'] == {"gui": "no display"}
+
+
+def test_exit_status(tmp_path, monkeypatch):
+    monkeypatch.setattr(MAT, 'run_benchmarks', lambda: report(a=2.0))
+    baseline = tmp_path / "baseline.json"
+    args = SimpleNamespace(baseline=str(baseline), tolerance=0.2,
+                           bench_output=str(tmp_path / "bench.json"))
+
+    baseline.write_text(json.dumps(report(a=1.0)))
+    assert MAT.benchmark_main(args) == 1
+    baseline.write_text(json.dumps(report(a=2.0)))
+    assert MAT.benchmark_main(args) == 0
+    baseline.write_text("{")
+    assert MAT.benchmark_main(args) == 2
+
+    with open(args.bench_output, encoding='utf-8') as infile:
+        assert json.load(infile) == report(a=2.0)
+
+
+def test_countdown_ends_within_the_jitter():
+    drift = MAT.bench_countdown()["countdown drift"][0]
+    assert 0 <= drift <= 1e3 * MAT.BENCH_TIMER_JITTER + 1
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import MAT
+
+
+class Player:
+    """
+    Scripted read() for run_cli(). Every entry is a function of the
+    prompt returning the answer line.
+    """
+    def __init__(self, *moves):
+        self.moves = list(moves)
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if not self.moves:
+            raise EOFError
+        return self.moves.pop(0)(prompt)
+
+
+def solve(prompt):
+    numbers = prompt.rstrip("= ").split(" + ")
+    return str(sum(int(i) for i in numbers))
+
+
+def test_plays_until_quit(settings):
+    settings['time_limit'] = 0
+    output = []
+    player = Player(solve, lambda prompt: "", lambda prompt: "x", solve,
+                    lambda prompt: "q")
+    game = MAT.run_cli(settings, read=player, write=output.append)
+
+    assert (game.answers_correct, game.answers_all) == (2, 3)
+    assert "Input can only be an integer or empty" in output
+    assert sum(i.startswith("Wrong, the answer was") for i in output) == 1
+    assert output[-1] == game.summary
+    assert all(i.endswith(" = ") for i in player.prompts)
+
+
+def test_end_of_input_ends_the_game(settings):
+    output = []
+    game = MAT.run_cli(settings, read=Player(), write=output.append)
+
+    assert game.answers_all == 0
+    assert output == ["Empty answer skips, q quits."]
+
+
+def test_timed_prompt_shows_the_time_left(settings):
+    settings['time_limit'] = 60
+    player = Player(lambda prompt: "q")
+    MAT.run_cli(settings, read=player, write=lambda text: None)
+
+    assert player.prompts[0].startswith("[")
+
+
+def test_import_does_not_load_tkinter():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, MAT; print('tkinter' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=root,
+                            capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "False"
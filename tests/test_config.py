@@ -0,0 +1,87 @@
+import pytest
+
+import MAT
+
+
+@pytest.fixture
+def errors(monkeypatch):
+    """
+    Error popups shown, as (title, message).
+    """
+    shown = []
+    monkeypatch.setattr(MAT, 'showerror',
+                        lambda title, message: shown.append((title, message)))
+    return shown
+
+
+def test_save_and_load_profiles(tmp_path, settings):
+    config = MAT.ConfigStore(str(tmp_path / "MAT.cfg"))
+    config.save("alice", dict(settings, operator='·'))
+    config.save("bob", settings)
+
+    assert MAT.ConfigStore(str(tmp_path / "MAT.cfg")).load("alice") == \
+        dict(settings, operator='·')
+    assert MAT.read_cfg("bob", config) == settings
+
+
+def test_faulty_file_is_reset(tmp_path, errors):
+    path = tmp_path / "MAT.cfg"
+    path.write_text("not a config")
+    config = MAT.ConfigStore(str(path))
+
+    assert MAT.read_cfg("alice", config) == MAT.defaults
+    assert len(errors) == 1
+    assert MAT.ConfigStore(str(path)).load("alice") == MAT.defaults
+
+
+@pytest.mark.parametrize("contents", [None, "not a config"])
+def test_unwritable_file_runs_with_defaults(tmp_path, monkeypatch, errors,
+                                            contents):
+    path = tmp_path / "MAT.cfg"
+    if contents is not None:
+        path.write_text(contents)
+    config = MAT.ConfigStore(str(path))
+
+    def reset(profile):
+        raise PermissionError("read-only")
+
+    monkeypatch.setattr(config, 'reset', reset)
+    assert MAT.read_cfg("alice", config) == MAT.defaults
+    assert len(errors) == 1
+
+
+def test_faulty_profile_leaves_the_others_alone(tmp_path, errors):
+    path = tmp_path / "MAT.cfg"
+    path.write_text("[alice]\nnumbercount;3\n[bob]\nnumbercount;x\n"
+                    "operator;-\n")
+    config = MAT.ConfigStore(str(path))
+
+    assert config.load("alice")['numbercount'] == 3
+    assert config.profile_names() == ["alice", "bob"]
+
+    assert MAT.read_cfg("bob", config) == MAT.defaults
+    assert len(errors) == 1
+    reread = MAT.ConfigStore(str(path))
+    assert reread.load("alice") == dict(MAT.defaults, numbercount=3)
+    assert reread.load("bob") == MAT.defaults
+
+
+def test_saving_keeps_a_faulty_profile_s_good_values(tmp_path, settings):
+    path = tmp_path / "MAT.cfg"
+    path.write_text("[bob]\nnumbercount;x\noperator;-\n")
+    config = MAT.ConfigStore(str(path))
+    config.save("alice", settings)
+
+    reread = MAT.ConfigStore(str(path))
+    assert reread.load("bob") == dict(MAT.defaults, operator='-')
+    assert reread.load("alice") == settings
+
+
+def test_old_settings_are_completed_from_defaults():
+    old = {'numbercount': "3", 'range_lower': "0", 'range_upper': "10",
+           'operator': '-', 'time_limit': "60"}
+    errors, settings = MAT.settings_errors(old)
+
+    assert not errors
+    assert settings == dict(MAT.defaults, numbercount=3, range_upper=10,
+                            operator='-', time_limit=60)
@@ -0,0 +1,112 @@
+from collections import Counter
+from itertools import product
+
+import numpy as np
+import pytest
+
+import MAT
+
+
+CASES = [
+    # numbercount, operator, range, nonnegative, max_result, no_carry
+    (2, '-', (0, 12), 1, 0, 0),
+    (2, '+', (0, 30), 0, 0, 1),
+    (2, '·', (-6, 9), 0, 20, 0),
+    (3, '-', (0, 9), 1, 0, 0),
+    (3, '+', (0, 15), 0, 20, 0),
+    (3, '-', (0, 25), 1, 0, 1),
+    (3, '·', (-3, 6), 1, 30, 0),
+]
+
+
+def meets(chain, op, nonnegative, max_result, no_carry):
+    """
+    Brute force version of the constraints, left to right.
+    """
+    acc = chain[0]
+    for number in chain[1:]:
+        if no_carry:
+            left, right = acc, number
+            while left or right:
+                if op == '+' and left % 10 + right % 10 >= 10:
+                    return False
+                if op == '-' and left % 10 < right % 10:
+                    return False
+                left, right = left // 10, right // 10
+
+        acc = MAT.get_answer([acc, number], op)
+        if nonnegative and acc < 0 or max_result and acc > max_result:
+            return False
+
+    return True
+
+
+def valid_chains(case):
+    numcount, op, (low, high), nonnegative, max_result, no_carry = case
+    return [chain for chain in product(range(low, high + 1),
+                                       repeat=numcount)
+            if meets(chain, op, nonnegative, max_result, no_carry)]
+
+
+def space(case, distinct=0):
+    numcount, op, (low, high), nonnegative, max_result, no_carry = case
+    return MAT.ConstraintSpace(low, high, numcount, op, nonnegative,
+                               max_result, no_carry, distinct)
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_count_matches_brute_force(case):
+    assert space(case).count == len(valid_chains(case))
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_draws_are_valid_and_uniform(case):
+    chains = valid_chains(case)
+    draws = 200 * len(chains)
+    counts = Counter(map(tuple, space(case).draw(
+        np.random.default_rng(9), draws).tolist()))
+
+    assert set(counts) <= set(chains)
+    # Chi-square against uniform, bound far in the tail (about 6 sd).
+    expected = draws / len(chains)
+    chi2 = sum((counts[i] - expected) ** 2 / expected for i in chains)
+    dof = len(chains) - 1
+    assert chi2 < dof + 6 * (2 * dof) ** 0.5
+
+
+def test_distinct_pairs_have_no_repeats():
+    case = (2, '+', (0, 9), 0, 12, 0)
+    pairs = [i for i in valid_chains(case) if i[0] != i[1]]
+    distinct = space(case, distinct=1)
+
+    assert distinct.count == len(pairs)
+    drawn = distinct.draw(np.random.default_rng(1), 5000)
+    assert all(a != b for a, b in drawn.tolist())
+
+
+def test_distinct_chains_without_other_constraints():
+    case = (4, '·', (1, 6), 0, 0, 0)
+    drawn = space(case, distinct=1).draw(np.random.default_rng(2), 3000)
+
+    assert space(case, distinct=1).count == 6 * 5 * 4 * 3
+    assert all(len(set(row)) == 4 for row in drawn.tolist())
+    assert drawn.min() >= 1 and drawn.max() <= 6
+
+
+def test_generator_answers_meet_the_constraints(settings):
+    settings.update(operator='-', numbercount=3, range_upper=50,
+                    nonnegative=1, no_carry=1)
+    errors, settings = MAT.settings_errors(settings)
+    assert not errors
+
+    operands, answers = MAT.ProblemGenerator(settings, seed=3).generate(500)
+    for row, answer in zip(operands.tolist(), answers.tolist()):
+        assert meets(row, '-', 1, 0, 1)
+        assert answer == MAT.get_answer(row, '-') >= 0
+
+
+def test_impossible_constraints_are_reported(settings):
+    settings.update(operator='+', range_lower=5, range_upper=9,
+                    max_result=3)
+    errors, _ = MAT.settings_errors(settings)
+    assert errors == ["Constraints: no problems match these settings."]
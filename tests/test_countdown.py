@@ -0,0 +1,100 @@
+import pytest
+
+import MAT
+
+
+class FakeTk:
+    """
+    after()/after_cancel() and a clock that only move when told to.
+    """
+    def __init__(self):
+        self.now = 100.0
+        self.pending = {}
+        self.handles = 0
+
+    def clock(self):
+        return self.now
+
+    def after(self, ms, func):
+        self.handles += 1
+        self.pending[self.handles] = (ms, func)
+        return self.handles
+
+    def after_cancel(self, handle):
+        del self.pending[handle]
+
+    def run(self, late=0.0):
+        """
+        Runs the pending callback, late seconds after it was due.
+        """
+        (handle, (ms, func)), = self.pending.items()
+        del self.pending[handle]
+        self.now += ms / 1000 + late
+        func()
+
+
+@pytest.fixture
+def timer():
+    tk = FakeTk()
+    ticks = []
+    expired = []
+    countdown = MAT.Countdown(tk.after, tk.after_cancel, ticks.append,
+                              lambda: expired.append(tk.now), 100, tk.clock)
+    return tk, countdown, ticks, expired
+
+
+def test_expires_at_the_deadline(timer):
+    tk, countdown, ticks, expired = timer
+    countdown.start(1)
+
+    assert countdown.running
+    while tk.pending:
+        tk.run()
+
+    assert expired == [pytest.approx(101.0, abs=0.002)]
+    assert ticks[0] == 1 and ticks[-1] == 0.0
+    assert len(ticks) == 11
+    assert not countdown.running and countdown.remaining == 0
+
+
+def test_late_ticks_do_not_drift(timer):
+    tk, countdown, ticks, expired = timer
+    countdown.start(1)
+
+    while tk.pending:
+        tk.run(late=0.03)
+
+    # Every tick is late, the deadline still holds to one tick.
+    assert len(expired) == 1
+    assert 101.0 <= expired[0] <= 101.0 + 0.1 + 0.03
+    assert all(a > b for a, b in zip(ticks, ticks[1:]))
+
+
+def test_cancel_drops_the_pending_tick(timer):
+    tk, countdown, ticks, expired = timer
+    countdown.start(5)
+    tk.run()
+    assert countdown.remaining == pytest.approx(4.9)
+
+    countdown.cancel()
+    assert not tk.pending and not countdown.running
+    assert expired == []
+
+
+def test_restart_replaces_the_deadline(timer):
+    tk, countdown, ticks, expired = timer
+    countdown.start(5)
+    countdown.start(2)
+
+    assert len(tk.pending) == 1
+    assert countdown.remaining == pytest.approx(2)
+
+
+def test_last_sliver_is_not_overshot(timer):
+    tk, countdown, ticks, expired = timer
+    countdown.start(0.2005)
+
+    while tk.pending:
+        tk.run()
+
+    assert expired == [pytest.approx(100.2005, abs=0.001)]
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+
+import MAT
+
+
+@pytest.fixture
+def small_table(tmp_path, monkeypatch):
+    """
+    A table for numbers up to 30 in tmp_path, quick to build.
+    """
+    monkeypatch.setattr(MAT, 'RANGE_LIMIT', 30)
+    path = str(tmp_path / "difficulty.bin")
+    load = MAT.difficulty_table.__wrapped__
+    MAT.difficulty_band.cache_clear()
+    monkeypatch.setattr(MAT, 'difficulty_table', lambda: load(path))
+    yield path
+    MAT.difficulty_band.cache_clear()
+
+
+@pytest.mark.parametrize("op", MAT.OPERATORS)
+def test_small_ranges_match_the_table(small_table, monkeypatch, op):
+    direct = [MAT.difficulty_band(-7, 12, op, band)
+              for band in range(1, MAT.DIFFICULTY_BANDS + 1)]
+    assert not os.path.exists(small_table)
+
+    MAT.difficulty_band.cache_clear()
+    monkeypatch.setattr(MAT, 'DIFFICULTY_DIRECT', 0)
+    for band, positions in enumerate(direct, 1):
+        assert np.array_equal(MAT.difficulty_band(-7, 12, op, band),
+                              positions)
+    assert os.path.exists(small_table)
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(MAT, 'RANGE_LIMIT', 30)
+
+    def replace(source, destination):
+        raise OSError("read-only")
+
+    monkeypatch.setattr(os, 'replace', replace)
+    path = str(tmp_path / "difficulty.bin")
+    table = MAT.difficulty_table.__wrapped__(path)
+
+    assert table.shape == (len(MAT.OPERATORS), 61, 61)
+    assert not table.flags.writeable
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,66 @@
+from collections import Counter
+from itertools import product
+from random import Random
+
+import pytest
+
+import MAT
+
+
+def exact_chains(low, high, numcount):
+    """
+    Brute force: chains with a nonzero dividend that divide evenly.
+    """
+    chains = []
+    for chain in product(range(low, high + 1), repeat=numcount):
+        value = chain[0]
+        if value == 0 or 0 in chain[1:]:
+            continue
+        for divisor in chain[1:]:
+            if value % divisor:
+                break
+            value //= divisor
+        else:
+            chains.append(chain)
+    return chains
+
+
+@pytest.mark.parametrize('low, high, numcount', [
+    (1, 30, 2), (-12, 18, 2), (-8, 24, 3), (1, 24, 4)])
+def test_count_matches_brute_force(low, high, numcount):
+    index = MAT.DivisionIndex(low, high, numcount)
+    assert index.count == len(exact_chains(low, high, numcount))
+
+
+def test_pairs_are_all_exact_pairs():
+    index = MAT.DivisionIndex(-12, 18, 2)
+    assert sorted(index.pairs()) == sorted(exact_chains(-12, 18, 2))
+
+
+def test_draws_divide_evenly_and_are_uniform():
+    chains = exact_chains(-8, 24, 3)
+    rng = Random(4)
+    draws = 100 * len(chains)
+    index = MAT.DivisionIndex(-8, 24, 3)
+    drawn = index.draw([[rng.random() for _ in range(3)]
+                        for _ in range(draws)])
+    counts = Counter(map(tuple, drawn))
+
+    assert set(counts) <= set(chains)
+    expected = draws / len(chains)
+    chi2 = sum((counts[i] - expected) ** 2 / expected for i in chains)
+    dof = len(chains) - 1
+    assert chi2 < dof + 6 * (2 * dof) ** 0.5
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_generator_answers_are_exact(settings, vectorized):
+    settings.update(operator='÷', numbercount=3, range_lower=-20,
+                    range_upper=60)
+    operands, answers = MAT.ProblemGenerator(
+        settings, seed=8, vectorized=vectorized).generate(1000)
+
+    for row, answer in zip(operands, answers):
+        a, b, c = (int(i) for i in row)
+        assert a != 0 and a % b == 0 and (a // b) % c == 0
+        assert int(answer) == a // b // c
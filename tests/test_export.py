@@ -0,0 +1,30 @@
+import concurrent.futures
+
+import pytest
+
+import MAT
+
+
+@pytest.mark.parametrize("count", [0, -1])
+def test_count_must_be_positive(tmp_path, settings, count):
+    path = tmp_path / "sheet.csv"
+    with pytest.raises(ValueError):
+        MAT.export_worksheet(settings, str(path), count, seed=1)
+    assert not path.exists()
+
+
+def test_one_chunk_needs_no_pool(settings, monkeypatch):
+    def pool(*args):
+        raise AssertionError("process pool started")
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', pool)
+    rows = list(MAT.export_rows(settings, 100, seed=1, workers=8))
+    assert len(rows) == 100
+
+
+def test_same_seed_same_sheet_with_any_workers(settings):
+    count = MAT.EXPORT_CHUNK + 5
+    one = list(MAT.export_rows(settings, count, seed=3, workers=1))
+    two = list(MAT.export_rows(settings, count, seed=3, workers=2))
+    assert len(one) == count
+    assert one == two
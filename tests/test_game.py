@@ -0,0 +1,51 @@
+import pytest
+
+import MAT
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_check_answers(settings):
+    game = MAT.GameState(settings)
+    answer = game.answer
+
+    assert game.check(str(answer))
+    assert game.check(" %d " % answer)
+    assert not game.check(str(answer + 1))
+    assert not game.check("")
+    with pytest.raises(ValueError):
+        game.check("abc")
+
+
+def test_submit_counts_and_moves_on(settings):
+    game = MAT.GameState(settings, generator=MAT.ProblemGenerator(
+        settings, seed=4))
+    assert game.score == "" and game.summary == ""
+
+    assert game.submit(str(game.answer))
+    assert not game.submit("")
+    assert not game.submit(str(game.answer + 1))
+
+    assert (game.answers_correct, game.answers_all) == (1, 3)
+    assert game.score == "1 / 3"
+    assert game.summary.startswith("1 / 3\n")
+    assert game.answer == MAT.get_answer(list(game.operands), '+')
+
+
+def test_latency_from_the_clock(settings):
+    clock = FakeClock()
+    game = MAT.GameState(settings, clock=clock)
+
+    clock.now = 2.5
+    game.submit("")
+    clock.now = 3.0
+    game.submit("")
+
+    assert game.latency.count == 2
+    assert game.latency.mean == pytest.approx(1.5)
@@ -0,0 +1,44 @@
+import pytest
+
+import MAT
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+@pytest.mark.parametrize('op', ['+', '-', '·'])
+def test_batch_in_range_with_right_answers(settings, op, vectorized):
+    settings.update(operator=op, numbercount=3, range_lower=-5,
+                    range_upper=9)
+    operands, answers = MAT.ProblemGenerator(
+        settings, seed=1, vectorized=vectorized).generate(200)
+
+    assert len(operands) == len(answers) == 200
+    for row, answer in zip(operands, answers):
+        row = [int(i) for i in row]
+        assert len(row) == 3
+        assert all(-5 <= i <= 9 for i in row)
+        assert int(answer) == MAT.get_answer(row, op)
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_same_seed_same_problems(settings, vectorized):
+    def batch(seed):
+        operands, answers = MAT.ProblemGenerator(
+            settings, seed=seed, vectorized=vectorized).generate(50)
+        return [[int(i) for i in row] for row in operands], \
+            [int(i) for i in answers]
+
+    assert batch(7) == batch(7)
+    assert batch(7) != batch(8)
+
+
+def test_missing_settings_come_from_defaults():
+    generator = MAT.ProblemGenerator({'operator': '-'})
+    assert generator.settings['range_upper'] == \
+        MAT.defaults['range_upper']
+    assert generator.settings['operator'] == '-'
+
+
+def test_invalid_settings_are_rejected(settings):
+    settings.update(range_lower=10, range_upper=0)
+    with pytest.raises(ValueError):
+        MAT.ProblemGenerator(settings)
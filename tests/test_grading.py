@@ -0,0 +1,125 @@
+import concurrent.futures
+import json
+
+import pytest
+
+import MAT
+
+
+def grade(tmp_path, lines, name="sheet.csv"):
+    """
+    :return: summary and verdict rows of a graded submission.
+    """
+    path = tmp_path / name
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    output = str(tmp_path / ("graded" + path.suffix))
+    summary = MAT.grade_submissions(str(path), output)
+    with open(output, encoding='utf-8') as graded:
+        if path.suffix == ".jsonl":
+            rows = [json.loads(line) for line in graded]
+        else:
+            import csv
+            rows = list(csv.DictReader(graded))
+    return summary, rows
+
+
+def test_verdicts(tmp_path):
+    summary, rows = grade(tmp_path, [
+        "operands,operator,answer",
+        "12 7,+,19",
+        "12 7,-,4",
+        "3 4 5,+ ·,23",
+        "3 4 5,+ *,",
+        "8 2,÷,abc",
+        "9 3,/, 3 ",
+    ])
+    assert [row['verdict'] for row in rows] == [
+        'correct', 'wrong', 'correct', 'skipped', 'invalid', 'correct']
+    assert [row['expected'] for row in rows] == [
+        '19', '5', '23', '23', '4', '3']
+    assert summary == {'rows': 6, 'correct': 3, 'wrong': 1, 'skipped': 1,
+                       'invalid': 1, 'error': 0}
+
+
+@pytest.mark.parametrize("operands, operator", [
+    ("7 2", "÷"),  # Would be 3 with floor division.
+    ("-7 2", "÷"),  # Would be -4.
+    ("24 4 4", "÷"),  # 24 ÷ 4 is even, 6 ÷ 4 isn't.
+    ("8 0", "÷"),
+    ("1 2 3 4 5 6", "+"),
+    ("2000 1", "+"),
+    ("1 2", "x"),
+    ("1 2 3", "+ ÷"),
+])
+def test_problems_the_trainer_never_asks_are_errors(tmp_path, operands,
+                                                      operator):
+    summary, rows = grade(tmp_path, ["operands,operator,answer",
+                                     "%s,%s,3" % (operands, operator)])
+    assert rows[0]['verdict'] == 'error'
+    assert rows[0]['message']
+    assert summary['error'] == 1
+
+
+def test_jsonl_values_are_not_rounded(tmp_path):
+    _, rows = grade(tmp_path, [
+        '{"operands": [12, 7], "operator": "·", "answer": 84}',
+        '{"operands": [2.5, 7], "operator": "+", "answer": 9}',
+        '{"operands": [1, true], "operator": "+", "answer": 2}',
+        '{"operands": [1, 1], "operator": "+", "answer": 2.0}',
+        '{"operands": [3, 4, 5], "operator": ["-", "·"], "answer": "-17"}',
+        'not json',
+    ], name="sheet.jsonl")
+    assert [row['verdict'] for row in rows] == [
+        'correct', 'error', 'error', 'invalid', 'correct', 'error']
+
+
+def test_chunks_and_numpy_fallback_agree(tmp_path, monkeypatch):
+    lines = ["operands,operator,answer"]
+    for i in range(3 * MAT.GRADE_CHUNK // 2):
+        lines.append("%d %d %d,%s,%d" % (i % 97, i % 13 + 1, i % 7,
+                                         "+-·"[i % 3] if i % 4 else "+ ·",
+                                         i % 50))
+    expected = grade(tmp_path, lines)
+
+    monkeypatch.setattr(MAT, 'HAVE_NUMPY', False)
+    assert grade(tmp_path, lines) == expected
+
+
+def test_one_chunk_needs_no_pool(tmp_path, monkeypatch):
+    def pool(*args):
+        raise AssertionError("process pool started")
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', pool)
+    path = tmp_path / "sheet.csv"
+    path.write_text("operands,operator,answer\n1 2,+,3\n2 2,·,5\n",
+                    encoding='utf-8')
+    summary = MAT.grade_submissions(str(path), str(tmp_path / "out.csv"),
+                                    workers=8)
+    assert summary['rows'] == 2 and summary['correct'] == 1
+
+
+def test_pool_grades_like_one_process(tmp_path):
+    # Two chunks, every other answer is wrong.
+    lines = ["operands,operator,answer"]
+    for i in range(MAT.GRADE_CHUNK + 4):
+        lines.append("%d %d,+,%d" % (i % 500, 7, i % 500 + 7 + i % 2))
+    submission = tmp_path / "sheet.csv"
+    submission.write_text("\n".join(lines) + "\n", encoding='utf-8')
+
+    outputs = []
+    for workers in (1, 2):
+        output = tmp_path / ("graded%d.csv" % workers)
+        summary = MAT.grade_submissions(str(submission), str(output),
+                                        workers=workers)
+        outputs.append((summary, output.read_text(encoding='utf-8')))
+
+    assert outputs[0] == outputs[1]
+    assert outputs[0][0]['correct'] == MAT.GRADE_CHUNK // 2 + 2
+
+
+def test_output_is_not_the_submission(tmp_path):
+    path = tmp_path / "sheet.csv"
+    path.write_text("operands,operator,answer\n1 2,+,3\n", encoding='utf-8')
+    with pytest.raises(ValueError):
+        MAT.grade_submissions(str(path), str(path))
+    assert path.read_text(encoding='utf-8').endswith("1 2,+,3\n")
@@ -0,0 +1,61 @@
+import sqlite3
+
+import MAT
+
+
+def test_concurrent_games_keep_their_sessions(tmp_path, settings):
+    path = str(tmp_path / "history.db")
+    store = MAT.HistoryStore(path)
+    first = MAT.GameState(settings, log=store)
+    second = MAT.GameState(settings, log=store)
+
+    # Interleaved like two server connections.
+    for _ in range(3):
+        first.submit("")
+        second.submit("")
+    second.submit("")
+    store.close()
+
+    db = sqlite3.connect(path)
+    sessions = [row[0] for row in db.execute("SELECT id FROM sessions")]
+    counts = dict(db.execute(
+        "SELECT session, COUNT(*) FROM attempts GROUP BY session"))
+    db.close()
+
+    assert len(sessions) == 2
+    assert sorted(counts.values()) == [3, 4]
+    assert set(counts) == set(sessions)
+
+
+def test_session_log_has_no_sessions(tmp_path, settings):
+    log = MAT.SessionLog(str(tmp_path / "MAT.log"))
+    assert log.start_session(settings) is None
+    log.close()
+
+
+def test_analytics_queries(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = MAT.HistoryStore(path, slots=3)
+    now = 1_700_000_000.0
+    attempts = [((7, 8), '·', 56, "56", True, 4.0)] * 3 + \
+        [((2, 3), '·', 6, "6", True, 1.0)] * 3 + \
+        [((9, 9), '·', 81, "80", False, 9.0)] * 2 + \
+        [((1, 2, 3), ('+', '·'), 7, "", False, 2.0)]
+    for attempt in attempts:
+        store.append(*attempt, timestamp=now)
+    store.append((5, 5), '+', 10, "10", True, 1.0, timestamp=now - 1e6)
+    store.close()
+
+    columns, rows = MAT.query_history(path, 'slowest', operator='·', low=0,
+                                      high=10, since=now - 10)
+    assert columns[:4] == ['numbercount', 'n0', 'n1', 'n2']
+    # (9, 9) has too few attempts, (7, 8) is slower than (2, 3).
+    assert [row[1:3] for row in rows] == [(7, 8), (2, 3)]
+    assert rows[0][-2:] == (4.0, 1.0)
+
+    columns, rows = MAT.query_history(path, 'throughput', since=now - 10)
+    assert columns == ['operator', 'attempts', 'per_minute', 'accuracy']
+    assert rows[0][:2] == ('·', 8) and rows[1][:2] == ('+·', 1)
+
+    columns, rows = MAT.query_history(path, 'accuracy', since=0)
+    assert sum(row[1] for row in rows) == 10
@@ -0,0 +1,88 @@
+import time
+
+import MAT
+
+
+class Target:
+    def fast(self, x):
+        return x + 1
+
+    def slow(self):
+        time.sleep(0.002)
+
+    def unused(self):
+        pass
+
+
+def test_install_times_calls_and_uninstall_restores():
+    originals = dict(Target.__dict__)
+    instrumentation = MAT.Instrumentation(
+        [(Target, 'fast'), (Target, 'slow'), (Target, 'unused')])
+    target = Target()  # Made before install(), still covered.
+
+    instrumentation.install()
+    assert Target.fast is not originals['fast']
+    assert Target.fast.__name__ == 'fast'
+    assert [target.fast(i) for i in range(5)] == [1, 2, 3, 4, 5]
+    target.slow()
+    instrumentation.uninstall()
+
+    assert all(Target.__dict__[i] is originals[i]
+               for i in ('fast', 'slow', 'unused'))
+    target.fast(0)  # Not counted any more.
+
+    stats = instrumentation.stats
+    assert stats['Target.fast'].count == 5
+    assert stats['Target.slow'].count == 1
+    assert stats['Target.slow'].mean >= 0.002
+    assert stats['Target.unused'].count == 0
+
+
+def test_report_lists_called_functions_slowest_first():
+    instrumentation = MAT.Instrumentation([(Target, 'fast'),
+                                           (Target, 'slow'),
+                                           (Target, 'unused')])
+    instrumentation.install()
+    Target().fast(1)
+    Target().slow()
+    instrumentation.uninstall()
+
+    lines = instrumentation.report().splitlines()
+    assert lines[0].startswith("function")
+    assert [line.split()[0] for line in lines[1:]] == ['Target.slow',
+                                                        'Target.fast']
+
+
+def test_exceptions_are_timed_and_passed_on():
+    class Failing:
+        def call(self):
+            raise KeyError('x')
+
+    instrumentation = MAT.Instrumentation([(Failing, 'call')])
+    instrumentation.install()
+    try:
+        Failing().call()
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("KeyError was swallowed")
+    finally:
+        instrumentation.uninstall()
+
+    assert instrumentation.stats['Failing.call'].count == 1
+
+
+def test_default_targets(tmp_path, settings):
+    instrumentation = MAT.Instrumentation()
+    instrumentation.install()
+    try:
+        store = MAT.ConfigStore(str(tmp_path / "MAT.cfg"))
+        store.save(MAT.LEGACY_PROFILE, settings)
+        store.load(MAT.LEGACY_PROFILE)
+    finally:
+        instrumentation.uninstall()
+
+    stats = instrumentation.stats
+    assert set(stats) == set(MAT.INSTRUMENTED)
+    assert stats['ConfigStore.save'].count == 1
+    assert stats['ConfigStore.load'].count == 1
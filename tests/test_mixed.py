@@ -0,0 +1,59 @@
+from collections import Counter
+
+import pytest
+
+import MAT
+
+
+def evaluate(operands, operators):
+    """
+    Reference: Python evaluating the problem text.
+    """
+    text = MAT.format_problem(operands, operators)
+    return eval(text.replace('·', '*'))
+
+
+@pytest.mark.parametrize('operators, numbers, answer', [
+    (('+', '·'), (2, 3, 4), 14),
+    (('·', '+'), (2, 3, 4), 10),
+    (('-', '-'), (10, 3, 2), 5),
+    (('-', '·', '+'), (10, 2, 3, 1), 5),
+    (('·', '·', '-', '·'), (2, 3, 4, 5, 6), -6),
+])
+def test_usual_precedence(operators, numbers, answer):
+    assert MAT.compile_expression(operators)(*numbers) == answer
+    assert MAT.get_answer(list(numbers), operators) == answer
+
+
+def test_evaluators_are_cached():
+    assert MAT.compile_expression(('+', '-')) is \
+        MAT.compile_expression(('+', '-'))
+
+
+def test_division_cannot_be_mixed():
+    with pytest.raises(ValueError):
+        MAT.compile_expression(('+', '÷'))
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_generated_answers(settings, vectorized):
+    settings.update(mixed=1, numbercount=4, range_lower=-9, range_upper=30)
+    operands, answers, operators = MAT.MixedGenerator(
+        settings, seed=6, vectorized=vectorized).generate(3000)
+
+    layouts = Counter(operators)
+    assert len(layouts) == 3 ** 3
+    for row, answer, ops in zip(operands, answers, operators):
+        row = [int(i) for i in row]
+        assert int(answer) == evaluate(row, ops)
+
+
+def test_same_seed_same_problems(settings):
+    settings.update(mixed=1, numbercount=3)
+
+    def batch():
+        operands, answers, operators = MAT.MixedGenerator(
+            settings, seed=3).generate(20)
+        return operands.tolist(), answers.tolist(), operators
+
+    assert batch() == batch()
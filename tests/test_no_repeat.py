@@ -0,0 +1,68 @@
+from random import Random
+
+import MAT
+
+
+def test_small_space_is_exact(settings):
+    settings.update(range_lower=-3, range_upper=3)
+    seen = MAT.SeenProblems(settings)
+
+    assert seen.exact
+    assert seen.add((1, -3), '+')
+    assert not seen.add((1, -3), '+')
+    assert seen.add((-3, 1), '+')
+    assert len(seen) == 2
+
+    seen.clear()
+    assert len(seen) == 0 and seen.add((1, -3), '+')
+
+
+def test_space_starts_over_when_used_up(settings):
+    settings.update(range_lower=0, range_upper=1)
+    seen = MAT.SeenProblems(settings)
+
+    for problem in [(0, 0), (0, 1), (1, 0)]:
+        assert seen.add(problem, '+')
+    assert len(seen) == 3
+    assert seen.add((1, 1), '+')
+    assert len(seen) == 0
+
+
+def test_mixed_operators_are_part_of_the_problem(settings):
+    settings.update(mixed=1, numbercount=3, range_upper=5)
+    seen = MAT.SeenProblems(settings)
+
+    assert seen.add((1, 2, 3), ('+', '·'))
+    assert seen.add((1, 2, 3), ('·', '+'))
+    assert not seen.add((1, 2, 3), ('+', '·'))
+
+
+def test_bloom_filter_has_no_false_negatives(settings):
+    settings.update(numbercount=5, range_lower=0, range_upper=1000)
+    seen = MAT.SeenProblems(settings)
+    assert not seen.exact
+
+    rng = Random(5)
+    problems = {tuple(rng.randint(0, 1000) for _ in range(5))
+                for _ in range(40000)}
+    shown, fresh = list(problems)[:20000], list(problems)[20000:]
+
+    new = [seen.add(i, '+') for i in shown]
+    # A false positive can only hide a new problem, not repeat one.
+    assert sum(new) > 0.999 * len(shown)
+    assert not any(seen.add(i, '+') for i in shown)
+    false_positives = sum(not seen.add(i, '+') for i in fresh)
+    assert false_positives < 0.001 * len(fresh)
+
+
+def test_game_shows_every_problem_once(settings):
+    settings.update(range_lower=0, range_upper=3, no_repeat=1)
+    game = MAT.GameState(settings, generator=MAT.ProblemGenerator(
+        settings, seed=2))
+
+    shown = []
+    for _ in range(16):
+        shown.append(game.operands)
+        game.submit("")
+
+    assert len(set(shown)) == 16
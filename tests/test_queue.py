@@ -0,0 +1,45 @@
+import MAT
+
+
+def test_pops_in_generation_order(settings):
+    queue = MAT.ProblemQueue(MAT.ProblemGenerator(settings, seed=5), 10, 3)
+    operands, answers = MAT.ProblemGenerator(settings, seed=5).generate(10)
+
+    for row, answer in zip(operands.tolist(), answers.tolist()):
+        assert queue.pop() == (tuple(row), answer, None)
+
+
+def test_refills_only_when_low(settings):
+    queue = MAT.ProblemQueue(MAT.ProblemGenerator(settings), 10, 3)
+    assert len(queue) == 10
+
+    for _ in range(7):
+        queue.pop()
+    queue.refill()
+    assert len(queue) == 3 and not queue.low
+
+    queue.pop()
+    assert queue.low
+    queue.refill()
+    assert len(queue) == 12
+
+
+def test_empty_queue_refills_on_pop(settings):
+    queue = MAT.ProblemQueue(MAT.ProblemGenerator(settings), 4, 0)
+    for _ in range(4):
+        queue.pop()
+    assert len(queue) == 0
+
+    operands, answer, operators = queue.pop()
+    assert len(queue) == 3
+    assert answer == sum(operands) and operators is None
+
+
+def test_mixed_problems_keep_their_operators(settings):
+    settings.update(mixed=1, numbercount=3)
+    queue = MAT.ProblemQueue(MAT.make_generator(settings, seed=2), 20, 5)
+
+    for _ in range(20):
+        operands, answer, operators = queue.pop()
+        assert isinstance(operators, tuple) and len(operators) == 2
+        assert answer == MAT.get_answer(list(operands), operators)
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import time
+
+import MAT
+
+
+async def connect(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+    async def request(message):
+        writer.write(json.dumps(message).encode('utf-8') + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    return request, writer
+
+
+def serve(test):
+    """
+    Runs test(server, port) against a server on a free port.
+    """
+    async def main():
+        server = MAT.DrillServer()
+        listener = await server.start('127.0.0.1', 0)
+        try:
+            await test(server, listener.sockets[0].getsockname()[1])
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+
+    asyncio.run(main())
+
+
+ADAPTIVE = {'cmd': 'start', 'settings': {'adaptive': 1, 'time_limit': 0}}
+
+
+def test_adaptive_games_are_capped():
+    async def test(server, port):
+        clients = [await connect(port)
+                   for _ in range(MAT.SERVER_ADAPTIVE_SESSIONS + 1)]
+        for request, _ in clients[:-1]:
+            assert 'operands' in await request(ADAPTIVE)
+
+        request, _ = clients[-1]
+        assert 'error' in await request(ADAPTIVE)
+
+        # Restarting holds on to the same slot, stopping frees it.
+        assert 'operands' in await clients[0][0](ADAPTIVE)
+        await clients[0][0]({'cmd': 'stop'})
+        assert 'operands' in await request(ADAPTIVE)
+
+        for _, writer in clients:
+            writer.close()
+
+    serve(test)
+
+
+def test_slow_builds_dont_stall_other_sessions(monkeypatch):
+    make_generator = MAT.make_generator
+
+    def slow(settings, *args):
+        time.sleep(0.5)
+        return make_generator(settings, *args)
+
+    monkeypatch.setattr(MAT, 'make_generator', slow)
+
+    async def test(server, port):
+        fast, fast_writer = await connect(port)
+        slow_client, slow_writer = await connect(port)
+        await fast({'cmd': 'start', 'settings': {'time_limit': 0}})
+
+        building = asyncio.ensure_future(slow_client(ADAPTIVE))
+        await asyncio.sleep(0.1)  # The build is running now.
+        start = time.perf_counter()
+        reply = await fast({'cmd': 'answer', 'answer': ""})
+        assert time.perf_counter() - start < 0.2
+        assert 'operands' in reply
+        assert not building.done()
+
+        assert 'operands' in await building
+        fast_writer.close()
+        slow_writer.close()
+
+    serve(test)
+
+
+def test_drill_protocol():
+    async def test(server, port):
+        request, writer = await connect(port)
+
+        assert 'error' in await request({'cmd': 'answer', 'answer': "1"})
+        assert 'error' in await request({'cmd': 'start',
+                                         'settings': {'colour': 1}})
+        assert 'error' in await request({'cmd': 'start',
+                                         'settings': {'range_upper': -5}})
+
+        reply = await request({'cmd': 'start', 'settings': {
+            'operator': '-', 'time_limit': 0}})
+        assert reply['operator'] == '-'
+        assert reply['problem'] == "%d - %d" % tuple(reply['operands'])
+
+        answer = reply['operands'][0] - reply['operands'][1]
+        reply = await request({'cmd': 'answer', 'answer': str(answer)})
+        assert reply['correct'] and reply['answer'] == answer
+        reply = await request({'cmd': 'answer', 'answer': ""})
+        assert not reply['correct'] and reply['score'] == "1 / 2"
+        assert 'error' in await request({'cmd': 'answer', 'answer': "x"})
+
+        reply = await request({'cmd': 'stop'})
+        assert reply['event'] == 'stopped' and reply['score'] == "1 / 2"
+        assert 'error' in await request({'cmd': 'dance'})
+        writer.close()
+
+    serve(test)
+
+
+def test_time_up_is_sent_by_the_server():
+    async def test(server, port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'{"cmd": "start", "settings": {"time_limit": 1}}\n')
+        assert 'operands' in json.loads(await reader.readline())
+
+        event = json.loads(await asyncio.wait_for(reader.readline(), 3))
+        assert event['event'] == 'time_up' and event['score'] == ""
+        writer.close()
+
+    serve(test)
@@ -0,0 +1,73 @@
+import pytest
+
+import MAT
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "MAT.log")
+    log = MAT.SessionLog(path, slots=3)
+    log.append((12, 7), '+', 19, "19", True, 1.5, timestamp=1000.0)
+    log.append((9, 3, 3), '÷', 1, "", False, 0.25, timestamp=1001.0)
+    log.append((2, 3, 4), ('+', '·'), 14, "15", False, 2.0,
+               timestamp=1002.0)
+    log.append((2 ** 40, 2 ** 40), '·', 2 ** 80, "1", False, 3.0,
+               timestamp=1003.0)
+    log.close()
+    return path
+
+
+def test_numpy_view_round_trip(log_path):
+    records = MAT.read_session_log(log_path)
+
+    assert len(records) == 4
+    assert records['timestamp'].tolist() == [1000.0, 1001.0, 1002.0, 1003.0]
+    assert records['latency'].tolist() == [1.5, 0.25, 2.0, 3.0]
+    assert records['operands'][1].tolist() == [9, 3, 3]
+    assert records['operands'][0].tolist() == [12, 7, 0]
+    assert records['numbercount'].tolist() == [2, 3, 3, 2]
+    assert records['operator'].tolist() == [b'+', b'/', b'm', b'*']
+    assert records['operators'][2].rstrip(b'\0') == b'+*'
+    assert records['flags'].tolist() == [
+        MAT.LOG_CORRECT, MAT.LOG_SKIPPED, 0, MAT.LOG_OVERFLOW]
+    assert records['answer'].tolist()[:3] == [19, 1, 14]
+    assert records['user_answer'].tolist()[:3] == [19, 0, 15]
+
+
+def test_stream_round_trip_and_resume(log_path):
+    streamed = list(MAT.iter_session_log(log_path))
+    assert len(streamed) == 4
+    assert streamed[0][0][:4] == (1000.0, 1.5, 19, 19)
+
+    # Resuming from an offset gives the rest.
+    offset = streamed[1][1]
+    rest = [values for values, _ in MAT.iter_session_log(log_path, offset)]
+    assert rest == [values for values, _ in streamed[2:]]
+
+
+def test_reopen_appends_with_the_file_layout(log_path):
+    log = MAT.SessionLog(log_path, slots=5)
+    log.append((1, 1), '-', 0, "0", True, 1.0)
+    log.close()
+
+    records = MAT.read_session_log(log_path)
+    assert records.dtype == MAT.log_dtype(3)
+    assert len(records) == 5
+
+
+def test_torn_record_is_left_out(log_path):
+    with open(log_path, 'ab') as logfile:
+        logfile.write(b'\1' * 10)
+
+    assert len(MAT.read_session_log(log_path)) == 4
+    assert len(list(MAT.iter_session_log(log_path))) == 4
+
+
+def test_foreign_file_is_rejected(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_bytes(b'not a log at all, just text')
+
+    with pytest.raises(ValueError):
+        MAT.SessionLog(str(path))
+    with pytest.raises(ValueError):
+        MAT.read_session_log(str(path))
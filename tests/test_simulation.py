@@ -0,0 +1,42 @@
+import pytest
+
+import MAT
+
+
+class RecordingBot:
+    """
+    Answers right after one second and remembers the problems.
+    """
+    def __init__(self):
+        self.problems = []
+
+    def answer(self, game):
+        self.problems.append((tuple(game.operands), game.operator))
+        return str(game.answer), 1.0
+
+
+@pytest.mark.parametrize("changes", [{}, {'adaptive': 1}, {'mixed': 1},
+                                     {'operator': '÷'}])
+def test_same_seed_same_problems(settings, changes):
+    settings = MAT.settings_errors(dict(settings, **changes))[1]
+    runs = []
+    for _ in range(2):
+        bot = RecordingBot()
+        report = MAT.simulate(settings, bot, 500, seed=7)
+        runs.append(bot.problems)
+        assert report['correct'] == 500
+
+    assert runs[0] == runs[1]
+
+
+def test_new_game_when_the_time_runs_out(settings):
+    settings = dict(settings, time_limit=10)
+    report = MAT.simulate(settings, RecordingBot(), 100, seed=1)
+    assert report['games'] == 10
+
+
+def test_trace_reports_retained_memory(settings):
+    report = MAT.simulate(settings, MAT.PerfectBot(), 1000, trace=True,
+                          seed=1)
+    assert 'retained_bytes_per_turn' in report
+    assert report['peak_bytes'] > 0
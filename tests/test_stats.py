@@ -0,0 +1,57 @@
+import statistics
+from random import Random
+
+import pytest
+
+import MAT
+
+
+def values(seed, count=5000):
+    rng = Random(seed)
+    return [rng.lognormvariate(0.5, 0.8) for _ in range(count)]
+
+
+@pytest.mark.parametrize("q", [0.0, 0.1, 0.5, 0.9, 0.99, 1.0])
+def test_quantiles_within_accuracy(q):
+    data = values(1)
+    sketch = MAT.QuantileSketch()
+    for value in data:
+        sketch.add(value)
+
+    exact = sorted(data)[round(q * (len(data) - 1))]
+    assert abs(sketch.quantile(q) - exact) <= MAT.SKETCH_ACCURACY * exact
+
+
+def test_merge_equals_one_sketch():
+    whole = MAT.QuantileSketch()
+    parts = [MAT.QuantileSketch() for _ in range(3)]
+    for index, value in enumerate(values(2)):
+        whole.add(value)
+        parts[index % 3].add(value)
+
+    merged = parts[0]
+    merged.merge(parts[1])
+    merged.merge(MAT.QuantileSketch.from_dict(parts[2].to_dict()))
+    assert merged.count == whole.count
+    assert merged.to_dict() == whole.to_dict()
+
+
+def test_merge_needs_the_same_accuracy():
+    fine = MAT.QuantileSketch(0.01)
+    coarse = MAT.QuantileSketch(0.05)
+    coarse.add(1.0)
+    with pytest.raises(ValueError):
+        fine.merge(coarse)
+    assert fine.count == 0
+
+
+def test_latency_stats_match_statistics():
+    data = values(3, 1000)
+    stats = MAT.LatencyStats()
+    for value in data:
+        stats.add(value)
+
+    assert stats.count == len(data)
+    assert stats.mean == pytest.approx(statistics.mean(data))
+    assert stats.stdev == pytest.approx(statistics.stdev(data))
+    assert stats.per_minute == pytest.approx(60 * len(data) / sum(data))
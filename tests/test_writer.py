@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+import MAT
+
+
+class Target:
+    def __init__(self):
+        self.batches = []
+        self.threads = set()
+
+    def write_batch(self, records):
+        self.threads.add(threading.current_thread().name)
+        self.batches.append(list(records))
+
+
+def test_records_are_batched_and_flushed_on_close():
+    target = Target()
+    writer = MAT.BackgroundWriter(batch_size=4, flush_interval=60)
+    for i in range(10):
+        writer.submit(target, i)
+    writer.close()
+
+    assert sum(target.batches, []) == list(range(10))
+    assert [len(i) for i in target.batches] == [4, 4, 2]
+    assert target.threads == {"MAT writer"}
+
+
+def test_calls_run_after_earlier_records():
+    target = Target()
+    order = []
+    writer = MAT.BackgroundWriter(batch_size=100, flush_interval=60)
+    writer.submit(target, 'a')
+    writer.call(lambda: order.append(sum(target.batches, [])))
+    writer.submit(target, 'b')
+    writer.flush()
+
+    assert order == [['a']]
+    assert sum(target.batches, []) == ['a', 'b']
+    writer.close()
+
+
+def test_old_records_are_written_after_the_interval():
+    target = Target()
+    writer = MAT.BackgroundWriter(batch_size=100, flush_interval=0.01)
+    writer.submit(target, 1)
+
+    for _ in range(200):
+        if target.batches:
+            break
+        time.sleep(0.01)
+
+    assert target.batches == [[1]]
+    writer.close()
+
+
+def test_errors_are_kept_and_the_thread_goes_on():
+    target = Target()
+    writer = MAT.BackgroundWriter()
+    writer.call(lambda: 1 / 0)
+    writer.submit(target, 'x')
+    writer.close()
+
+    assert [type(i) for i in writer.errors] == [ZeroDivisionError]
+    assert target.batches == [['x']]
+
+
+def test_closed_writer_refuses_jobs():
+    writer = MAT.BackgroundWriter()
+    writer.close()
+    writer.close()
+
+    with pytest.raises(RuntimeError):
+        writer.submit(Target(), 1)